@@ -1,6 +1,9 @@
 from abc import ABC, abstractmethod
+from collections.abc import Iterator
 
-from mypy.checker import TypeVar, Generic
+from typing import TypeVar, Generic
+
+import numpy as np
 
 
 class IdGenerator(ABC):
@@ -58,6 +61,8 @@ class TimeGenerator(ABC):
 Point2d = tuple[float, float]
 Point3d = tuple[float, float, float]
 Point = TypeVar('Point', Point2d, Point3d)
+# A track id, an integer issued by an IntegerIdGenerator or a string such as a UUID
+TrackId = int | str
 
 T = TypeVar('T')
 
@@ -119,6 +124,10 @@ class DistanceCalculator2d(ABC):
     Methods:
         calculate: Abstract method to be implemented by subclasses for calculating
                    and returning the distance between two 2D points.
+        calculate_many: Calculates the distances from one 2D point to many 2D points.
+        compare: Returns a value that orders pairs of 2D points by distance, for comparisons only.
+        compare_threshold: Converts a distance threshold to the scale of `compare`.
+        within_threshold: Checks whether two 2D points are closer than a threshold.
     """
     @abstractmethod
     def calculate(self, p1: Point2d, p2: Point2d) -> float:
@@ -140,6 +149,132 @@ class DistanceCalculator2d(ABC):
         """
         pass
 
+    def calculate_many(self, p1: Point2d, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        """
+        Calculate the distance from one point to many points in 2D space.
+
+        Parameters:
+            p1 (Point2d): The point to measure from.
+            latitudes (np.ndarray): The latitudes of the points to measure to.
+            longitudes (np.ndarray): The longitudes of the points to measure to.
+
+        Returns:
+            np.ndarray: The distance from `p1` to each point, in order.
+
+        The default implementation calls `calculate` once per point. Subclasses should
+        override it with a vectorized calculation where one is available.
+        """
+        return np.array([self.calculate(p1, (lat, lon)) for lat, lon in zip(latitudes, longitudes)], dtype=float)
+
+    def compare(self, p1: Point2d, p2: Point2d) -> float:
+        """
+        Return a value that orders pairs of points the same way as their distance does.
+
+        Parameters:
+            p1 (Point2d): The first point in 2D space.
+            p2 (Point2d): The second point in 2D space.
+
+        Returns:
+            float: A value that increases with the distance between `p1` and `p2`. It is only meant to be
+                   compared with other results of `compare` and with `compare_threshold`.
+
+        The default implementation returns the distance itself. Subclasses can override it, together with
+        `compare_threshold`, with a cheaper monotonic quantity, such as a squared distance.
+        """
+        return self.calculate(p1, p2)
+
+    def compare_threshold(self, threshold: float) -> float:
+        """
+        Convert a distance threshold to the scale of `compare`.
+
+        Parameters:
+            threshold (float): The distance threshold.
+
+        Returns:
+            float: The value `compare` takes for two points exactly `threshold` apart.
+        """
+        return threshold
+
+    def within_threshold(self, p1: Point2d, p2: Point2d, threshold: float) -> bool:
+        """
+        Check whether two points are strictly closer than a threshold.
+
+        Parameters:
+            p1 (Point2d): The first point in 2D space.
+            p2 (Point2d): The second point in 2D space.
+            threshold (float): The distance threshold.
+
+        Returns:
+            bool: True if the distance between `p1` and `p2` is below `threshold`.
+        """
+        return self.compare(p1, p2) < self.compare_threshold(threshold)
+
+
+class SpatialIndex(ABC):
+    """
+    Abstract base class for a spatial index over keyed 2D points.
+
+    A spatial index answers the question "which stored keys could lie within the
+    threshold of this point?" without visiting every stored key. Implementations
+    may return false positives (candidates that turn out to be too far away), but
+    must never omit a key whose point lies within the threshold. Callers confirm
+    each candidate with an exact `DistanceCalculator2d`.
+
+    Methods:
+        insert: Abstract method for adding a key at a point.
+        remove: Abstract method for removing a key previously inserted at a point.
+        query: Abstract method for listing candidate keys near a point.
+        move: Moves a key from one point to another.
+    """
+    @abstractmethod
+    def insert(self, key: int, point: Point2d):
+        """
+        Add a key to the index at the given (latitude, longitude) point.
+
+        Parameters:
+            key (int): The key to store, typically the position of an object in its owning collection.
+            point (Point2d): The (latitude, longitude) location of the key.
+        """
+        pass
+
+    @abstractmethod
+    def remove(self, key: int, point: Point2d):
+        """
+        Remove a key that was inserted at the given point.
+
+        Parameters:
+            key (int): The key to remove.
+            point (Point2d): The point the key was inserted at.
+        """
+        pass
+
+    @abstractmethod
+    def query(self, point: Point2d, margin: float = 0.0) -> list[int]:
+        """
+        Return every key that may lie within the threshold of the given point.
+
+        Parameters:
+            point (Point2d): The (latitude, longitude) location to search around.
+            margin (float): A central angle in degrees to widen the search by, so that keys up to that much
+                            further than the threshold are returned as well. Defaults to 0.0.
+
+        Returns:
+            list[int]: Candidate keys. The list is a superset of the keys within the threshold.
+        """
+        pass
+
+    def move(self, key: int, old_point: Point2d, new_point: Point2d):
+        """
+        Move a key from one point to another.
+
+        Parameters:
+            key (int): The key to move.
+            old_point (Point2d): The point the key is currently stored at.
+            new_point (Point2d): The point to store the key at.
+        """
+        self.remove(key, old_point)
+        self.insert(key, new_point)
+
 
 class Tracker(ABC, Generic[T]):
     """
@@ -179,12 +314,12 @@ class Tracker(ABC, Generic[T]):
         pass
 
     @abstractmethod
-    def set_callsign(self, uid: str, callsign: str):
+    def set_callsign(self, uid: TrackId, callsign: str):
         """
         Assign a unique callsign to an object identified by a unique identifier (uid).
 
         Parameters:
-            uid (str): The unique identifier of the object to assign the callsign to.
+            uid (TrackId): The unique identifier of the object to assign the callsign to.
             callsign (str): The callsign to assign to the object.
 
         This method must be implemented by subclasses to specify how callsigns
@@ -193,12 +328,12 @@ class Tracker(ABC, Generic[T]):
         pass
 
     @abstractmethod
-    def get(self, uid: str) -> T | None:
+    def get(self, uid: TrackId) -> T | None:
         """
         Retrieve an object by its unique identifier (uid).
 
         Parameters:
-            uid (str): The unique identifier of the object to retrieve.
+            uid (TrackId): The unique identifier of the object to retrieve.
 
         Returns:
             T | None: The object identified by uid if it exists in the tracker,
@@ -227,7 +362,13 @@ class FusibleCollection(ABC, Generic[T]):
     Methods:
         fuse: Abstract method for fusing objects in the collection.
         get: Abstract method for retrieving an object by its unique identifier.
+        fuse_batch: Fuses a columnar batch of objects, for collections that support it.
         put: Abstract method for adding a new object to the collection.
+        remove: Abstract method for removing an object by its unique identifier.
+        insert: Abstract method for storing an object as it is, without fusing it.
+        pop_displaced: Returns the objects dropped by fusion to make room for others, for collections that do so.
+        __len__: Abstract method for counting the objects in the collection.
+        __iter__: Abstract method for iterating over the objects in the collection.
     """
     @abstractmethod
     def fuse(self, object_list: list[T]) -> tuple[list[tuple[T, T]], list[T]]:
@@ -249,22 +390,39 @@ class FusibleCollection(ABC, Generic[T]):
         pass
 
     @abstractmethod
-    def get(self, uid: str) -> T | None:
+    def get(self, uid: TrackId) -> T | None:
         """
         Retrieve an object by its unique identifier (uid).
 
         Parameters:
-            uid (str): The unique identifier of the object to retrieve.
+            uid (TrackId): The unique identifier of the object to retrieve.
 
         Returns:
             T | None: The object identified by uid if it exists in the collection,
                       otherwise None.
 
         This method must be implemented by subclasses to specify how objects
-        are retrieved from the collection using their unique identifiers.
+        are retrieved from the collection using their unique identifiers. Implementations
+        should keep an index from uid to object, rather than scanning the collection, and keep
+        it correct when fusion replaces a stored object with its merged state.
         """
         pass
 
+    def fuse_batch(self, batch):
+        """
+        Fuse a columnar batch of objects with the collection.
+
+        Parameters:
+            batch: A columnar batch of objects, such as a `PingBatch` for Ping collections.
+
+        Returns:
+            The fusion results expressed as row indexes into the batch, such as a `BatchFusion`.
+
+        Collections that accept columnar batches override this method. The default implementation
+        raises NotImplementedError.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support columnar batches")
+
     @abstractmethod
     def put(self, obj: T) -> list[T]:
         """
@@ -283,3 +441,60 @@ class FusibleCollection(ABC, Generic[T]):
         specific type of collection being managed.
         """
         pass
+
+    @abstractmethod
+    def remove(self, uid: TrackId) -> T | None:
+        """
+        Remove an object from the collection by its unique identifier (uid).
+
+        Parameters:
+            uid (TrackId): The unique identifier of the object to remove.
+
+        Returns:
+            T | None: The removed object if the collection held one under uid, otherwise None.
+
+        This method must be implemented by subclasses to specify how objects are removed, for
+        instance when a tracker evicts stale tracks. It should not need to scan the collection.
+        """
+        pass
+
+    def pop_displaced(self) -> list[T]:
+        """
+        Return the objects dropped since the last call to make room for other objects, and forget them.
+
+        Returns:
+            list[T]: The dropped objects in the order they were dropped.
+
+        Collections that can drop an object while fusing, such as a stale object sharing the single slot of a hash
+        bucket with a new one, override this method so that trackers can report the drops as evictions. The default
+        implementation returns an empty list.
+        """
+        return []
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """
+        Return the number of objects held by the collection.
+        """
+        pass
+
+    @abstractmethod
+    def insert(self, obj: T):
+        """
+        Store an object in the collection as it is, without fusing it with the objects already held.
+
+        Parameters:
+            obj (T): The object to store, such as a track restored from a snapshot or handed over by another
+                     collection.
+
+        Collections that cannot hold two objects in the same place, such as a single object per hash bucket,
+        may merge the object with the one already there.
+        """
+        pass
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[T]:
+        """
+        Iterate over the objects held by the collection, in no particular order.
+        """
+        pass
@@ -0,0 +1,96 @@
+# assignment: Minimum cost assignment of pings to tracks over a sparse set of candidate pairs
+import heapq
+import math
+
+
+# solve_sparse_assignment: Assign rows to columns over candidate pairs, leaving a row unassigned at a fixed cost
+def solve_sparse_assignment(edges: list[tuple[int, int, float]], unassigned_cost: float) -> dict[int, int]:
+    """
+    Find the minimum cost assignment of rows to distinct columns using only the given candidate pairs.
+
+    Leaving a row unassigned costs `unassigned_cost`, so a pair is only used when it lowers the total cost. This is
+    the shortest augmenting path form of the Hungarian algorithm (Kuhn-Munkres with potentials) run on the sparse
+    graph of candidate pairs: each row is added in turn by a Dijkstra search over reduced costs, which stops at the
+    first free column, and leaving a row unassigned is a private column of its own. A search only visits the pairs
+    of the rows it displaces, so the work grows with the number of candidate pairs of the competing rows rather than
+    with the square of a cluster.
+
+    Parameters:
+        edges (list[tuple[int, int, float]]): The candidate (row, column, cost) pairs, each row and column pair at
+                                              most once.
+        unassigned_cost (float): The cost of leaving a row unassigned.
+
+    Returns:
+        dict[int, int]: The column assigned to each assigned row.
+    """
+    # a pair costing at least as much as leaving its row unassigned never lowers the total cost
+    row_edges: dict[int, list[tuple[int, float]]] = {}
+    for row, column, cost in edges:
+        if cost < unassigned_cost:
+            row_edges.setdefault(row, []).append((column, cost))
+
+    # the columns are numbered from 0, followed by the unassigned column of every row
+    column_positions: dict[int, int] = {}
+    adjacency: list[list[tuple[int, float]]] = []
+    for pairs in row_edges.values():
+        adjacency.append([(column_positions.setdefault(column, len(column_positions)), cost)
+                          for column, cost in pairs])
+    columns = list(column_positions)
+    for i, pairs in enumerate(adjacency):
+        pairs.append((len(columns) + i, unassigned_cost))
+
+    column_potential = [0.0] * (len(columns) + len(adjacency))
+    row_potential = [0.0] * len(adjacency)
+    column_row = [-1] * (len(columns) + len(adjacency))
+    row_column = [-1] * len(adjacency)
+    for new_row in range(len(adjacency)):
+        distances: dict[int, float] = {}
+        previous_row: dict[int, int] = {}
+        previous_cost: dict[int, float] = {}
+        heap: list[tuple[float, int]] = []
+        for column, cost in adjacency[new_row]:
+            distance = cost - column_potential[column]
+            if distance < distances.get(column, math.inf):
+                distances[column] = distance
+                previous_row[column] = new_row
+                previous_cost[column] = cost
+                heapq.heappush(heap, (distance, column))
+        scanned: set[int] = set()
+        while True:
+            distance, column = heapq.heappop(heap)
+            if column in scanned:
+                continue
+            scanned.add(column)
+            row = column_row[column]
+            if row == -1:
+                free_column, shortest = column, distance
+                break
+            # the assigned pair of a row has a reduced cost of zero, so the search reaches the row at no cost
+            for next_column, cost in adjacency[row]:
+                if next_column in scanned:
+                    continue
+                next_distance = distance + cost - row_potential[row] - column_potential[next_column]
+                if next_distance < distances.get(next_column, math.inf):
+                    distances[next_column] = next_distance
+                    previous_row[next_column] = row
+                    previous_cost[next_column] = cost
+                    heapq.heappush(heap, (next_distance, next_column))
+        # shift the potentials of every scanned column and its row, keeping the reduced cost of every pair
+        # non-negative and of every assigned pair zero
+        for column in scanned:
+            column_potential[column] -= shortest - distances[column]
+            if column_row[column] != -1:
+                row_potential[column_row[column]] += shortest - distances[column]
+        # flip the assignment along the augmenting path, then make the new assigned pairs tight again
+        column = free_column
+        while True:
+            row = previous_row[column]
+            next_column = row_column[row]
+            column_row[column], row_column[row] = row, column
+            row_potential[row] = previous_cost[column] - column_potential[column]
+            if row == new_row:
+                break
+            column = next_column
+
+    rows = list(row_edges)
+    return {rows[i]: columns[column] for i, column in enumerate(row_column) if column < len(columns)}
@@ -0,0 +1,364 @@
+# benchmark: Reproducible throughput, latency and memory benchmarks of the fusion backends
+import argparse
+import datetime
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+
+import numpy as np
+
+from abstract import TimeGenerator, FusibleCollection
+from fusible_geo_hash import PingGeoHash, PingNeighborGeoHash
+from fusible_grid import PingGrid
+from fusible_nearest_neighbor import PingList
+from ids import IntegerIdGenerator
+from ping import Ping
+from spatial_index import QuadTreeIndex
+from tracker_base import TrackerBase
+
+# One threshold per Geo2dDistanceCalculator regime, in meters
+REGIME_THRESHOLDS: dict[str, float] = {"euclidean": 5.0, "great_circle": 100.0, "geodesic": 10_000.0}
+BACKENDS: dict[str, Callable[[float], FusibleCollection[Ping]]] = {
+    "ping_list": PingList,
+    "ping_grid": PingGrid,
+    "ping_quad_tree": lambda threshold: PingGrid(threshold, QuadTreeIndex(threshold)),
+    "ping_grid_predicted": lambda threshold: PingGrid(threshold, motion_prediction=True,
+                                                      time_window=PREDICTION_WINDOW),
+    # the usual alternative to motion prediction: a gate wide enough to catch fast movers where they were last seen
+    "ping_grid_wide_gate": lambda threshold: PingGrid(WIDE_GATE_FACTOR * threshold),
+    "ping_geo_hash": PingGeoHash,
+    "ping_neighbor_geo_hash": PingNeighborGeoHash,
+}
+# Backends that scan every track for every ping are skipped above this many tracks by default
+LINEAR_SCAN_BACKENDS = {"ping_list"}
+LINEAR_SCAN_MAX_TRACKS = 10_000
+# Major airports used as cluster centers by the airports scenario
+AIRPORTS: list[tuple[float, float]] = [
+    (33.6407, -84.4277), (40.0799, 116.6031), (25.2532, 55.3657), (33.9416, -118.4085), (35.5494, 139.7798),
+    (41.9742, -87.9073), (51.4700, -0.4543), (22.3080, 113.9185), (31.1443, 121.8083), (49.0097, 2.5479),
+    (32.8998, -97.0403), (50.0379, 8.5622), (40.6413, -73.7781), (1.3644, 103.9915), (-33.9399, 151.1753),
+    (-23.4356, -46.4731), (19.0896, 72.8656), (55.9726, 37.4146), (-26.1367, 28.2411), (64.1283, -21.9406),
+]
+METERS_PER_DEGREE = 111_139
+# How far a convoy target moves per frame, and how wide the wide gate backend is, in thresholds
+CONVOY_STEP = 0.7
+WIDE_GATE_FACTOR = 3.0
+# How long the predicted backend keeps predicting a track that is not observed again, in milliseconds
+PREDICTION_WINDOW = 2_000
+# Modules a tracker process imports, whose import time short-lived workers pay for on every start
+TRACKER_MODULES = ["tracker_base", "fusible_nearest_neighbor", "fusible_grid", "fusible_geo_hash", "deduplicator",
+                   "ping_batch", "partitioned_tracker", "tracker_stream"]
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+for name in sys.argv[1].split(","):
+    __import__(name)
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "modules": sorted({name.split(".")[0] for name in sys.modules})}))
+"""
+
+
+class FrameClock(TimeGenerator):
+    """
+    Time generator returning the time of the frame being generated, in milliseconds.
+    """
+    now: int
+
+    def __init__(self, now: int = 1_700_000_000_000):
+        self.now = now
+
+    def generate_time(self) -> int:
+        return self.now
+
+
+class Traffic:
+    """
+    Seeded synthetic traffic: a fixed set of targets, each observed once per frame after a small random move.
+
+    Targets move by at most a fifth of the threshold between frames, so every observation after the first frame
+    is within the threshold of its target's previous observation. Targets with a heading instead fly straight at
+    CONVOY_STEP thresholds per frame and are only detected with a given probability, so a target missing a frame
+    reappears beyond the threshold of its previous observation.
+
+    Attributes:
+        latitudes (np.ndarray): The current latitude of every target.
+        longitudes (np.ndarray): The current longitude of every target.
+        threshold (float): The fusion threshold the traffic is generated for, in meters.
+        frame_interval (int): The time between frames in milliseconds.
+        headings (np.ndarray | None): The heading of every target in radians, or None for random moves.
+        detection_probability (float): The probability that a target is observed in a frame.
+        _rng (random.Random): The random number generator driving the traffic.
+        _clock (FrameClock): The clock stamping the pings of the current frame.
+        _builder (Ping.Builder): Builds the pings of every frame.
+
+    Methods:
+        uniform: Targets spread over the globe, away from the poles.
+        airports: Targets clustered around major airports.
+        swarm: Targets packed into a single square about two thresholds apart on average.
+        convoy: Fast targets flying straight, spread out and missing some frames.
+        frame: Moves every target and returns one observation of each.
+    """
+    latitudes: np.ndarray
+    longitudes: np.ndarray
+    threshold: float
+    frame_interval: int
+    headings: np.ndarray | None
+    detection_probability: float
+    _rng: random.Random
+    _clock: FrameClock
+    _builder: Ping.Builder
+
+    def __init__(self, latitudes: list[float], longitudes: list[float], threshold: float, rng: random.Random,
+                 frame_interval: int = 1000, headings: list[float] | None = None, detection_probability: float = 1.0):
+        self.latitudes = np.array(latitudes)
+        self.longitudes = np.array(longitudes)
+        self.threshold = threshold
+        self.frame_interval = frame_interval
+        self.headings = np.array(headings) if headings is not None else None
+        self.detection_probability = detection_probability
+        self._rng = rng
+        self._clock = FrameClock()
+        self._builder = Ping.Builder().with_id_generator(IntegerIdGenerator(rng=rng)).with_time_generator(self._clock)
+
+    # uniform: Spread targets uniformly over the globe between 80 degrees south and north
+    @classmethod
+    def uniform(cls, count: int, threshold: float, seed: int) -> 'Traffic':
+        rng = random.Random(seed)
+        return cls([rng.uniform(-80.0, 80.0) for _ in range(count)],
+                   [rng.uniform(-180.0, 180.0) for _ in range(count)], threshold, rng)
+
+    # airports: Cluster targets around major airports with a spread of about 50 km
+    @classmethod
+    def airports(cls, count: int, threshold: float, seed: int) -> 'Traffic':
+        rng = random.Random(seed)
+        centers = [rng.choice(AIRPORTS) for _ in range(count)]
+        return cls([lat + rng.gauss(0.0, 0.45) for lat, _ in centers],
+                   [lon + rng.gauss(0.0, 0.45) / math.cos(math.radians(lat)) for lat, lon in centers],
+                   threshold, rng)
+
+    # swarm: Pack targets into one square sized for an average spacing of about two thresholds
+    @classmethod
+    def swarm(cls, count: int, threshold: float, seed: int) -> 'Traffic':
+        rng = random.Random(seed)
+        half_side = math.sqrt(count) * threshold / METERS_PER_DEGREE
+        return cls([rng.uniform(-half_side, half_side) for _ in range(count)],
+                   [rng.uniform(-half_side, half_side) for _ in range(count)], threshold, rng)
+
+    # convoy: Spread straight flying targets about ten thresholds apart, each detected in 70% of the frames
+    @classmethod
+    def convoy(cls, count: int, threshold: float, seed: int) -> 'Traffic':
+        rng = random.Random(seed)
+        half_side = 5 * math.sqrt(count) * threshold / METERS_PER_DEGREE
+        return cls([rng.uniform(-half_side, half_side) for _ in range(count)],
+                   [rng.uniform(-half_side, half_side) for _ in range(count)], threshold, rng,
+                   headings=[rng.uniform(0.0, 2 * math.pi) for _ in range(count)], detection_probability=0.7)
+
+    # frame: Move every target and return a ping for each of them that is detected
+    def frame(self) -> list[Ping]:
+        self._clock.now += self.frame_interval
+        count = len(self.latitudes)
+        if self.headings is None:
+            step = 0.2 * self.threshold / METERS_PER_DEGREE
+            angles = np.array([self._rng.uniform(0.0, 2 * math.pi) for _ in range(count)])
+            distances = np.array([self._rng.uniform(0.0, step) for _ in range(count)])
+        else:
+            angles = self.headings
+            distances = np.full(count, CONVOY_STEP * self.threshold / METERS_PER_DEGREE)
+        self.latitudes = np.clip(self.latitudes + distances * np.sin(angles), -89.9, 89.9)
+        self.longitudes = (self.longitudes + distances * np.cos(angles) / np.cos(np.radians(self.latitudes))
+                           + 180.0) % 360.0 - 180.0
+        return [self._builder.build(f"BM{i}", lat, lon)
+                for i, (lat, lon) in enumerate(zip(self.latitudes.tolist(), self.longitudes.tolist()))
+                if self.detection_probability >= 1.0 or self._rng.random() < self.detection_probability]
+
+
+SCENARIOS: dict[str, Callable[[int, float, int], Traffic]] = {
+    "uniform": Traffic.uniform,
+    "airports": Traffic.airports,
+    "swarm": Traffic.swarm,
+    "convoy": Traffic.convoy,
+}
+
+
+# run_case: Benchmark one backend on one scenario, regime and track count
+def run_case(scenario: str, backend: str, regime: str, tracks: int, frames: int, seed: int,
+             memory: bool = True) -> dict:
+    """
+    Load `tracks` targets into a fresh TrackerBase, then time `frames` updates re-observing every target.
+
+    Parameters:
+        scenario (str): The key of the traffic generator in SCENARIOS.
+        backend (str): The key of the collection in BACKENDS.
+        regime (str): The key of the distance regime in REGIME_THRESHOLDS.
+        tracks (int): The number of targets.
+        frames (int): The number of timed updates after the initial load.
+        seed (int): The seed of the traffic generator.
+        memory (bool): Whether to measure peak memory, in a separate untimed run of the initial load.
+
+    Returns:
+        dict: The measurements, see `main` for the layout.
+    """
+    threshold = REGIME_THRESHOLDS[regime]
+    traffic = SCENARIOS[scenario](tracks, threshold, seed)
+    tracker = TrackerBase(threshold, BACKENDS[backend](threshold))
+
+    start = time.perf_counter()
+    tracker.update(traffic.frame())
+    load_seconds = time.perf_counter() - start
+
+    latencies: list[float] = []
+    matched = unmatched = pings = 0
+    for _ in range(frames):
+        frame = traffic.frame()
+        pings += len(frame)
+        start = time.perf_counter()
+        frame_matched, frame_unmatched = tracker.update(frame)
+        latencies.append(time.perf_counter() - start)
+        matched += len(frame_matched)
+        unmatched += len(frame_unmatched)
+    # one more, untimed, frame counts the distances measured per nearest track search
+    metrics = tracker.enable_metrics()
+    tracker.update(traffic.frame())
+    candidates_per_search = metrics.snapshot()["candidates_per_search"]
+    tracker.disable_metrics()
+
+    result = {
+        "scenario": scenario,
+        "backend": backend,
+        "method": "TrackerBase.update",
+        "regime": regime,
+        "threshold": threshold,
+        "tracks": tracks,
+        "frames": frames,
+        "seed": seed,
+        "load_seconds": load_seconds,
+        "pings_per_second": pings / sum(latencies) if latencies and sum(latencies) > 0 else None,
+        "latency_ms": {
+            "p50": float(np.percentile(latencies, 50)) * 1000 if latencies else None,
+            "p99": float(np.percentile(latencies, 99)) * 1000 if latencies else None,
+            "mean": float(np.mean(latencies)) * 1000 if latencies else None,
+        },
+        "match_rate": matched / (matched + unmatched) if matched + unmatched else None,
+        "candidates_per_search": candidates_per_search,
+        "peak_memory_bytes": None,
+    }
+    if memory:
+        traffic = SCENARIOS[scenario](tracks, threshold, seed)
+        frame = traffic.frame()
+        tracemalloc.start()
+        tracker = TrackerBase(threshold, BACKENDS[backend](threshold))
+        tracker.update(frame)
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+# import_in_fresh_interpreter: Import modules in a new interpreter and get the import time and the loaded top level modules
+def import_in_fresh_interpreter(modules: list[str]) -> dict:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT, ",".join(modules)], capture_output=True, text=True,
+                            check=True).stdout
+    return json.loads(output)
+
+
+# run: Benchmark every combination of the given scenarios, backends, regimes and track counts
+def run(scenarios: list[str], backends: list[str], regimes: list[str], sizes: list[int], frames: int, seed: int,
+        memory: bool = True, linear_scan_max_tracks: int = LINEAR_SCAN_MAX_TRACKS) -> dict:
+    results: list[dict] = []
+    for scenario in scenarios:
+        for regime in regimes:
+            for tracks in sizes:
+                for backend in backends:
+                    if backend in LINEAR_SCAN_BACKENDS and tracks > linear_scan_max_tracks:
+                        results.append({"scenario": scenario, "backend": backend, "regime": regime,
+                                        "tracks": tracks, "skipped": "linear scan backend above "
+                                                                     f"{linear_scan_max_tracks} tracks"})
+                        continue
+                    results.append(run_case(scenario, backend, regime, tracks, frames, seed, memory))
+    return {
+        "meta": {
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": seed,
+            "frames": frames,
+            "tracker_import_seconds": import_in_fresh_interpreter(TRACKER_MODULES)["seconds"],
+        },
+        "results": results,
+    }
+
+
+# compare: List the cases whose throughput dropped by more than a tolerance between two benchmark reports
+def compare(baseline: dict, current: dict, tolerance: float = 0.1) -> list[dict]:
+    """
+    Compare two reports produced by `run`.
+
+    Parameters:
+        baseline (dict): The reference report.
+        current (dict): The report to check.
+        tolerance (float): The relative throughput drop that counts as a regression. Defaults to 0.1.
+
+    Returns:
+        list[dict]: One entry per regressed case, with its key and both throughputs.
+    """
+    def key(result: dict) -> tuple:
+        return result["scenario"], result["backend"], result["regime"], result["tracks"]
+
+    reference = {key(result): result for result in baseline["results"] if result.get("pings_per_second")}
+    regressions: list[dict] = []
+    for result in current["results"]:
+        before = reference.get(key(result))
+        if before is None or not result.get("pings_per_second"):
+            continue
+        if result["pings_per_second"] < (1 - tolerance) * before["pings_per_second"]:
+            regressions.append({"case": dict(zip(("scenario", "backend", "regime", "tracks"), key(result))),
+                                "baseline_pings_per_second": before["pings_per_second"],
+                                "pings_per_second": result["pings_per_second"]})
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the fusion backends and emit the results as JSON.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated traffic generators")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma separated fusion backends")
+    parser.add_argument("--regimes", default=",".join(REGIME_THRESHOLDS), help="comma separated distance regimes")
+    parser.add_argument("--sizes", default="100,1000,10000,100000,1000000", help="comma separated track counts")
+    parser.add_argument("--frames", type=int, default=5, help="timed updates per case")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the traffic generators")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory measurement")
+    parser.add_argument("--linear-scan-max-tracks", type=int, default=LINEAR_SCAN_MAX_TRACKS,
+                        help="largest track count run for backends that scan every track")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="a previous JSON report; exit with status 1 on throughput regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative throughput drop that is a regression")
+    args = parser.parse_args(argv)
+
+    def names(value: str, known: dict) -> list[str]:
+        selected = [name for name in value.split(",") if name]
+        unknown = [name for name in selected if name not in known]
+        if unknown:
+            parser.error(f"unknown names {unknown}, expected some of {list(known)}")
+        return selected
+
+    report = run(names(args.scenarios, SCENARIOS), names(args.backends, BACKENDS),
+                 names(args.regimes, REGIME_THRESHOLDS), [int(size) for size in args.sizes.split(",")],
+                 args.frames, args.seed, not args.no_memory, args.linear_scan_max_tracks)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            report["regressions"] = compare(json.load(baseline_file), report, args.tolerance)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(text + "\n")
+    else:
+        print(text)
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# capture: Packed binary ping records, read into PingBatch columns without copying them
+import mmap
+import uuid
+from collections.abc import Iterator, Mapping
+
+import numpy as np
+
+from ids import id_kind, ID_INT64, ID_INT128, ID_MIXED
+from ping import Ping
+from ping_batch import PingBatch
+
+# The default record layout: a raw 16 byte UUID track_id, int64 times and float64 coordinates, 48 bytes in all
+PING_RECORD = np.dtype([("track_id", "V16"), ("start_time", "<i8"), ("observation_time", "<i8"),
+                        ("latitude", "<f8"), ("longitude", "<f8")])
+# The default layout with an int64 track_id, for feeds using integer track_ids, 40 bytes in all
+INTEGER_PING_RECORD = np.dtype([("track_id", "<i8")] + PING_RECORD.descr[1:])
+# The fields every record layout must declare. A layout may also declare a fixed width "callsign" bytes field.
+RECORD_FIELDS = ("track_id", "start_time", "observation_time", "latitude", "longitude")
+
+
+# record_layout: Build a record layout with a UUID or integer track_id, and optionally a fixed width callsign field
+def record_layout(callsign_width: int = 0, integer_ids: bool = False) -> np.dtype:
+    if callsign_width < 0:
+        raise ValueError(f"Expected a non-negative callsign width, got {callsign_width}")
+    layout = INTEGER_PING_RECORD if integer_ids else PING_RECORD
+    if callsign_width == 0:
+        return layout
+    return np.dtype(layout.descr + [("callsign", f"S{callsign_width}")])
+
+
+def load_frame(data, layout: np.dtype = PING_RECORD, offset: int = 0, count: int = -1) -> PingBatch:
+    """
+    View packed records as a PingBatch.
+
+    The columns of the batch are strided views of `data`, so loading a frame copies nothing and creates no Python
+    object per record. UUID track_ids stay raw bytes and the callsigns stay bytes until rows are materialized, which
+    the batch fusion path only does for the pings it stores or merges.
+
+    Parameters:
+        data (bytes | bytearray | memoryview | mmap.mmap): The packed records, in the byte order of the layout.
+        layout (np.dtype): The record layout, a structured dtype declaring at least RECORD_FIELDS, with a 16 byte
+                           UUID or int64 track_id, native int64 times and float64 coordinates. Defaults to
+                           PING_RECORD.
+        offset (int): The byte offset of the first record. Defaults to 0.
+        count (int): The number of records to read, or -1 for every record after the offset. Defaults to -1.
+
+    Returns:
+        PingBatch: The records, with an empty callsign for each record if the layout declares none.
+
+    Raises:
+        ValueError: If the layout lacks a field, or the data does not hold a whole number of records.
+    """
+    _record_fields(layout)
+    records = np.frombuffer(data, dtype=layout, count=count, offset=offset)
+    return _records_to_batch(records)
+
+
+def pack_records(pings: list[Ping], layout: np.dtype | None = None) -> bytes:
+    """
+    Pack pings into records, such as to record a capture file.
+
+    Parameters:
+        pings (list[Ping]): The pings to pack, whose track_ids must be UUID strings, or integers of at most 63 bits
+                            if the layout has an integer track_id.
+        layout (np.dtype | None): The record layout, see `load_frame`. Defaults to INTEGER_PING_RECORD for integer
+                                  track_ids, as issued by `Ping.Builder`, and to PING_RECORD for UUID track_ids.
+
+    Returns:
+        bytes: The packed records.
+
+    Raises:
+        ValueError: If the track_ids do not fit the layout, or a callsign does not fit the layout.
+    """
+    track_ids = [ping.track_id for ping in pings]
+    kind = id_kind(track_ids)
+    if kind == ID_INT128:
+        raise ValueError("Integer track_ids of more than 63 bits do not fit a capture record")
+    if kind == ID_MIXED:
+        raise ValueError("Expected either string or integer track_ids in a capture, got both")
+    if layout is None:
+        layout = INTEGER_PING_RECORD if kind == ID_INT64 else PING_RECORD
+    fields = _record_fields(layout)
+    integer_layout = fields["track_id"][0].kind == "i"
+    if track_ids and integer_layout != (kind == ID_INT64):
+        raise ValueError(f"The record layout has {'an int64' if integer_layout else 'a UUID'} track_id, got "
+                         f"{'integer' if kind == ID_INT64 else 'string'} track_ids")
+    records = np.zeros(len(pings), dtype=layout)
+    if integer_layout:
+        records["track_id"] = track_ids
+    else:
+        records["track_id"] = [uuid.UUID(str(track_id)).bytes for track_id in track_ids]
+    records["start_time"] = [ping.start_time for ping in pings]
+    records["observation_time"] = [ping.observation_time for ping in pings]
+    records["latitude"] = [ping.latitude for ping in pings]
+    records["longitude"] = [ping.longitude for ping in pings]
+    if "callsign" in fields:
+        width = fields["callsign"][0].itemsize
+        callsigns = [ping.callsign.encode() for ping in pings]
+        too_long = [callsign for callsign in callsigns if len(callsign) > width]
+        if too_long:
+            raise ValueError(f"Callsigns {too_long[:3]} do not fit in {width} bytes")
+        records["callsign"] = callsigns
+    return records.tobytes()
+
+
+def iter_frames(path: str, layout: np.dtype = PING_RECORD, frame_interval: int | None = None) \
+        -> Iterator[PingBatch]:
+    """
+    Memory-map a capture file of packed records and yield it frame by frame.
+
+    The records of a capture are in observation_time order. A frame is a run of records sharing an observation_time,
+    or with a frame interval, a run of records in the same interval of observation_time. Frames are views of the
+    mapped file, so pages are read from disk as the frames are fused and a capture may be far larger than memory.
+
+    Parameters:
+        path (str): The capture file.
+        layout (np.dtype): The record layout, see `load_frame`. Defaults to PING_RECORD.
+        frame_interval (int | None): The length of a frame in observation_time units, or None for a frame per
+                                     observation_time. Defaults to None.
+
+    Yields:
+        PingBatch: The records of each frame.
+
+    Raises:
+        ValueError: If the file does not hold a whole number of records, or the frame interval is not positive.
+    """
+    if frame_interval is not None and frame_interval <= 0:
+        raise ValueError(f"Expected a positive frame interval, got {frame_interval}")
+    with open(path, "rb") as capture_file:
+        if capture_file.seek(0, 2) == 0:
+            return
+        # the mapping stays open as long as the frames viewing it are alive
+        mapped = mmap.mmap(capture_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapped) % layout.itemsize:
+        raise ValueError(f"{path} holds {len(mapped)} bytes, which is not a whole number of {layout.itemsize} byte "
+                         f"records")
+    records: np.ndarray = np.frombuffer(mapped, dtype=layout)
+    times: np.ndarray = records["observation_time"]
+    frames: np.ndarray = times if frame_interval is None else times // frame_interval
+    changes: np.ndarray = np.flatnonzero(frames[1:] != frames[:-1])
+    boundaries = (changes + 1).tolist()
+    for start, end in zip([0] + boundaries, boundaries + [len(records)]):
+        yield _records_to_batch(records[start:end])
+
+
+# _record_fields: Return the fields of a record layout, checking that it declares every field of RECORD_FIELDS
+def _record_fields(layout: np.dtype) -> Mapping[str, tuple]:
+    fields: Mapping[str, tuple] = layout.fields or {}
+    missing = [field for field in RECORD_FIELDS if field not in fields]
+    if missing:
+        raise ValueError(f"The record layout lacks the fields {missing}")
+    return fields
+
+
+# _records_to_batch: View the fields of a record array as the columns of a batch
+def _records_to_batch(records: np.ndarray) -> PingBatch:
+    if "callsign" in (records.dtype.names or ()):
+        callsigns = records["callsign"]
+    else:
+        callsigns = np.broadcast_to(np.zeros(1, dtype="S1"), (len(records),))
+    return PingBatch(records["track_id"], callsigns, records["start_time"], records["observation_time"],
+                     records["latitude"], records["longitude"])
@@ -13,4 +13,18 @@ GEO_HASH_PRECISION_6_RESOLUTION = 1360
 GEO_HASH_PRECISION_7_RESOLUTION = 215
 GEO_HASH_PRECISION_8_RESOLUTION = 42
 GEO_HASH_PRECISION_9_RESOLUTION = 7
-GEO_HASH_PRECISION_10_RESOLUTION = 1
\ No newline at end of file
+GEO_HASH_PRECISION_10_RESOLUTION = 1
+
+# Spatial index constants
+# A conservative lower bound on the length of one degree of latitude (or of central angle) anywhere on the
+# WGS-84 ellipsoid. Dividing a threshold by it yields a search margin that never under-covers a match.
+MIN_METERS_PER_DEGREE = 110_000
+
+# Batch distance constants
+# Mean earth radius used by geopy's great_circle, and the WGS-84 ellipsoid used by geopy's geodesic
+EARTH_RADIUS_METERS = 6_371_009
+WGS84_SEMI_MAJOR_AXIS = 6_378_137.0
+WGS84_FLATTENING = 1 / 298.257223563
+# The same radius and axis in kilometers, the unit geopy computes in, so the scalar kernels round exactly like geopy
+EARTH_RADIUS_KILOMETERS = 6371.009
+WGS84_SEMI_MAJOR_AXIS_KILOMETERS = 6378.137
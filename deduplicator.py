@@ -0,0 +1,162 @@
+import heapq
+from collections.abc import Callable
+
+from abstract import DistanceCalculator2d, Point2d
+from ping import Ping
+from ping_batch import PingBatch
+from spatial_index import GridIndex
+from tracker_base import Geo2dDistanceCalculator
+
+
+class PingDeduplicator:
+    """
+    Iterative, index-backed removal of near-duplicate Pings within a single batch.
+
+    The original implementation searched the batch for the first pair (i, j), i < j, closer than the threshold,
+    replaced Ping i with `i.merge(j)`, dropped Ping j and restarted the search through recursion. This class
+    produces exactly the same merged Pings without restarting: every Ping before the current position is known
+    to have no close partner after it, and a merge only moves the Ping at the current position, so the next pair
+    is either an earlier Ping that is now close to the moved Ping or the moved Ping and its first close successor.
+    Both are found with a single GridIndex lookup, whose cells keep their keys sorted, so a batch of n Pings
+    costs close to O(n log n) instead of O(n^3) distance calls and never hits the recursion limit.
+
+    The deduplicator does not modify its input and can be used on its own to preprocess a batch before `fuse`.
+
+    Attributes:
+        _threshold (float): Threshold distance under which two Pings are considered duplicates.
+        distancer (DistanceCalculator2d): Distance calculator used to confirm duplicates.
+
+    Methods:
+        __init__: Initializes a new PingDeduplicator with a threshold and an optional distance calculator.
+        remove_duplicates: Returns the batch with near-duplicate Pings merged together.
+        cluster_batch: Groups the near-duplicate rows of a columnar PingBatch.
+    """
+    _threshold: float
+    distancer: DistanceCalculator2d
+
+    def __init__(self, threshold: float, distancer: DistanceCalculator2d | None = None):
+        self._threshold = threshold
+        self.distancer = distancer if distancer is not None else Geo2dDistanceCalculator(threshold, prefilter=True)
+
+    # remove_duplicates: Merge every group of pings in the same range and return the merged pings in input order
+    def remove_duplicates(self, inputs: list[Ping]) -> list[Ping]:
+        kept: list[Ping] = list(inputs)
+
+        def merge_pings(first: int, second: int) -> Point2d:
+            kept[first] = kept[first].merge(kept[second])
+            return kept[first].latitude, kept[first].longitude
+
+        survivors = self._cluster([ping.latitude for ping in kept], [ping.longitude for ping in kept], merge_pings)
+        return [kept[slot] for slot in survivors]
+
+    # cluster_batch: Merge every group of rows in the same range of a batch without materializing any Ping
+    def cluster_batch(self, batch: PingBatch) -> tuple[list[int], list[int], list[int], list[int]]:
+        """
+        Deduplicate a columnar PingBatch by row.
+
+        A merge of Pings always takes its track_id, callsign and start_time from one input row (the earliest) and its
+        observation_time and position from one input row (the newest), so a group of merged rows is fully described
+        by that pair of rows, and is merged in exactly the same order as `remove_duplicates` would merge the Pings.
+
+        Parameters:
+            batch (PingBatch): The batch to deduplicate.
+
+        Returns:
+            tuple: A tuple containing:
+                - The slot (row of the first member) of each remaining group, in input order.
+                - For every slot, the row providing the group's track_id, callsign and start_time.
+                - For every slot, the row providing the group's observation_time and position.
+                - For every row, the slot of the group it was merged into.
+        """
+        start_times = batch.start_times.tolist()
+        observation_times = batch.observation_times.tolist()
+        latitudes = batch.latitudes.tolist()
+        longitudes = batch.longitudes.tolist()
+        earliest = list(range(len(batch)))
+        newest = list(range(len(batch)))
+        parents = list(range(len(batch)))
+
+        def merge_rows(first: int, second: int) -> Point2d:
+            if not start_times[earliest[first]] < start_times[earliest[second]]:
+                earliest[first] = earliest[second]
+            if not observation_times[newest[first]] > observation_times[newest[second]]:
+                newest[first] = newest[second]
+            parents[second] = first
+            return latitudes[newest[first]], longitudes[newest[first]]
+
+        survivors = self._cluster(list(latitudes), list(longitudes), merge_rows)
+        # a row is only ever merged into a lower slot, so resolving rows in order resolves every chain
+        for row in range(len(parents)):
+            parents[row] = parents[parents[row]]
+        return survivors, earliest, newest, parents
+
+    # _cluster: Run the pairwise merge search over slot positions and return the surviving slots in input order
+    def _cluster(self, latitudes: list[float], longitudes: list[float], merge_slots: Callable[[int, int], Point2d]) \
+            -> list[int]:
+        clustering = _SlotClustering(self, latitudes, longitudes, merge_slots)
+        current = 0
+        while current < len(latitudes):
+            if not clustering.alive[current]:
+                current += 1
+                continue
+            later = clustering.get_first_close_slot(current, after=True)
+            if later is None:
+                current += 1
+                continue
+            clustering.merge(current, later)
+            # the merged slot moved, so an earlier slot may now be within range of it
+            earlier = clustering.get_first_close_slot(current, after=False)
+            while earlier is not None:
+                clustering.merge(earlier, current)
+                current = earlier
+                earlier = clustering.get_first_close_slot(current, after=False)
+        return [slot for slot, alive in enumerate(clustering.alive) if alive]
+
+
+class _SlotClustering:
+    """
+    State of a single PingDeduplicator run: the position of every slot, which slots are still alive and a GridIndex
+    over the live slots. Merging is delegated to a callback that returns the new position of the surviving slot.
+    """
+    deduplicator: PingDeduplicator
+    latitudes: list[float]
+    longitudes: list[float]
+    alive: list[bool]
+    index: GridIndex
+    merge_slots: Callable[[int, int], Point2d]
+
+    def __init__(self, deduplicator: PingDeduplicator, latitudes: list[float], longitudes: list[float],
+                 merge_slots: Callable[[int, int], Point2d]):
+        self.deduplicator = deduplicator
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.alive = [True] * len(latitudes)
+        self.merge_slots = merge_slots
+        self.index = GridIndex(deduplicator._threshold)
+        for slot, point in enumerate(zip(latitudes, longitudes)):
+            self.index.insert(slot, point)
+
+    # merge: Merge the second slot into the first one and move the first one to its merged position
+    def merge(self, first: int, second: int):
+        self.index.remove(second, (self.latitudes[second], self.longitudes[second]))
+        self.index.remove(first, (self.latitudes[first], self.longitudes[first]))
+        self.alive[second] = False
+        self.latitudes[first], self.longitudes[first] = self.merge_slots(first, second)
+        self.index.insert(first, (self.latitudes[first], self.longitudes[first]))
+
+    # get_first_close_slot: Get the lowest slot after (or before) a slot that is within range of it
+    def get_first_close_slot(self, slot: int, after: bool) -> int | None:
+        distancer = self.deduplicator.distancer
+        threshold = self.deduplicator._threshold
+        point = (self.latitudes[slot], self.longitudes[slot])
+        for i in heapq.merge(*self.index.query_cells(point)):
+            if after and i <= slot:
+                continue
+            if not after and i >= slot:
+                break
+            other = (self.latitudes[i], self.longitudes[i])
+            # measure in input order, as the pairwise search did
+            pair = (point, other) if after else (other, point)
+            if distancer.within_threshold(*pair, threshold):
+                return i
+        return None
@@ -0,0 +1,202 @@
+# delta: Compact change records of tracker state and their binary encoding into a reusable buffer
+import struct
+
+from abstract import TrackId
+
+# Record kinds, the first element of every delta tuple:
+# (TRACK_NEW, track_id, callsign, observation_time, latitude, longitude)
+# (TRACK_MOVED, track_id, observation_time, latitude, longitude)
+# (TRACK_MERGED, previous_track_id, track_id)
+# (TRACK_CALLSIGN, track_id, callsign)
+# (TRACK_EVICTED, track_id)
+TRACK_NEW = 1
+TRACK_MOVED = 2
+TRACK_MERGED = 3
+TRACK_CALLSIGN = 4
+TRACK_EVICTED = 5
+# kind, observation time, latitude, longitude and the byte lengths of the strings that follow
+_NEW = struct.Struct("<BqddHH")
+_MOVED = struct.Struct("<BqddH")
+_TWO_STRINGS = struct.Struct("<BHH")
+_ONE_STRING = struct.Struct("<BH")
+_KIND = struct.Struct("<B")
+# A length with this bit set is the byte length of an integer track_id rather than of a UTF-8 string
+_INTEGER_ID = 0x8000
+DELTA_BUFFER_SIZE = 64 * 1024
+
+
+class DeltaEncoder:
+    """
+    Encodes delta records into a buffer that is allocated once and reused for every call.
+
+    Each record is a little-endian header packed in place with `struct.pack_into`, holding the kind, the numeric
+    fields and the byte lengths of the UTF-8 strings, followed by the strings themselves. A feed publishing many
+    times a second therefore allocates no new bytes per message once the buffer has grown to the largest message.
+    An integer track_id is written as 8 or 16 little-endian bytes instead of a string, its length flagged with the
+    top bit.
+
+    Attributes:
+        buffer (bytearray): The reused output buffer, grown by doubling when a message does not fit.
+
+    Methods:
+        __init__: Initializes an encoder with a buffer of a given size.
+        encode: Encodes delta records, returning a view of the encoded bytes in the buffer.
+    """
+    buffer: bytearray
+
+    def __init__(self, size: int = DELTA_BUFFER_SIZE):
+        """
+        Initializes a new DeltaEncoder.
+
+        Parameters:
+            size (int): The initial size of the buffer in bytes. Defaults to DELTA_BUFFER_SIZE.
+
+        Raises:
+            ValueError: If the size is not positive.
+        """
+        if size <= 0:
+            raise ValueError(f"Expected a positive buffer size, got {size}")
+        self.buffer = bytearray(size)
+
+    def encode(self, deltas: list[tuple]) -> memoryview:
+        """
+        Encode delta records into the buffer.
+
+        Parameters:
+            deltas (list[tuple]): The records, as returned by `TrackerBase.pop_deltas`.
+
+        Returns:
+            memoryview: The encoded records. The view shares the buffer, so it is only valid until the next call.
+
+        Raises:
+            ValueError: If a record has an unknown kind.
+        """
+        position = 0
+        for delta in deltas:
+            kind = delta[0]
+            if kind == TRACK_MOVED:
+                track_id = _encode_id(delta[1])
+                end = position + _MOVED.size + len(track_id)
+                self._reserve(end)
+                _MOVED.pack_into(self.buffer, position, kind, delta[2], delta[3], delta[4],
+                                 _id_length(delta[1], track_id))
+                self.buffer[end - len(track_id):end] = track_id
+            elif kind == TRACK_NEW:
+                track_id, callsign = _encode_id(delta[1]), delta[2].encode()
+                end = position + _NEW.size + len(track_id) + len(callsign)
+                self._reserve(end)
+                _NEW.pack_into(self.buffer, position, kind, delta[3], delta[4], delta[5],
+                               _id_length(delta[1], track_id), len(callsign))
+                middle = end - len(callsign)
+                self.buffer[middle - len(track_id):middle] = track_id
+                self.buffer[middle:end] = callsign
+            elif kind == TRACK_MERGED or kind == TRACK_CALLSIGN:
+                # a merge names two tracks, a callsign record a track and its callsign
+                first = _encode_id(delta[1])
+                second = _encode_id(delta[2]) if kind == TRACK_MERGED else delta[2].encode()
+                end = position + _TWO_STRINGS.size + len(first) + len(second)
+                self._reserve(end)
+                _TWO_STRINGS.pack_into(self.buffer, position, kind, _id_length(delta[1], first),
+                                       _id_length(delta[2], second))
+                middle = end - len(second)
+                self.buffer[middle - len(first):middle] = first
+                self.buffer[middle:end] = second
+            elif kind == TRACK_EVICTED:
+                track_id = _encode_id(delta[1])
+                end = position + _ONE_STRING.size + len(track_id)
+                self._reserve(end)
+                _ONE_STRING.pack_into(self.buffer, position, kind, _id_length(delta[1], track_id))
+                self.buffer[end - len(track_id):end] = track_id
+            else:
+                raise ValueError(f"Unknown delta record kind {kind}")
+            position = end
+        return memoryview(self.buffer)[:position]
+
+    # _reserve: Grow the buffer by doubling until it holds at least a number of bytes
+    def _reserve(self, size: int):
+        if size > len(self.buffer):
+            capacity = len(self.buffer)
+            while capacity < size:
+                capacity *= 2
+            # a view returned by an earlier call may still be alive, and a bytearray cannot be resized under a view
+            grown = bytearray(capacity)
+            grown[:len(self.buffer)] = self.buffer
+            self.buffer = grown
+
+
+# decode_deltas: Decode the records written by DeltaEncoder.encode
+def decode_deltas(data: bytes | memoryview) -> list[tuple]:
+    """
+    Decode encoded delta records back into tuples.
+
+    Parameters:
+        data (bytes | memoryview): The bytes returned by `DeltaEncoder.encode`.
+
+    Returns:
+        list[tuple]: The records, in the layout of the kinds documented at the top of this module.
+
+    Raises:
+        ValueError: If the data holds an unknown kind or ends inside a record.
+    """
+    data = memoryview(data)
+    deltas: list[tuple] = []
+    position = 0
+    try:
+        while position < len(data):
+            kind = _KIND.unpack_from(data, position)[0]
+            if kind == TRACK_MOVED:
+                _, observation_time, latitude, longitude, length = _MOVED.unpack_from(data, position)
+                position += _MOVED.size
+                track_id = _decode(data, position, length)
+                deltas.append((kind, track_id, observation_time, latitude, longitude))
+                position += length & ~_INTEGER_ID
+            elif kind == TRACK_NEW:
+                _, observation_time, latitude, longitude, id_length, callsign_length = _NEW.unpack_from(data, position)
+                position += _NEW.size
+                track_id = _decode(data, position, id_length)
+                id_length &= ~_INTEGER_ID
+                callsign = _decode(data, position + id_length, callsign_length)
+                deltas.append((kind, track_id, callsign, observation_time, latitude, longitude))
+                position += id_length + callsign_length
+            elif kind == TRACK_MERGED or kind == TRACK_CALLSIGN:
+                _, first_length, second_length = _TWO_STRINGS.unpack_from(data, position)
+                position += _TWO_STRINGS.size
+                first = _decode(data, position, first_length)
+                first_length &= ~_INTEGER_ID
+                second = _decode(data, position + first_length, second_length)
+                deltas.append((kind, first, second))
+                position += first_length + (second_length & ~_INTEGER_ID)
+            elif kind == TRACK_EVICTED:
+                length = _ONE_STRING.unpack_from(data, position)[1]
+                position += _ONE_STRING.size
+                deltas.append((kind, _decode(data, position, length)))
+                position += length & ~_INTEGER_ID
+            else:
+                raise ValueError(f"Unknown delta record kind {kind} at byte {position}")
+    except struct.error as error:
+        raise ValueError(f"Delta records end inside a record at byte {position}") from error
+    return deltas
+
+
+# _encode_id: Encode a track_id as UTF-8, or an integer track_id as 8 or 16 little-endian bytes
+def _encode_id(track_id: TrackId) -> bytes:
+    if isinstance(track_id, str):
+        return track_id.encode()
+    return track_id.to_bytes(8 if track_id < 1 << 64 else 16, "little")
+
+
+# _id_length: Return the length field of an encoded track_id, flagged if the track_id is an integer
+def _id_length(track_id: TrackId, encoded: bytes) -> int:
+    return len(encoded) if isinstance(track_id, str) else _INTEGER_ID | len(encoded)
+
+
+# _decode: Decode a UTF-8 string or a flagged integer track_id of a given byte length at a position, checking that it
+# is complete
+def _decode(data: memoryview, position: int, length: int) -> TrackId:
+    integer = length & _INTEGER_ID
+    length &= ~_INTEGER_ID
+    if position + length > len(data):
+        raise ValueError(f"Delta records end inside a record at byte {position}")
+    if integer:
+        return int.from_bytes(data[position:position + length], "little")
+    return bytes(data[position:position + length]).decode()
@@ -1,11 +1,14 @@
 # PingGeoHash: A class that stores pings in a dictionary with the key being the geohash of the lat long
 import math
+from collections.abc import Iterator
 from copy import copy
 
 import constants
-import pygeohash as pgh
-from abstract import FusibleCollection
+from abstract import FusibleCollection, TrackId
+from fusible_grid import PingGrid
 from ping import Ping
+from ping_batch import PingBatch, BatchFusion
+from spatial_index import GeoHashIndex
 
 
 class PingGeoHash(FusibleCollection[Ping]):
@@ -18,21 +21,35 @@ class PingGeoHash(FusibleCollection[Ping]):
 
     Attributes:
         geo_hash (dict[str, Ping]): A dictionary mapping geohash keys to Ping objects.
+        _uids (dict[TrackId, str]): Index from track_id to the geohash key the track is stored under.
         _precision (int): The precision level of geohashing, dynamically determined by a threshold.
         geo_hash_precisions (dict[int, range]): A mapping of geohash precision levels to their corresponding
                                                 resolution ranges.
+        _copy_results (bool): Whether a match returned by `put` holds copies of the pings instead of the pings
+                              themselves.
+        _time_window (int | None): The largest observation time difference of a ping and a track it can fuse with.
+        _displaced (list[Ping]): Stale tracks replaced by a ping in their cell since the last call to `pop_displaced`.
 
     Methods:
-        __init__: Initializes a new instance of PingGeoHash with a specified threshold for geohash precision.
+        __init__: Initializes a new instance of PingGeoHash with a specified threshold for geohash precision, an
+                  optional no-copy mode and an optional time window.
         precision: Property that returns the current geohash precision of the collection.
         generate_precision: Determines the appropriate geohash precision based on a given threshold.
         put: Adds a Ping to the collection, possibly fusing it with an existing Ping based on geohash proximity.
         remove_duplicates: Helper method to remove duplicate Pings based on geohash keys.
         fuse: Implements the fusion of Ping objects based on geohash proximity.
+        fuse_batch: Implements the fusion of the rows of a columnar PingBatch based on geohash proximity.
         get: Retrieves a Ping object by its unique identifier.
+        remove: Removes a Ping object by its unique identifier.
+        insert: Stores a Ping under its geohash without fusing it.
+        pop_displaced: Returns the stale tracks replaced by pings in their cells, and forgets them.
     """
     geo_hash: dict[str, Ping]
+    _uids: dict[TrackId, str]
     _precision: int
+    _copy_results: bool
+    _time_window: int | None
+    _displaced: list[Ping]
     geo_hash_precisions: dict[int, range] = {
         2: range(constants.GEO_HASH_PRECISION_2_RESOLUTION, constants.GEO_HASH_PRECISION_1_RESOLUTION),  # precision 2
         3: range(constants.GEO_HASH_PRECISION_3_RESOLUTION, constants.GEO_HASH_PRECISION_2_RESOLUTION),  # precision 3
@@ -48,9 +65,17 @@ class PingGeoHash(FusibleCollection[Ping]):
     }
 
     # init: Initialize the PingGeoHash with a threshold and a fuser
-    def __init__(self, threshold: float):
+    # without copy_results a match holds the replaced track, which is never modified again, and the incoming ping
+    # with a time_window a ping only fuses with the track in its cell if their observation times are within the
+    # window, and otherwise takes the stale track's place, as a cell holds a single track, and the stale track is
+    # handed out by pop_displaced
+    def __init__(self, threshold: float, copy_results: bool = True, time_window: int | None = None):
         self.geo_hash = {}
+        self._uids = {}
         self._precision = self.generate_precision(threshold)
+        self._copy_results = copy_results
+        self._time_window = time_window
+        self._displaced = []
 
     # precision: Return the precision of the geohash
     @property
@@ -70,17 +95,39 @@ class PingGeoHash(FusibleCollection[Ping]):
     # put: Add a ping to the geohash or fuse it with an existing ping
     # it returns either a list of two pings if a match is found or a list of one ping if no match is found
     def put(self, ping: Ping) -> list[Ping]:
+        # pygeohash is imported on first use, so importing the tracker does not load it
+        import pygeohash as pgh
         geo_key = pgh.encode(ping.latitude, ping.longitude, precision=self._precision)
-        if geo_key in self.geo_hash:
-            match: list[Ping] = [copy(self.geo_hash[geo_key]), copy(ping)]
-            self.geo_hash[geo_key] = self.geo_hash[geo_key].merge(ping)
-            return match
+        track = self._cell_track(geo_key)
+        if track is not None and self._is_current(track, ping):
+            self._store_track(geo_key, track.merge(ping))
+            return [copy(track), copy(ping)] if self._copy_results else [track, ping]
         else:
-            self.geo_hash[geo_key] = ping
+            if track is not None:
+                self._displaced.append(track)
+            self._store_track(geo_key, ping)
             return [ping]
 
+    # _cell_track: Look up the track stored in a geohash cell, the only candidate a ping in that cell can fuse with
+    def _cell_track(self, geo_key: str) -> Ping | None:
+        return self.geo_hash.get(geo_key)
+
+    # _is_current: Check whether a track was observed within the time window of a ping
+    def _is_current(self, track: Ping, ping: Ping) -> bool:
+        return self._time_window is None or abs(track.observation_time - ping.observation_time) <= self._time_window
+
+    # _store_track: Store a track under a geohash key, replacing any previous track, and keep the uid index current
+    def _store_track(self, geo_key: str, ping: Ping):
+        previous = self.geo_hash.get(geo_key)
+        self.geo_hash[geo_key] = ping
+        if previous is not None and previous.track_id != ping.track_id:
+            if self._uids.get(previous.track_id) == geo_key:
+                del self._uids[previous.track_id]
+        self._uids.setdefault(ping.track_id, geo_key)
+
     def remove_duplicates(self, inputs: list[Ping]) -> list[Ping]:
-        temp_hash: PingGeoHash = PingGeoHash(self._precision)
+        # the matches of the temporary hash are discarded, so there is nothing to copy
+        temp_hash: PingGeoHash = PingGeoHash(self._precision, copy_results=False)
         for ping in inputs:
             temp_hash.put(ping)
         return list(temp_hash.geo_hash.values())
@@ -97,8 +144,100 @@ class PingGeoHash(FusibleCollection[Ping]):
                 unmatched.append(res[0])
         return matched, unmatched
 
-    def get(self, uid: str) -> Ping | None:
-        for ping in self.geo_hash.values():
-            if ping.track_id == uid:
-                return ping
-        return None
+    # fuse_batch: Fuse a columnar batch like fuse, returning row indexes instead of pings
+    def fuse_batch(self, batch: PingBatch) -> BatchFusion:
+        import pygeohash as pgh
+        # group duplicate rows exactly as remove_duplicates groups pings, tracking the earliest and newest row
+        dedup_precision = PingGeoHash(self._precision).precision
+        start_times = batch.start_times.tolist()
+        observation_times = batch.observation_times.tolist()
+        latitudes = batch.latitudes.tolist()
+        longitudes = batch.longitudes.tolist()
+        groups: dict[str, list[int]] = {}
+        parents: list[int] = []
+        for row in range(len(batch)):
+            geo_key = pgh.encode(latitudes[row], longitudes[row], precision=dedup_precision)
+            group = groups.get(geo_key)
+            if group is None:
+                groups[geo_key] = [row, row, row]
+                parents.append(row)
+                continue
+            if not start_times[group[1]] < start_times[row]:
+                group[1] = row
+            if not observation_times[group[2]] > observation_times[row]:
+                group[2] = row
+            parents.append(group[0])
+
+        matched_rows: list[int] = []
+        matched_track_ids: list[TrackId] = []
+        unmatched_rows: list[int] = []
+        reported: dict[int, int] = {}
+        for slot, earliest, newest in groups.values():
+            ping = batch.ping(earliest, newest)
+            geo_key = pgh.encode(ping.latitude, ping.longitude, precision=self._precision)
+            track = self._cell_track(geo_key)
+            if track is not None and self._is_current(track, ping):
+                matched_rows.append(earliest)
+                matched_track_ids.append(track.track_id)
+                self._store_track(geo_key, track.merge(ping))
+            else:
+                if track is not None:
+                    self._displaced.append(track)
+                unmatched_rows.append(earliest)
+                self._store_track(geo_key, ping)
+            reported[slot] = earliest
+        return BatchFusion(matched_rows, matched_track_ids, unmatched_rows, [reported[parent] for parent in parents])
+
+    def get(self, uid: TrackId) -> Ping | None:
+        geo_key = self._uids.get(uid)
+        return self.geo_hash[geo_key] if geo_key is not None else None
+
+    # remove: Remove the track with a given uid and return it
+    def remove(self, uid: TrackId) -> Ping | None:
+        geo_key = self._uids.pop(uid, None)
+        return self.geo_hash.pop(geo_key) if geo_key is not None else None
+
+    # pop_displaced: Return the stale tracks replaced by pings in their cells since the last call, and forget them
+    def pop_displaced(self) -> list[Ping]:
+        displaced, self._displaced = self._displaced, []
+        return displaced
+
+    def __len__(self) -> int:
+        return len(self.geo_hash)
+
+    def __iter__(self) -> Iterator[Ping]:
+        return iter(self.geo_hash.values())
+
+    # insert: Store a ping under its geohash without reporting a match, merging it with a track already in its cell
+    def insert(self, ping: Ping):
+        import pygeohash as pgh
+        geo_key = pgh.encode(ping.latitude, ping.longitude, precision=self._precision)
+        track = self.geo_hash.get(geo_key)
+        self._store_track(geo_key, track.merge(ping) if track is not None else ping)
+
+
+class PingNeighborGeoHash(PingGrid):
+    """
+    Geohash bucketed FusibleCollection for Ping objects that also searches the neighboring cells.
+
+    PingGeoHash only looks up the exact geohash cell of an incoming Ping, so two Pings a meter apart on either side
+    of a cell edge never fuse. PingNeighborGeoHash buckets tracks by geohash through a GeoHashIndex, probes the cell
+    of an incoming Ping and its 8 neighbors, and confirms each candidate with the real threshold distance from
+    Geo2dDistanceCalculator. Its matched/unmatched results are therefore the same as PingList's, at hash table speed.
+
+    Methods:
+        __init__: Initializes a new PingNeighborGeoHash with a specified threshold for fusion, an optional no-copy
+                  mode, an optional optimal assignment mode, optional motion prediction and an optional time window.
+        precision: Property that returns the geohash precision of the collection.
+    """
+    index: GeoHashIndex
+
+    def __init__(self, threshold: float, copy_results: bool = True, optimal_assignment: bool = False,
+                 motion_prediction: bool = False, time_window: int | None = None):
+        super().__init__(threshold, GeoHashIndex(threshold), copy_results, optimal_assignment, motion_prediction,
+                         time_window)
+
+    # precision: Return the precision of the geohash
+    @property
+    def precision(self) -> int:
+        return self.index.precision
@@ -0,0 +1,117 @@
+import heapq
+from collections.abc import Sequence
+
+from abstract import SpatialIndex
+from fusible_nearest_neighbor import PingList
+from ping import Ping
+from spatial_index import GridIndex
+
+# Stale speed heap entries are dropped once the heap holds this many entries per track, plus the minimum below,
+# which keeps the cost of compaction at O(1) per pushed entry
+SPEED_HEAP_SLACK = 2
+SPEED_HEAP_MINIMUM = 1024
+
+
+class PingGrid(PingList):
+    """
+    Nearest neighbor FusibleCollection for Ping objects backed by a spatial index.
+
+    PingGrid has the same matched/unmatched semantics as PingList: an incoming Ping is fused with the
+    closest stored track strictly within the threshold, ties going to the track that was stored first.
+    Instead of measuring the distance to every stored track, it asks a SpatialIndex for the handful of
+    tracks that could be within the threshold and only measures those, so a lookup costs time
+    proportional to the local track density rather than to the size of the collection. The index is
+    kept up to date as `put` stores tracks and merges them, and as `remove` drops them. With motion prediction,
+    tracks stay indexed at their last observed positions, and a lookup widens the index query by the furthest any
+    track can have moved within the time window, at the fastest speed of the stored tracks, before predicting the
+    positions of the candidates alone. Nothing is moved in the index as time advances.
+
+    Attributes:
+        index (SpatialIndex): Spatial index from track positions to indexes in `_tracks`.
+        _speeds (list[tuple[float, int]]): Max-heap of the negated speed, in degrees of latitude plus longitude per
+                                           unit of observation time, and index of the stored tracks, kept only with
+                                           motion prediction. Entries left behind by merges and removals are
+                                           skipped lazily, and compacted once the heap holds SPEED_HEAP_SLACK
+                                           entries per track.
+
+    Methods:
+        __init__: Initializes a new PingGrid with a threshold, an optional spatial index, an optional no-copy mode,
+                  an optional optimal assignment mode, optional motion prediction and an optional time window.
+        get_closest_track_index: Finds the index of the stored track closest to a given Ping.
+    """
+    index: SpatialIndex
+    _speeds: list[tuple[float, int]]
+
+    def __init__(self, threshold: float, index: SpatialIndex | None = None, copy_results: bool = True,
+                 optimal_assignment: bool = False, motion_prediction: bool = False, time_window: int | None = None):
+        if motion_prediction and time_window is None:
+            raise ValueError("Motion prediction in a PingGrid needs a time window to bound how far a track can move")
+        super().__init__(threshold, copy_results=copy_results, optimal_assignment=optimal_assignment,
+                         motion_prediction=motion_prediction, time_window=time_window)
+        self.index = index if index is not None else GridIndex(threshold)
+        self._speeds = []
+
+    # _append_track: Store a new track and add it to the spatial index
+    def _append_track(self, ping: Ping):
+        self.index.insert(len(self._tracks), (ping.latitude, ping.longitude))
+        super()._append_track(ping)
+        self._push_speed(len(self._tracks) - 1)
+
+    # _replace_track: Replace the track at an index with its merged state and move it in the spatial index
+    def _replace_track(self, i: int, ping: Ping):
+        track = self._tracks[i]
+        self.index.move(i, (track.latitude, track.longitude), (ping.latitude, ping.longitude))
+        super()._replace_track(i, ping)
+        self._push_speed(i)
+
+    # _remove_track: Remove the track at an index from the spatial index, along with the key of the track moved into it
+    def _remove_track(self, i: int) -> Ping:
+        track = self._tracks[i]
+        self.index.remove(i, (track.latitude, track.longitude))
+        last = len(self._tracks) - 1
+        if i != last:
+            moved = (self._tracks[last].latitude, self._tracks[last].longitude)
+            self.index.remove(last, moved)
+            self.index.insert(i, moved)
+        removed = super()._remove_track(i)
+        if i != last:
+            self._push_speed(i)
+        return removed
+
+    # _push_speed: Record the speed of the track at an index in the speed heap, compacting the heap when needed
+    def _push_speed(self, i: int):
+        if not self._motion_prediction:
+            return
+        speed = _speed(self._tracks[i])
+        if speed:
+            heapq.heappush(self._speeds, (-speed, i))
+        if len(self._speeds) > SPEED_HEAP_SLACK * len(self._tracks) + SPEED_HEAP_MINIMUM:
+            self._speeds = [(-speed, i) for i, speed in enumerate(map(_speed, self._tracks)) if speed]
+            heapq.heapify(self._speeds)
+
+    # _reach: Get the central angle in degrees any stored track can move away from its last position within a time
+    def _reach(self, elapsed: int) -> float:
+        while self._speeds:
+            speed, i = self._speeds[0]
+            if i < len(self._tracks) and _speed(self._tracks[i]) == -speed:
+                return -speed * elapsed
+            heapq.heappop(self._speeds)
+        return 0.0
+
+    # get_closest_track_index: Get the index of the closest stored track among the spatial index candidates
+    def get_closest_track_index(self, new_ping: Ping) -> int | None:
+        return self._closest_candidate(self._candidates(new_ping), new_ping)
+
+    # _candidates: Get the spatial index candidates of a ping, keeping only the current ones with a time window
+    def _candidates(self, new_ping: Ping) -> Sequence[int]:
+        point = (new_ping.latitude, new_ping.longitude)
+        if self._time_window is None:
+            return self.index.query(point)
+        margin = self._reach(self._time_window) if self._motion_prediction else 0.0
+        candidates = self.index.query(point, margin)
+        return [i for i in candidates if self._is_current(i, new_ping)]
+
+
+# _speed: Get a bound on the central angle in degrees a ping moves per unit of observation time
+def _speed(ping: Ping) -> float:
+    return abs(ping.latitude_rate) + abs(ping.longitude_rate)
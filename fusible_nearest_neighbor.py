@@ -1,9 +1,14 @@
+from collections.abc import Iterable, Iterator, Sequence
 from copy import copy
 
-from mypy.checker import Union
+import numpy as np
 
-from abstract import DistanceCalculator2d, FusibleCollection
+from abstract import DistanceCalculator2d, FusibleCollection, TrackId
+from assignment import solve_sparse_assignment
+from deduplicator import PingDeduplicator
 from ping import Ping
+from ping_batch import PingBatch, BatchFusion
+from time_index import TimeBucketIndex
 from tracker_base import Geo2dDistanceCalculator
 
 
@@ -17,40 +22,116 @@ class PingList(FusibleCollection[Ping]):
 
     Attributes:
         _tracks (list[Ping]): List of Ping objects being managed.
+        _uids (dict[TrackId, int]): Index from track_id to the position of the track in `_tracks`.
         _threshold (float): Threshold distance for determining when two Pings should be fused.
         distancer (DistanceCalculator2d): Distance calculator for comparing the distances between Ping objects.
+        deduplicator (PingDeduplicator): Merges near-duplicate Pings within a batch before they are fused.
+        _vectorized (bool): Whether nearest track lookups score all tracks in a single vectorized call.
+        _latitudes (np.ndarray): Latitudes of the stored tracks, kept only when vectorized.
+        _longitudes (np.ndarray): Longitudes of the stored tracks, kept only when vectorized.
+        _latitude_rates (np.ndarray): Latitude rates of the stored tracks, kept only when vectorized with motion
+                                      prediction.
+        _longitude_rates (np.ndarray): Longitude rates of the stored tracks, kept only when vectorized with motion
+                                       prediction.
+        _observation_times (np.ndarray): Observation times of the stored tracks, kept only when vectorized with
+                                         motion prediction.
+        _copy_results (bool): Whether `put` and `fuse` return copies of the pings instead of the pings themselves.
+        _optimal_assignment (bool): Whether `fuse` assigns the whole batch at once instead of greedily in input order.
+        _motion_prediction (bool): Whether pings are gated against the predicted positions of moving tracks.
+        _time_window (int | None): The largest observation time difference of a ping and a track it can fuse with.
+        _time_index (TimeBucketIndex | None): Index of the stored tracks by observation time, kept only with a window.
 
     Methods:
-        __init__: Initializes a new PingList with a specified threshold for fusion.
+        __init__: Initializes a new PingList with a specified threshold for fusion, an optional batch path, an
+                  optional no-copy mode, an optional optimal assignment mode, optional motion prediction and an
+                  optional time window.
         put: Adds a Ping to the list or fuses it with an existing Ping based on proximity.
         fuse: Fuses Ping objects in the given list based on geographic proximity.
+        fuse_batch: Fuses the rows of a columnar PingBatch based on geographic proximity.
         get: Retrieves a Ping object by its unique identifier.
+        remove: Removes a Ping object by its unique identifier.
         remove_duplicates: Removes duplicate Ping objects from the list based on proximity.
         get_closest_ping_index: Finds the index of the Ping closest to a given Ping.
+        get_closest_track_index: Finds the index of the stored track closest to a given Ping.
+        get_closest_track: Finds the stored track closest to a given Ping and its distance.
+        get_track_distances: Finds the stored tracks within the threshold of a given Ping and their distances.
+        insert: Stores a Ping as a new track without fusing it.
     """
     _tracks: list[Ping]
+    _uids: dict[TrackId, int]
     _threshold: float
     distancer: DistanceCalculator2d
+    deduplicator: PingDeduplicator
+    _vectorized: bool
+    _latitudes: np.ndarray
+    _longitudes: np.ndarray
+    _latitude_rates: np.ndarray
+    _longitude_rates: np.ndarray
+    _observation_times: np.ndarray
+    _copy_results: bool
+    _optimal_assignment: bool
+    _motion_prediction: bool
+    _time_window: int | None
+    _time_index: TimeBucketIndex | None
 
-    def __init__(self, threshold: float):
+    def __init__(self, threshold: float, vectorized: bool = False, copy_results: bool = True,
+                 optimal_assignment: bool = False, motion_prediction: bool = False, time_window: int | None = None):
+        """
+        Initializes a new PingList.
+
+        Parameters:
+            threshold (float): Threshold distance for determining when two Pings should be fused.
+            vectorized (bool): Whether nearest track lookups score all tracks in a single vectorized call.
+            copy_results (bool): Whether matched and unmatched results are copies of the pings. When False, a matched
+                                 pair holds the track as it was before the merge, which fusion never modifies as it
+                                 replaces tracks with new merged Pings, and the incoming Ping itself, and an unmatched
+                                 result is the stored track itself, so later callsign assignments show through it.
+            optimal_assignment (bool): Whether `fuse` matches the deduplicated batch to the stored tracks with the
+                                       assignment of least total distance, in which leaving a ping unmatched costs
+                                       the threshold, instead of matching each ping in input order to its
+                                       closest free track.
+            motion_prediction (bool): Whether a ping is compared with where each track is predicted to be at the
+                                      ping's observation time, from the velocity estimated by its merges, instead
+                                      of where it was last observed. A fast mover then stays within a tight
+                                      threshold from one observation to the next.
+            time_window (int | None): The largest difference of observation times at which a ping can still fuse
+                                      with a track, or None to ignore time. With a window, tracks are also indexed
+                                      by observation time, so stale tracks are never measured.
+        """
         self._threshold = threshold
         self._tracks = []
-        self.distancer = Geo2dDistanceCalculator(threshold)
+        self._uids = {}
+        # distances are only ever compared against the threshold, so far pairs can be rejected without measuring them
+        self.distancer = Geo2dDistanceCalculator(threshold, prefilter=True)
+        self.deduplicator = PingDeduplicator(threshold, self.distancer)
+        self._vectorized = vectorized
+        self._latitudes = np.empty(0)
+        self._longitudes = np.empty(0)
+        self._latitude_rates = np.empty(0)
+        self._longitude_rates = np.empty(0)
+        self._observation_times = np.empty(0, dtype=np.int64)
+        self._copy_results = copy_results
+        self._optimal_assignment = optimal_assignment
+        self._motion_prediction = motion_prediction
+        self._time_window = time_window
+        self._time_index = TimeBucketIndex(time_window) if time_window is not None else None
 
     def put(self, ping: Ping) -> list[Ping]:
-        closest_ping_index = self.get_closest_ping_index(self._tracks, ping)
+        closest_ping_index = self.get_closest_track_index(ping)
         if closest_ping_index is not None:
-            matched = [copy(self._tracks[closest_ping_index]), copy(ping)]
-            self._tracks[closest_ping_index] = self._tracks[closest_ping_index].merge(ping)
-            return matched
+            track = self._tracks[closest_ping_index]
+            self._replace_track(closest_ping_index, track.merge(ping, self._motion_prediction))
+            return [copy(track), copy(ping)] if self._copy_results else [track, ping]
         else:
-            self._tracks.append(ping)
-            return [copy(ping)]
+            self._append_track(ping)
+            return [copy(ping)] if self._copy_results else [ping]
 
     def fuse(self, object_list: list[Ping]) -> tuple[list[tuple[Ping, Ping]], list[Ping]]:
         sanitized: list[Ping] = self.remove_duplicates(object_list)
+        if self._optimal_assignment:
+            return self._fuse_assigned(sanitized)
         matched: list[tuple[Ping, Ping]] = []
-        already_matched: set[str] = set()
+        already_matched: set[TrackId] = set()
         unmatched: list[Ping] = []
         for i in range(0, len(sanitized)):
             # check the matches to see if we have already matched this ping
@@ -59,38 +140,307 @@ class PingList(FusibleCollection[Ping]):
 
             res = self.put(sanitized[i])
             if len(res) > 1:
-                matched.append((copy(res[0]), copy(res[1])))
+                # put has already copied the pair when copies are wanted
+                matched.append((res[0], res[1]))
                 already_matched.add(res[0].track_id)
                 already_matched.add(res[1].track_id)
             else:
                 unmatched.append(res[0])
         return matched, unmatched
 
+    # _fuse_assigned: Fuse deduplicated pings with the stored tracks through a minimum total distance assignment
+    def _fuse_assigned(self, sanitized: list[Ping]) -> tuple[list[tuple[Ping, Ping]], list[Ping]]:
+        matched: list[tuple[Ping, Ping]] = []
+        unmatched: list[Ping] = []
+        for i, track in self._assign_tracks(sanitized):
+            ping = sanitized[i]
+            if track is not None:
+                matched.append((copy(track), copy(ping)) if self._copy_results else (track, ping))
+            else:
+                unmatched.append(copy(ping) if self._copy_results else ping)
+        return matched, unmatched
+
+    # _assign_tracks: Merge deduplicated pings into the stored tracks through a minimum total distance assignment
+    def _assign_tracks(self, sanitized: list[Ping]) -> list[tuple[int, Ping | None]]:
+        """
+        Merge pings into the stored tracks so that the total distance of the merged pairs is minimal.
+
+        Parameters:
+            sanitized (list[Ping]): The deduplicated pings.
+
+        Returns:
+            list[tuple[int, Ping | None]]: The index of every fused ping in the order it was fused, with the track it
+                                           was merged into as it was before the merge, or None if it started a new
+                                           track. Pings of a track already matched in the batch are left out.
+        """
+        edges = [(i, track_index, distance) for i, ping in enumerate(sanitized)
+                 for track_index, distance in self.get_track_distances(ping)]
+        assignment = solve_sparse_assignment(edges, self._threshold)
+        fused: list[tuple[int, Ping | None]] = []
+        already_matched: set[TrackId] = set()
+        for i, ping in enumerate(sanitized):
+            track_index = assignment.get(i)
+            if track_index is not None:
+                # every track is assigned at most one ping, so the tracks can be merged as they are read
+                track = self._tracks[track_index]
+                self._replace_track(track_index, track.merge(ping, self._motion_prediction))
+                fused.append((i, track))
+                already_matched.add(track.track_id)
+                already_matched.add(ping.track_id)
+        first_new_track = len(self._tracks)
+        for i, ping in enumerate(sanitized):
+            if i in assignment or ping.track_id in already_matched:
+                continue
+            # like greedy fusion, a ping left unassigned can still fuse with a track started earlier in the batch
+            new_tracks = [(distance, track_index) for track_index, distance in self.get_track_distances(ping)
+                          if track_index >= first_new_track]
+            if new_tracks:
+                track_index = min(new_tracks)[1]
+                track = self._tracks[track_index]
+                self._replace_track(track_index, track.merge(ping, self._motion_prediction))
+                fused.append((i, track))
+                already_matched.add(track.track_id)
+                already_matched.add(ping.track_id)
+            else:
+                self._append_track(ping)
+                fused.append((i, None))
+        return fused
+
+    # fuse_batch: Fuse a columnar batch like fuse, returning row indexes instead of copied pings
+    def fuse_batch(self, batch: PingBatch) -> BatchFusion:
+        slots, earliest, newest, parents = self.deduplicator.cluster_batch(batch)
+        matched_rows: list[int] = []
+        matched_track_ids: list[TrackId] = []
+        unmatched_rows: list[int] = []
+        reported: dict[int, int] = {}
+        # only the merged result of each group of rows is ever materialized, as it may become a track
+        if self._optimal_assignment:
+            pings = [batch.ping(earliest[slot], newest[slot]) for slot in slots]
+            for i, track in self._assign_tracks(pings):
+                slot = slots[i]
+                if track is not None:
+                    matched_rows.append(earliest[slot])
+                    matched_track_ids.append(track.track_id)
+                else:
+                    unmatched_rows.append(earliest[slot])
+                reported[slot] = earliest[slot]
+        else:
+            already_matched: set[TrackId] = set()
+            for slot in slots:
+                ping = batch.ping(earliest[slot], newest[slot])
+                if ping.track_id in already_matched:
+                    continue
+
+                closest_ping_index = self.get_closest_track_index(ping)
+                if closest_ping_index is not None:
+                    track = self._tracks[closest_ping_index]
+                    matched_rows.append(earliest[slot])
+                    matched_track_ids.append(track.track_id)
+                    already_matched.add(track.track_id)
+                    already_matched.add(ping.track_id)
+                    self._replace_track(closest_ping_index, track.merge(ping, self._motion_prediction))
+                else:
+                    unmatched_rows.append(earliest[slot])
+                    self._append_track(ping)
+                reported[slot] = earliest[slot]
+        representatives = [reported.get(parents[row], -1) for row in range(len(batch))]
+        return BatchFusion(matched_rows, matched_track_ids, unmatched_rows, representatives)
+
     # get: Get a ping with a given uid
-    def get(self, uid: str) -> Ping | None:
-        for ping in self._tracks:
-            if ping.track_id == uid:
-                return ping
-        return None
+    def get(self, uid: TrackId) -> Ping | None:
+        i = self._uids.get(uid)
+        return self._tracks[i] if i is not None else None
+
+    # remove: Remove the track with a given uid and return it
+    def remove(self, uid: TrackId) -> Ping | None:
+        i = self._uids.get(uid)
+        return self._remove_track(i) if i is not None else None
 
-    # remove_duplicates: Remove pings in the same range from a list of pings recursively
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def __iter__(self) -> Iterator[Ping]:
+        return iter(self._tracks)
+
+    # remove_duplicates: Merge pings in the same range from a list of pings
     def remove_duplicates(self, inputs: list[Ping]) -> list[Ping]:
-        for i in range(len(inputs)):
-            for j in range(i + 1, len(inputs)):
-                if self.distancer.calculate((inputs[i].latitude, inputs[i].longitude),
-                                            (inputs[j].latitude, inputs[j].longitude)) < self._threshold:
-                    inputs[i] = inputs[i].merge(inputs[j])
-                    inputs.pop(j)
-                    return self.remove_duplicates(inputs)
-        return inputs
+        return self.deduplicator.remove_duplicates(inputs)
 
     # get_closest_ping_index: Get the index of the closest ping in a list of pings
     def get_closest_ping_index(self, ping_list: list[Ping], new_ping: Ping) -> int | None:
-        closest_ping: Union[int, None] = None
-        closest_dist: float = self._threshold
+        closest_ping: int | None = None
+        # only the order of the distances matters, so compare them on the distancer's cheapest monotonic scale
+        closest_dist: float = self.distancer.compare_threshold(self._threshold)
+        point = (new_ping.latitude, new_ping.longitude)
         for i, ping in enumerate(ping_list):
-            dist = self.distancer.calculate((ping.latitude, ping.longitude), (new_ping.latitude, new_ping.longitude))
+            dist = self.distancer.compare(self._predicted(ping, new_ping.observation_time), point)
             if dist < closest_dist:
                 closest_dist = dist
                 closest_ping = i
         return closest_ping
+
+    # get_closest_track_index: Get the index of the closest stored track, scoring every track in one call if vectorized
+    def get_closest_track_index(self, new_ping: Ping) -> int | None:
+        if not self._vectorized:
+            if self._time_index is None:
+                return self.get_closest_ping_index(self._tracks, new_ping)
+            return self._closest_candidate(self._candidates(new_ping), new_ping)
+        rows, distances = self._measure_many(new_ping)
+        if len(rows) == 0:
+            return None
+        closest_ping = int(np.argmin(distances))
+        return rows[closest_ping] if distances[closest_ping] < self._threshold else None
+
+    # get_closest_track: Get the closest stored track within the threshold of a ping and its distance to the ping
+    def get_closest_track(self, new_ping: Ping) -> tuple[Ping, float] | None:
+        closest_ping_index = self.get_closest_track_index(new_ping)
+        if closest_ping_index is None:
+            return None
+        track = self._tracks[closest_ping_index]
+        return track, self.distancer.calculate(self._predicted(track, new_ping.observation_time),
+                                               (new_ping.latitude, new_ping.longitude))
+
+    # get_track_distances: Get the index and distance of every stored track within the threshold of a ping
+    def get_track_distances(self, new_ping: Ping) -> list[tuple[int, float]]:
+        if self._vectorized:
+            rows, distances = self._measure_many(new_ping)
+            close = np.flatnonzero(distances < self._threshold)
+            return [(rows[i], float(distances[i])) for i in map(int, close)]
+        return self._measure_tracks(self._candidates(new_ping), new_ping)
+
+    # _candidates: Get the indexes of the stored tracks a ping may fuse with, in ascending order
+    def _candidates(self, new_ping: Ping) -> Sequence[int]:
+        if self._time_index is None:
+            return range(len(self._tracks))
+        return sorted(i for i in self._time_index.query(new_ping.observation_time) if self._is_current(i, new_ping))
+
+    # _is_current: Check whether the track at an index was observed within the time window of a ping
+    def _is_current(self, i: int, new_ping: Ping) -> bool:
+        return self._time_window is None or \
+            abs(self._tracks[i].observation_time - new_ping.observation_time) <= self._time_window
+
+    # _closest_candidate: Get the index of the closest candidate track within the threshold, ties going to the first
+    def _closest_candidate(self, candidates: Iterable[int], new_ping: Ping) -> int | None:
+        point = (new_ping.latitude, new_ping.longitude)
+        closest_track: int | None = None
+        closest_dist: float = self.distancer.compare_threshold(self._threshold)
+        for i in candidates:
+            dist = self.distancer.compare(self._predicted(self._tracks[i], new_ping.observation_time), point)
+            if dist < closest_dist or (dist == closest_dist and closest_track is not None and i < closest_track):
+                closest_dist = dist
+                closest_track = i
+        return closest_track
+
+    # _measure_many: Measure a ping against its candidate tracks in one vectorized call, returning the rows measured
+    def _measure_many(self, new_ping: Ping) -> tuple[Sequence[int], np.ndarray]:
+        if self._time_index is None:
+            rows: Sequence[int] = range(len(self._tracks))
+            indexes: slice | np.ndarray = slice(0, len(rows))
+        else:
+            rows = self._candidates(new_ping)
+            indexes = np.array(rows, dtype=np.intp)
+        if len(rows) == 0:
+            return rows, np.empty(0)
+        if self._motion_prediction:
+            latitudes, longitudes = self._predict_many(indexes, new_ping.observation_time)
+        else:
+            latitudes, longitudes = self._latitudes[indexes], self._longitudes[indexes]
+        point = (new_ping.latitude, new_ping.longitude)
+        return rows, np.asarray(self.distancer.calculate_many(point, latitudes, longitudes))
+
+    # _predict_many: Get the positions of the stored tracks at some indexes predicted at a time, like Ping.predict
+    def _predict_many(self, indexes: slice | np.ndarray, observation_time: int) -> tuple[np.ndarray, np.ndarray]:
+        latitudes, longitudes = self._latitudes[indexes], self._longitudes[indexes]
+        latitude_rates, longitude_rates = self._latitude_rates[indexes], self._longitude_rates[indexes]
+        moving = (latitude_rates != 0.0) | (longitude_rates != 0.0)
+        if not moving.any():
+            return latitudes, longitudes
+        elapsed = observation_time - self._observation_times[indexes]
+        predicted_latitudes = np.clip(latitudes + latitude_rates * elapsed, -90.0, 90.0)
+        predicted_longitudes = (longitudes + longitude_rates * elapsed + 180.0) % 360.0 - 180.0
+        return np.where(moving, predicted_latitudes, latitudes), np.where(moving, predicted_longitudes, longitudes)
+
+    # _measure_tracks: Get the index and distance of every given track that lies within the threshold of a ping
+    def _measure_tracks(self, track_indexes: Iterable[int], new_ping: Ping) -> list[tuple[int, float]]:
+        point = (new_ping.latitude, new_ping.longitude)
+        close: list[tuple[int, float]] = []
+        for i in track_indexes:
+            distance = self.distancer.calculate(self._predicted(self._tracks[i], new_ping.observation_time), point)
+            if distance < self._threshold:
+                close.append((i, distance))
+        return close
+
+    # insert: Store a ping as a new track without fusing it, e.g. a track handed over by another collection
+    def insert(self, ping: Ping):
+        self._append_track(ping)
+
+    # _predicted: Get the position a stored track is compared at with a ping observed at a given time
+    def _predicted(self, track: Ping, observation_time: int) -> tuple[float, float]:
+        if self._motion_prediction:
+            return track.predict(observation_time)
+        return track.latitude, track.longitude
+
+    # _append_track: Store a new track at the end of the list and index it
+    def _append_track(self, ping: Ping):
+        self._tracks.append(ping)
+        self._uids.setdefault(ping.track_id, len(self._tracks) - 1)
+        if self._time_index is not None:
+            self._time_index.insert(len(self._tracks) - 1, ping.observation_time)
+        if self._vectorized:
+            self._set_coordinates(len(self._tracks) - 1, ping)
+
+    # _replace_track: Replace the track at an index with its merged state and keep the indexes current
+    def _replace_track(self, i: int, ping: Ping):
+        previous = self._tracks[i]
+        if self._time_index is not None:
+            self._time_index.move(i, previous.observation_time, ping.observation_time)
+        previous_uid = previous.track_id
+        self._tracks[i] = ping
+        if previous_uid != ping.track_id:
+            if self._uids.get(previous_uid) == i:
+                del self._uids[previous_uid]
+            self._uids.setdefault(ping.track_id, i)
+        if self._vectorized:
+            self._set_coordinates(i, ping)
+
+    # _remove_track: Remove the track at an index by moving the last track into its place, so no other index shifts
+    def _remove_track(self, i: int) -> Ping:
+        track = self._tracks[i]
+        if self._uids.get(track.track_id) == i:
+            del self._uids[track.track_id]
+        if self._time_index is not None:
+            self._time_index.remove(i, track.observation_time)
+            if i != len(self._tracks) - 1:
+                moved = self._tracks[-1].observation_time
+                self._time_index.remove(len(self._tracks) - 1, moved)
+                self._time_index.insert(i, moved)
+        last = self._tracks.pop()
+        if i < len(self._tracks):
+            self._tracks[i] = last
+            if self._uids.get(last.track_id) == len(self._tracks):
+                self._uids[last.track_id] = i
+            if self._vectorized:
+                self._set_coordinates(i, last)
+        return track
+
+    # _set_coordinates: Store the coordinates of the track at an index, growing the coordinate arrays as needed
+    def _set_coordinates(self, i: int, ping: Ping):
+        if i >= len(self._latitudes):
+            capacity = max(16, 2 * len(self._latitudes))
+            self._latitudes = _grow(self._latitudes, capacity)
+            self._longitudes = _grow(self._longitudes, capacity)
+            if self._motion_prediction:
+                self._latitude_rates = _grow(self._latitude_rates, capacity)
+                self._longitude_rates = _grow(self._longitude_rates, capacity)
+                self._observation_times = _grow(self._observation_times, capacity)
+        self._latitudes[i] = ping.latitude
+        self._longitudes[i] = ping.longitude
+        if self._motion_prediction:
+            self._latitude_rates[i] = ping.latitude_rate
+            self._longitude_rates[i] = ping.longitude_rate
+            self._observation_times[i] = ping.observation_time
+
+
+# _grow: Return an array extended with uninitialized entries to a capacity
+def _grow(array: np.ndarray, capacity: int) -> np.ndarray:
+    return np.concatenate((array, np.empty(capacity - len(array), dtype=array.dtype)))
@@ -1,10 +1,21 @@
+import math
+from functools import cache
+
 import constants
 
-from geopy.distance import geodesic, great_circle
+import numpy as np
 
 from abstract import Point2d
 
 
+# wgs84_kilometers: Return the WGS-84 ellipsoid in kilometers, as geopy's geodesic measures it, so that distances agree
+# with geopy to the bit. geographiclib is only imported the first time a geodesic distance is measured.
+@cache
+def wgs84_kilometers():
+    from geographiclib.geodesic import Geodesic
+    return Geodesic(constants.WGS84_SEMI_MAJOR_AXIS_KILOMETERS, constants.WGS84_FLATTENING)
+
+
 def geodesic_distance(p1: Point2d, p2: Point2d) -> float:
     """
     Calculate the geodesic distance between two points on the Earth's surface.
@@ -15,8 +26,14 @@ def geodesic_distance(p1: Point2d, p2: Point2d) -> float:
 
     Returns:
         float: The distance between the two points in meters.
+
+    Karney's algorithm is run directly through geographiclib, exactly as geopy's `geodesic` runs it, without
+    constructing geopy Point and Distance objects on every call.
     """
-    return geodesic(p1, p2).meters
+    lat1, lon1 = _normalize_point(p1)
+    lat2, lon2 = _normalize_point(p2)
+    ellipsoid = wgs84_kilometers()
+    return ellipsoid.Inverse(lat1, lon1, lat2, lon2, ellipsoid.DISTANCE)["s12"] * 1000
 
 
 def euclidean_distance(p1: Point2d, p2: Point2d) -> float:
@@ -41,6 +58,65 @@ def euclidean_distance(p1: Point2d, p2: Point2d) -> float:
     return distance_deg * constants.DEGREES_TO_METERS
 
 
+# euclidean_squared_degrees: Calculate the squared flat distance between two points in squared degrees
+def euclidean_squared_degrees(p1: Point2d, p2: Point2d) -> float:
+    """
+    Calculate the squared Euclidean distance between two points in squared degrees.
+
+    This is `euclidean_distance` without the square root and the conversion to meters. It orders pairs of
+    points the same way, which is all a comparison against a threshold needs.
+
+    Parameters:
+        p1 (tuple[float, float]): The first point as a (latitude, longitude) tuple.
+        p2 (tuple[float, float]): The second point as a (latitude, longitude) tuple.
+
+    Returns:
+        float: The squared distance between the two points in squared degrees.
+    """
+    lat_delta = p1[0] - p2[0]
+    lon_delta = p1[1] - p2[1]
+    return lat_delta * lat_delta + lon_delta * lon_delta
+
+
+# local_tangent_plane_distance: Calculate the flat distance between two points with converging meridians in meters
+def local_tangent_plane_distance(p1: Point2d, p2: Point2d) -> float:
+    """
+    Calculate the distance between two points on the plane tangent to the Earth at their mean latitude.
+
+    Note: Like `euclidean_distance` this is only suitable for short distances, but it scales the longitude
+    delta by the cosine of the mean latitude, so it does not overstate east-west distances away from the
+    equator. The longitude delta is measured across the antimeridian when that is shorter.
+
+    Parameters:
+        p1 (tuple[float, float]): The first point as a (latitude, longitude) tuple.
+        p2 (tuple[float, float]): The second point as a (latitude, longitude) tuple.
+
+    Returns:
+        float: The distance between the two points in meters, assuming each degree of latitude is
+               approximately 111,139 meters.
+    """
+    return local_tangent_plane_squared_degrees(p1, p2) ** 0.5 * constants.DEGREES_TO_METERS
+
+
+# local_tangent_plane_squared_degrees: Calculate the squared local tangent plane distance in squared degrees
+def local_tangent_plane_squared_degrees(p1: Point2d, p2: Point2d) -> float:
+    """
+    Calculate the squared local tangent plane distance between two points in squared degrees of latitude.
+
+    Parameters:
+        p1 (tuple[float, float]): The first point as a (latitude, longitude) tuple.
+        p2 (tuple[float, float]): The second point as a (latitude, longitude) tuple.
+
+    Returns:
+        float: The squared distance between the two points, see `local_tangent_plane_distance`.
+    """
+    lat1, lon1 = p1
+    lat2, lon2 = p2
+    lat_delta = lat1 - lat2
+    lon_delta = ((lon1 - lon2 + 180.0) % 360.0 - 180.0) * math.cos(math.radians((lat1 + lat2) / 2))
+    return lat_delta * lat_delta + lon_delta * lon_delta
+
+
 # great_circle_distance: Calculate the great circle distance between two points and return the distance in meters
 def great_circle_distance(p1: Point2d, p2: Point2d) -> float:
     """
@@ -52,5 +128,222 @@ def great_circle_distance(p1: Point2d, p2: Point2d) -> float:
 
     Returns:
         float: The great circle distance between the two points in meters.
+
+    This is the formula of geopy's `great_circle`, evaluated in the same order so that the results agree to the
+    bit, without constructing geopy Point and Distance objects on every call.
+    """
+    lat1, lng1 = _normalize_point(p1)
+    lat2, lng2 = _normalize_point(p2)
+    lat1, lng1, lat2, lng2 = math.radians(lat1), math.radians(lng1), math.radians(lat2), math.radians(lng2)
+    sin_lat1, cos_lat1 = math.sin(lat1), math.cos(lat1)
+    sin_lat2, cos_lat2 = math.sin(lat2), math.cos(lat2)
+    delta_lng = lng2 - lng1
+    cos_delta_lng, sin_delta_lng = math.cos(delta_lng), math.sin(delta_lng)
+
+    d = math.atan2(math.sqrt((cos_lat2 * sin_delta_lng) ** 2 +
+                             (cos_lat1 * sin_lat2 - sin_lat1 * cos_lat2 * cos_delta_lng) ** 2),
+                   sin_lat1 * sin_lat2 + cos_lat1 * cos_lat2 * cos_delta_lng)
+    return constants.EARTH_RADIUS_KILOMETERS * d * 1000
+
+
+# _normalize_point: Validate a (latitude, longitude) point and wrap its longitude the way geopy's Point does
+def _normalize_point(point: Point2d) -> Point2d:
+    latitude, longitude = float(point[0]), float(point[1])
+    if not (math.isfinite(latitude) and math.isfinite(longitude)):
+        raise ValueError(f"Point coordinates must be finite. {point!r} has been passed as coordinates.")
+    if abs(latitude) > 90:
+        raise ValueError("Latitude must be in the [-90; 90] range.")
+    if abs(longitude) > 180:
+        longitude = math.fmod(longitude, 360.0) or 0.0
+        if longitude < -180.0:
+            longitude += 360.0
+        elif longitude >= 180.0:
+            longitude -= 360.0
+    return latitude, longitude
+
+
+# Batch distances
+#
+# The functions below are vectorized counterparts of the scalar functions above. The one-to-many versions
+# measure from a single point to every point in a pair of latitude/longitude arrays, the many-to-many
+# versions return a (len(latitudes1), len(longitudes2)) matrix. All of them return distances in meters and
+# agree with their scalar counterpart within the following tolerances:
+#   euclidean_distances:     1e-6 meters, the same formula evaluated with NumPy
+#   local_tangent_plane_distances: 1e-6 meters, the same formula evaluated with NumPy
+#   great_circle_distances:  1e-6 meters, the same formula as geopy's great_circle evaluated with NumPy
+#   geodesic_distances:      1e-3 meters, Vincenty's inverse formula on WGS-84 instead of Karney's algorithm;
+#                            the rare nearly antipodal pairs where it does not converge fall back to geodesic
+VINCENTY_MAX_ITERATIONS = 200
+VINCENTY_CONVERGENCE = 1e-12
+
+
+def euclidean_distances(p1: Point2d, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Calculate the Euclidean distance from one point to many points.
+
+    Parameters:
+        p1 (tuple[float, float]): The point to measure from as a (latitude, longitude) tuple.
+        latitudes (np.ndarray): The latitudes of the points to measure to.
+        longitudes (np.ndarray): The longitudes of the points to measure to.
+
+    Returns:
+        np.ndarray: The Euclidean distance to each point in meters, see `euclidean_distance`.
+    """
+    return _euclidean_kernel(p1[0], p1[1], np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float))
+
+
+def local_tangent_plane_distances(p1: Point2d, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
     """
-    return great_circle(p1, p2).meters
+    Calculate the local tangent plane distance from one point to many points.
+
+    Parameters:
+        p1 (tuple[float, float]): The point to measure from as a (latitude, longitude) tuple.
+        latitudes (np.ndarray): The latitudes of the points to measure to.
+        longitudes (np.ndarray): The longitudes of the points to measure to.
+
+    Returns:
+        np.ndarray: The distance to each point in meters, see `local_tangent_plane_distance`.
+    """
+    return _local_tangent_plane_kernel(p1[0], p1[1], np.asarray(latitudes, dtype=float),
+                                       np.asarray(longitudes, dtype=float))
+
+
+def great_circle_distances(p1: Point2d, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Calculate the great circle distance from one point to many points.
+
+    Parameters:
+        p1 (tuple[float, float]): The point to measure from as a (latitude, longitude) tuple.
+        latitudes (np.ndarray): The latitudes of the points to measure to.
+        longitudes (np.ndarray): The longitudes of the points to measure to.
+
+    Returns:
+        np.ndarray: The great circle distance to each point in meters.
+    """
+    return _great_circle_kernel(p1[0], p1[1], np.asarray(latitudes, dtype=float),
+                                np.asarray(longitudes, dtype=float))
+
+
+def geodesic_distances(p1: Point2d, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Calculate the geodesic distance from one point to many points on the WGS-84 ellipsoid.
+
+    Parameters:
+        p1 (tuple[float, float]): The point to measure from as a (latitude, longitude) tuple.
+        latitudes (np.ndarray): The latitudes of the points to measure to.
+        longitudes (np.ndarray): The longitudes of the points to measure to.
+
+    Returns:
+        np.ndarray: The geodesic distance to each point in meters.
+    """
+    return _geodesic_kernel(p1[0], p1[1], np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float))
+
+
+def euclidean_distance_matrix(latitudes1: np.ndarray, longitudes1: np.ndarray, latitudes2: np.ndarray,
+                              longitudes2: np.ndarray) -> np.ndarray:
+    """
+    Calculate the Euclidean distance between every pair of points from two sets.
+
+    Returns:
+        np.ndarray: A matrix whose [i, j] entry is the distance in meters from point i of the first set
+                    to point j of the second set.
+    """
+    return _euclidean_kernel(*_as_matrix_operands(latitudes1, longitudes1, latitudes2, longitudes2))
+
+
+def great_circle_distance_matrix(latitudes1: np.ndarray, longitudes1: np.ndarray, latitudes2: np.ndarray,
+                                 longitudes2: np.ndarray) -> np.ndarray:
+    """
+    Calculate the great circle distance between every pair of points from two sets.
+
+    Returns:
+        np.ndarray: A matrix whose [i, j] entry is the distance in meters from point i of the first set
+                    to point j of the second set.
+    """
+    return _great_circle_kernel(*_as_matrix_operands(latitudes1, longitudes1, latitudes2, longitudes2))
+
+
+def geodesic_distance_matrix(latitudes1: np.ndarray, longitudes1: np.ndarray, latitudes2: np.ndarray,
+                             longitudes2: np.ndarray) -> np.ndarray:
+    """
+    Calculate the geodesic distance between every pair of points from two sets.
+
+    Returns:
+        np.ndarray: A matrix whose [i, j] entry is the distance in meters from point i of the first set
+                    to point j of the second set.
+    """
+    return _geodesic_kernel(*_as_matrix_operands(latitudes1, longitudes1, latitudes2, longitudes2))
+
+
+# _as_matrix_operands: Shape two sets of points so that the kernels broadcast them into a distance matrix
+def _as_matrix_operands(latitudes1, longitudes1, latitudes2, longitudes2) -> tuple[np.ndarray, ...]:
+    return (np.asarray(latitudes1, dtype=float)[:, np.newaxis], np.asarray(longitudes1, dtype=float)[:, np.newaxis],
+            np.asarray(latitudes2, dtype=float)[np.newaxis, :], np.asarray(longitudes2, dtype=float)[np.newaxis, :])
+
+
+def _euclidean_kernel(lat1, lon1, lat2, lon2) -> np.ndarray:
+    distance_deg = ((lat1 - lat2) ** 2 + (lon1 - lon2) ** 2) ** 0.5
+    return distance_deg * constants.DEGREES_TO_METERS
+
+
+def _local_tangent_plane_kernel(lat1, lon1, lat2, lon2) -> np.ndarray:
+    lon_delta = ((lon1 - lon2 + 180.0) % 360.0 - 180.0) * np.cos(np.radians((lat1 + lat2) / 2))
+    return ((lat1 - lat2) ** 2 + lon_delta ** 2) ** 0.5 * constants.DEGREES_TO_METERS
+
+
+def _great_circle_kernel(lat1, lon1, lat2, lon2) -> np.ndarray:
+    lat1, lat2 = np.radians(lat1), np.radians(lat2)
+    delta_lng = np.radians(lon2) - np.radians(lon1)
+    sin_lat1, cos_lat1 = np.sin(lat1), np.cos(lat1)
+    sin_lat2, cos_lat2 = np.sin(lat2), np.cos(lat2)
+    cos_delta_lng, sin_delta_lng = np.cos(delta_lng), np.sin(delta_lng)
+
+    d = np.arctan2(np.sqrt((cos_lat2 * sin_delta_lng) ** 2 +
+                           (cos_lat1 * sin_lat2 - sin_lat1 * cos_lat2 * cos_delta_lng) ** 2),
+                   sin_lat1 * sin_lat2 + cos_lat1 * cos_lat2 * cos_delta_lng)
+    return constants.EARTH_RADIUS_METERS * d
+
+
+def _geodesic_kernel(lat1, lon1, lat2, lon2) -> np.ndarray:
+    # Vincenty's inverse formula, iterated until every pair has converged
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(lat1, lon1, lat2, lon2)
+    a = constants.WGS84_SEMI_MAJOR_AXIS
+    f = constants.WGS84_FLATTENING
+    b = (1 - f) * a
+
+    big_l = np.radians((lon2 - lon1 + 180.0) % 360.0 - 180.0)
+    u1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    u2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    lam = big_l
+    converged = np.zeros(big_l.shape, dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(VINCENTY_MAX_ITERATIONS):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt((cos_u2 * sin_lam) ** 2 + (cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam) ** 2)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+            c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = big_l + (1 - c) * f * sin_alpha * (
+                    sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+            converged = np.abs(lam - lam_prev) < VINCENTY_CONVERGENCE
+            if converged.all():
+                break
+
+    u_sq = cos2_alpha * (a ** 2 - b ** 2) / b ** 2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+            big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+    distances = np.asarray(b * big_a * (sigma - delta_sigma), dtype=float)
+
+    for i in zip(*np.nonzero(~converged)):
+        distances[i] = geodesic_distance((lat1[i], lon1[i]), (lat2[i], lon2[i]))
+    return distances
@@ -0,0 +1,274 @@
+# metrics: Opt-in instrumentation of the fusion hot path, exposed as a snapshot dict or Prometheus text
+import time
+from collections.abc import Callable
+
+import numpy as np
+
+from abstract import DistanceCalculator2d, Point2d
+
+# The instrumented methods and the stage their time is recorded under. put covers search, store, merge and copy.
+TRACKER_STAGES: dict[str, str] = {"update": "update", "update_batch": "update", "expire": "expire"}
+COLLECTION_STAGES: dict[str, str] = {
+    "fuse": "fuse",
+    "fuse_batch": "fuse",
+    "remove_duplicates": "deduplicate",
+    "put": "put",
+    "get_closest_track_index": "search",
+    "_cell_track": "search",
+    "_append_track": "store",
+    "_replace_track": "store",
+}
+
+
+class CountingDistanceCalculator(DistanceCalculator2d):
+    """
+    Distance calculator wrapper that counts the distances measured by another calculator.
+
+    A vectorized `calculate_many` call counts one distance per point. Every other attribute is read from the wrapped
+    calculator, so the wrapper can stand in for it anywhere.
+
+    Attributes:
+        inner (DistanceCalculator2d): The wrapped distance calculator.
+        metrics (TrackerMetrics): The metrics the distance calls are counted in.
+    """
+    inner: DistanceCalculator2d
+    metrics: 'TrackerMetrics'
+
+    def __init__(self, inner: DistanceCalculator2d, metrics: 'TrackerMetrics'):
+        self.inner = inner
+        self.metrics = metrics
+
+    def calculate(self, p1: Point2d, p2: Point2d) -> float:
+        self.metrics.distance_calls += 1
+        return self.inner.calculate(p1, p2)
+
+    def calculate_many(self, p1: Point2d, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        self.metrics.distance_calls += len(latitudes)
+        return self.inner.calculate_many(p1, latitudes, longitudes)
+
+    def compare(self, p1: Point2d, p2: Point2d) -> float:
+        self.metrics.distance_calls += 1
+        return self.inner.compare(p1, p2)
+
+    def compare_threshold(self, threshold: float) -> float:
+        return self.inner.compare_threshold(threshold)
+
+    def within_threshold(self, p1: Point2d, p2: Point2d, threshold: float) -> bool:
+        self.metrics.distance_calls += 1
+        return self.inner.within_threshold(p1, p2, threshold)
+
+    def __getattr__(self, name: str):
+        return getattr(self.inner, name)
+
+
+class TrackerMetrics:
+    """
+    Counters describing where a tracker spends its update time.
+
+    Instrumentation is installed by shadowing the methods of one tracker and its collection with timed wrappers on
+    the instances, and by wrapping their distance calculators, so nothing at all runs in the hot path of a tracker
+    whose metrics are disabled. Stages nest: `update` contains `fuse` and `expire`, `fuse` contains `deduplicate`
+    and `put`, and `put` contains `search` and `store`, so the time `put` spends merging and copying pings is its
+    own time minus that of `search` and `store`.
+
+    Attributes:
+        stage_seconds (dict[str, float]): Total time spent in each stage.
+        stage_calls (dict[str, int]): Number of calls of each stage.
+        distance_calls (int): Number of distances measured, including comparisons.
+        searches (int): Number of nearest track searches, including geohash cell lookups.
+        candidates (int): Number of distances measured by nearest track searches, counting the track found by a
+                          geohash cell lookup as one.
+        pings (int): Number of pings passed to updates.
+        matched (int): Number of pings fused with a track.
+        unmatched (int): Number of pings stored as new tracks.
+        collection_size (int): Number of tracks after the latest update.
+
+    Methods:
+        instrument: Installs the instrumentation on a tracker and its collection.
+        reset: Sets every counter back to zero.
+        snapshot: Returns the counters and the rates derived from them as a dict.
+        to_prometheus: Returns the counters in the Prometheus text exposition format.
+    """
+    stage_seconds: dict[str, float]
+    stage_calls: dict[str, int]
+    distance_calls: int
+    searches: int
+    candidates: int
+    pings: int
+    matched: int
+    unmatched: int
+    collection_size: int
+
+    def __init__(self):
+        self.reset()
+
+    # reset: Set every counter back to zero
+    def reset(self):
+        self.stage_seconds = {}
+        self.stage_calls = {}
+        self.distance_calls = 0
+        self.searches = 0
+        self.candidates = 0
+        self.pings = 0
+        self.matched = 0
+        self.unmatched = 0
+        self.collection_size = 0
+
+    def instrument(self, tracker, collection) -> Callable[[], None]:
+        """
+        Record the stages of a tracker and its collection in these metrics.
+
+        Parameters:
+            tracker: The tracker, such as a TrackerBase, whose updates are recorded.
+            collection: The FusibleCollection the tracker delegates to.
+
+        Returns:
+            Callable[[], None]: A function that removes the instrumentation again.
+        """
+        shadowed: list[tuple[object, str]] = []
+        replaced: list[tuple[object, str, object]] = []
+
+        def shadow(target: object, name: str, wrapper: Callable):
+            setattr(target, name, wrapper)
+            shadowed.append((target, name))
+
+        for name, stage in TRACKER_STAGES.items():
+            if hasattr(tracker, name):
+                method = getattr(tracker, name)
+                recorder = self._record_update if name == "update" else \
+                    self._record_batch_update if name == "update_batch" else None
+                shadow(tracker, name, self._timed(stage, method, recorder, collection))
+        for name, stage in COLLECTION_STAGES.items():
+            if hasattr(collection, name):
+                method = getattr(collection, name)
+                if name == "get_closest_track_index":
+                    shadow(collection, name, self._searched(method))
+                elif name == "_cell_track":
+                    shadow(collection, name, self._looked_up(method))
+                else:
+                    shadow(collection, name, self._timed(stage, method))
+        for owner in (collection, getattr(collection, "deduplicator", None)):
+            distancer = getattr(owner, "distancer", None)
+            if distancer is not None:
+                replaced.append((owner, "distancer", distancer))
+                setattr(owner, "distancer", CountingDistanceCalculator(distancer, self))
+
+        def uninstrument():
+            for target, name in shadowed:
+                delattr(target, name)
+            for owner, name, original in replaced:
+                setattr(owner, name, original)
+
+        return uninstrument
+
+    # _timed: Wrap a method to record its duration under a stage, and optionally its result
+    def _timed(self, stage: str, method: Callable, recorder: Callable | None = None, collection=None) -> Callable:
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                self._add(stage, time.perf_counter() - start)
+            if recorder is not None:
+                recorder(args[0], result, collection)
+            return result
+        return timed
+
+    # _searched: Wrap a nearest track search to record its duration and the distances it measured
+    def _searched(self, method: Callable) -> Callable:
+        def searched(*args, **kwargs):
+            start = time.perf_counter()
+            before = self.distance_calls
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._add("search", time.perf_counter() - start)
+                self.searches += 1
+                self.candidates += self.distance_calls - before
+        return searched
+
+    # _looked_up: Wrap a geohash cell lookup to record it as a search of the one track the cell can hold
+    def _looked_up(self, method: Callable) -> Callable:
+        def looked_up(*args, **kwargs):
+            start = time.perf_counter()
+            track = None
+            try:
+                track = method(*args, **kwargs)
+                return track
+            finally:
+                self._add("search", time.perf_counter() - start)
+                self.searches += 1
+                self.candidates += track is not None
+        return looked_up
+
+    # _add: Add the duration of one call to a stage
+    def _add(self, stage: str, seconds: float):
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+        self.stage_calls[stage] = self.stage_calls.get(stage, 0) + 1
+
+    # _record_update: Count the pings and results of a TrackerBase.update call
+    def _record_update(self, inputs, result, collection):
+        matched, unmatched = result
+        self.pings += len(inputs)
+        self.matched += len(matched)
+        self.unmatched += len(unmatched)
+        self.collection_size = len(collection)
+
+    # _record_batch_update: Count the rows and results of a TrackerBase.update_batch call
+    def _record_batch_update(self, batch, fusion, collection):
+        self.pings += len(batch)
+        self.matched += len(fusion.matched_rows)
+        self.unmatched += len(fusion.unmatched_rows)
+        self.collection_size = len(collection)
+
+    def snapshot(self) -> dict:
+        """
+        Return the counters and the rates derived from them.
+
+        Returns:
+            dict: The counters, plus `match_rate` (matched over matched and unmatched results) and
+                  `candidates_per_search`, each None until there is something to divide by.
+        """
+        results = self.matched + self.unmatched
+        return {
+            "stage_seconds": dict(self.stage_seconds),
+            "stage_calls": dict(self.stage_calls),
+            "distance_calls": self.distance_calls,
+            "searches": self.searches,
+            "candidates": self.candidates,
+            "candidates_per_search": self.candidates / self.searches if self.searches else None,
+            "pings": self.pings,
+            "matched": self.matched,
+            "unmatched": self.unmatched,
+            "match_rate": self.matched / results if results else None,
+            "collection_size": self.collection_size,
+        }
+
+    def to_prometheus(self, prefix: str = "tracker") -> str:
+        """
+        Return the counters in the Prometheus text exposition format.
+
+        Parameters:
+            prefix (str): The prefix of every metric name. Defaults to "tracker".
+
+        Returns:
+            str: One sample per line, each metric preceded by its TYPE line.
+        """
+        lines: list[str] = []
+
+        def metric(name: str, kind: str, samples: list[tuple[str, float]]):
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            lines.extend(f"{prefix}_{name}{labels} {value}" for labels, value in samples)
+
+        metric("stage_seconds_total", "counter",
+               [(f'{{stage="{stage}"}}', seconds) for stage, seconds in sorted(self.stage_seconds.items())])
+        metric("stage_calls_total", "counter",
+               [(f'{{stage="{stage}"}}', calls) for stage, calls in sorted(self.stage_calls.items())])
+        metric("distance_calls_total", "counter", [("", self.distance_calls)])
+        metric("searches_total", "counter", [("", self.searches)])
+        metric("search_candidates_total", "counter", [("", self.candidates)])
+        metric("pings_total", "counter", [("", self.pings)])
+        metric("matched_total", "counter", [("", self.matched)])
+        metric("unmatched_total", "counter", [("", self.unmatched)])
+        metric("collection_size", "gauge", [("", self.collection_size)])
+        return "\n".join(lines) + "\n"
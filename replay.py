@@ -0,0 +1,80 @@
+# replay: Stream recorded capture files through a tracker as fast as it can fuse them
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from benchmark import BACKENDS
+from capture import INTEGER_PING_RECORD, iter_frames, record_layout
+from ids import IdTable
+from tracker_base import TrackerBase
+
+
+# replay: Fuse every frame of a capture file, returning the throughput and the fusion counts
+def replay(tracker: TrackerBase, path: str, layout: np.dtype = INTEGER_PING_RECORD,
+           frame_interval: int | None = None) -> dict:
+    """
+    Replay a capture file through a tracker with `TrackerBase.update_batch`, one frame at a time.
+
+    Parameters:
+        tracker (TrackerBase): The tracker to update.
+        path (str): The capture file, see `capture.iter_frames`.
+        layout (np.dtype): The record layout of the file. Defaults to INTEGER_PING_RECORD, the layout of pings with
+                           the integer track_ids of `Ping.Builder`.
+        frame_interval (int | None): The length of a frame in observation_time units, or None for a frame per
+                                     observation_time. Defaults to None.
+
+    Returns:
+        dict: The capture, the numbers of records, frames, matched and unmatched records, and the seconds taken
+              and records fused per second.
+    """
+    records = frames = matched = unmatched = 0
+    start = time.perf_counter()
+    for frame in iter_frames(path, layout, frame_interval):
+        fusion = tracker.update_batch(frame)
+        records += len(frame)
+        frames += 1
+        matched += len(fusion.matched_rows)
+        unmatched += len(fusion.unmatched_rows)
+    seconds = time.perf_counter() - start
+    return {
+        "capture": path,
+        "records": records,
+        "frames": frames,
+        "matched": matched,
+        "unmatched": unmatched,
+        "seconds": seconds,
+        "records_per_second": records / seconds if seconds > 0 else None,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay capture files through a tracker and emit the throughput as "
+                                                 "JSON.")
+    parser.add_argument("captures", nargs="+", help="capture files of packed records, replayed in order")
+    parser.add_argument("--threshold", type=float, default=100.0, help="fusion threshold in meters")
+    parser.add_argument("--backend", default="ping_grid", choices=list(BACKENDS), help="fusion backend")
+    parser.add_argument("--frame-interval", type=int, help="frame length in observation_time units")
+    parser.add_argument("--ttl", type=int, help="time to live of a track in observation_time units")
+    parser.add_argument("--callsign-width", type=int, default=0, help="width of the callsign field in bytes, if any")
+    ids = parser.add_mutually_exclusive_group()
+    ids.add_argument("--integer-ids", dest="integer_ids", action="store_true", default=True,
+                     help="the records hold int64 track_ids, the default")
+    ids.add_argument("--uuid-ids", dest="integer_ids", action="store_false",
+                     help="the records hold UUID track_ids, interned as integers as they are replayed")
+    args = parser.parse_args(argv)
+
+    collection = BACKENDS[args.backend](args.threshold)
+    tracker = TrackerBase(args.threshold, collection, ttl=args.ttl, id_table=None if args.integer_ids else IdTable())
+    layout = record_layout(args.callsign_width, args.integer_ids)
+    # the captures are replayed into the same tracker, as consecutive recordings of one feed
+    reports = [replay(tracker, path, layout, args.frame_interval) for path in args.captures]
+    print(json.dumps({"backend": args.backend, "threshold": args.threshold, "tracks": len(collection),
+                      "captures": reports}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
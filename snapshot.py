@@ -0,0 +1,198 @@
+# snapshot: Compact, memory-mappable binary columnar files of tracker state
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from ids import id_kind, ID_STRINGS, ID_INT64, ID_MIXED
+from ping_batch import PingBatch
+
+SNAPSHOT_MAGIC = b"PINGSNAP"
+# Version 2 added integer track_id columns, version 3 velocity columns and version 4 mixed and external track_id
+# columns, older files are still read
+SNAPSHOT_VERSION = 4
+# Every column starts on a multiple of this many bytes, so memory-mapped columns are aligned for any dtype
+SNAPSHOT_ALIGNMENT = 64
+# magic, version, flags, row count, track_id width, callsign width, clock
+_HEADER = struct.Struct("<8sIIQIIq")
+# external track_id width, following the header of a snapshot with external track_ids
+_EXTERNAL_ID_WIDTH = struct.Struct("<I")
+_HAS_CLOCK = 1
+_INTEGER_IDS = 2
+_HAS_RATES = 4
+_MIXED_IDS = 8
+_EXTERNAL_IDS = 16
+
+
+def write_snapshot(path: str, batch: PingBatch, clock: int | None = None, external_ids: list[str] | None = None):
+    """
+    Write a batch of pings to a snapshot file.
+
+    The file holds a fixed header followed by one little-endian column per field, each aligned to
+    SNAPSHOT_ALIGNMENT bytes: start_times and observation_times as int64, latitudes and longitudes as float64, then
+    track_ids and callsigns as fixed width UTF-8 byte strings as wide as their longest value. Integer track_ids are
+    stored as int64, or as 16 byte little-endian integers if any needs more than 63 bits. A batch carrying velocities
+    adds latitude_rates and longitude_rates as float64 after the callsigns. A batch mixing string and integer
+    track_ids stores the integers in decimal among the strings, and adds a uint8 column flagging them. External
+    track_ids, as interned by an IdTable, are stored last as fixed width UTF-8 byte strings, whose width follows the
+    header. The file is written under a temporary name and moved into place once synced, so a crash never leaves a
+    partial snapshot at `path`.
+
+    Parameters:
+        path (str): The file to write.
+        batch (PingBatch): The pings to store, such as every track of a collection.
+        clock (int | None): The tracker clock to store with the pings. Defaults to None.
+        external_ids (list[str] | None): The external track_id of every ping, see `read_external_ids`. Defaults to
+                                         None.
+
+    Raises:
+        ValueError: If there are not as many external track_ids as pings.
+    """
+    if external_ids is not None and len(external_ids) != len(batch):
+        raise ValueError(f"Expected {len(batch)} external track_ids, got {len(external_ids)}")
+    track_ids, integer_ids = _encode_track_ids(batch)
+    callsigns = _encode_strings(batch.callsigns)
+    flags = (_HAS_CLOCK if clock is not None else 0) | (_INTEGER_IDS if track_ids.dtype.kind != "S" else 0) | \
+        (_HAS_RATES if batch.latitude_rates is not None else 0) | (_MIXED_IDS if integer_ids is not None else 0) | \
+        (_EXTERNAL_IDS if external_ids is not None else 0)
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, flags, len(batch), track_ids.dtype.itemsize,
+                          callsigns.dtype.itemsize, clock if clock is not None else 0)
+    columns = [batch.start_times.astype("<i8"), batch.observation_times.astype("<i8"),
+               batch.latitudes.astype("<f8"), batch.longitudes.astype("<f8"), track_ids, callsigns]
+    if batch.latitude_rates is not None and batch.longitude_rates is not None:
+        columns += [batch.latitude_rates.astype("<f8"), batch.longitude_rates.astype("<f8")]
+    if integer_ids is not None:
+        columns.append(integer_ids)
+    if external_ids is not None:
+        externals = _encode_strings(np.array(external_ids, dtype=object))
+        header += _EXTERNAL_ID_WIDTH.pack(externals.dtype.itemsize)
+        columns.append(externals)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as snapshot_file:
+        snapshot_file.write(header)
+        position = len(header)
+        for column in columns:
+            padding = -position % SNAPSHOT_ALIGNMENT
+            snapshot_file.write(b"\0" * padding)
+            snapshot_file.write(np.ascontiguousarray(column).tobytes())
+            position += padding + column.nbytes
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temporary_path, path)
+
+
+def read_snapshot(path: str) -> tuple[PingBatch, int | None]:
+    """
+    Memory-map a snapshot file.
+
+    The columns of the returned batch are read-only views of the mapped file, so opening a snapshot of millions of
+    tracks copies nothing, and pages are only read from disk as rows are used.
+
+    Parameters:
+        path (str): The file written by `write_snapshot`.
+
+    Returns:
+        tuple: The pings as a PingBatch whose track_ids and callsigns are UTF-8 byte strings, and the stored clock,
+               or None if none was stored. Integer track_ids are an int64 column, or an object column of Python
+               ints, the one column that is not mapped, if any needs more than 63 bits. Mixed string and integer
+               track_ids are an object column of Python strings and ints, which is not mapped either.
+
+    Raises:
+        ValueError: If the file is not a snapshot, has an unsupported version or is truncated.
+    """
+    flags, clock, columns = _map_snapshot(path)
+    if flags & _EXTERNAL_IDS:
+        columns.pop()
+    start_times, observation_times, latitudes, longitudes, track_ids, callsigns = columns[:6]
+    if track_ids.dtype.kind == "V":
+        track_ids = np.array([int.from_bytes(value, "little") for value in track_ids.tolist()], dtype=object)
+    if flags & _MIXED_IDS:
+        track_ids = np.array([int(value) if integer else value.decode()
+                              for value, integer in zip(track_ids.tolist(), columns.pop().tolist())], dtype=object)
+    batch = PingBatch(track_ids, callsigns, start_times, observation_times, latitudes, longitudes, *columns[6:])
+    return batch, clock
+
+
+def read_external_ids(path: str) -> list[str] | None:
+    """
+    Read the external track_ids stored with the pings of a snapshot file.
+
+    Parameters:
+        path (str): The file written by `write_snapshot`.
+
+    Returns:
+        list[str] | None: The external track_id of every row, or None if none were stored.
+
+    Raises:
+        ValueError: If the file is not a snapshot, has an unsupported version or is truncated.
+    """
+    flags, _, columns = _map_snapshot(path)
+    return [value.decode() for value in columns[-1].tolist()] if flags & _EXTERNAL_IDS else None
+
+
+# _map_snapshot: Memory-map the columns of a snapshot file, returning them with its flags and clock
+def _map_snapshot(path: str) -> tuple[int, int | None, list[np.ndarray]]:
+    with open(path, "rb") as snapshot_file:
+        size = os.fstat(snapshot_file.fileno()).st_size
+        if size < _HEADER.size:
+            raise ValueError(f"{path} is too short to be a snapshot")
+        # the mapping stays open as long as the columns viewing it are alive
+        mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, flags, count, track_id_width, callsign_width, clock = _HEADER.unpack_from(mapped)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a snapshot")
+    if not 1 <= version <= SNAPSHOT_VERSION:
+        raise ValueError(f"{path} has snapshot version {version}, expected at most {SNAPSHOT_VERSION}")
+    if not flags & _INTEGER_IDS:
+        track_id_dtype = f"S{track_id_width}"
+    else:
+        track_id_dtype = "<i8" if track_id_width == 8 else "V16"
+    dtypes = ["<i8", "<i8", "<f8", "<f8", track_id_dtype, f"S{callsign_width}"]
+    if flags & _HAS_RATES:
+        dtypes += ["<f8", "<f8"]
+    if flags & _MIXED_IDS:
+        dtypes.append("u1")
+    position = _HEADER.size
+    if flags & _EXTERNAL_IDS:
+        if size < position + _EXTERNAL_ID_WIDTH.size:
+            raise ValueError(f"{path} is truncated, expected at least {position + _EXTERNAL_ID_WIDTH.size} bytes "
+                             f"but found {size}")
+        (external_id_width,) = _EXTERNAL_ID_WIDTH.unpack_from(mapped, position)
+        position += _EXTERNAL_ID_WIDTH.size
+        dtypes.append(f"S{external_id_width}")
+    columns: list[np.ndarray] = []
+    for dtype in dtypes:
+        position += -position % SNAPSHOT_ALIGNMENT
+        end = position + count * np.dtype(dtype).itemsize
+        if end > size:
+            raise ValueError(f"{path} is truncated, expected at least {end} bytes but found {size}")
+        columns.append(np.frombuffer(mapped, dtype=dtype, count=count, offset=position))
+        position = end
+    return flags, clock if flags & _HAS_CLOCK else None, columns
+
+
+# _encode_track_ids: Return the track_ids of a batch as int64, 16 byte little-endian integers or fixed width UTF-8,
+# along with the flags of the integers among them if they mix strings and integers
+def _encode_track_ids(batch: PingBatch) -> tuple[np.ndarray, np.ndarray | None]:
+    if batch.track_ids.dtype.kind in "iS":
+        return batch.track_ids.astype("<i8") if batch.track_ids.dtype.kind == "i" else batch.track_ids, None
+    track_ids = batch.get_track_ids()
+    kind = id_kind(track_ids)
+    if kind == ID_STRINGS:
+        return _encode_strings(np.array(track_ids, dtype=object)), None
+    if kind == ID_MIXED:
+        integers = np.fromiter((isinstance(track_id, int) for track_id in track_ids), dtype="u1", count=len(track_ids))
+        return _encode_strings(np.array(track_ids, dtype=object)), integers
+    if kind == ID_INT64:
+        return np.array(track_ids, dtype="<i8"), None
+    return np.array([int(track_id).to_bytes(16, "little") for track_id in track_ids], dtype="V16"), None
+
+
+# _encode_strings: Return a string column as fixed width UTF-8 byte strings, at least one byte wide
+def _encode_strings(column: np.ndarray) -> np.ndarray:
+    if column.dtype.kind == "S":
+        return column
+    encoded = [str(value).encode() for value in column.tolist()]
+    width = max((len(value) for value in encoded), default=0)
+    return np.array(encoded, dtype=f"S{max(width, 1)}")
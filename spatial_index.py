@@ -0,0 +1,566 @@
+# spatial_index: Spatial indexes used by the fusion backends to find candidate tracks without a linear scan
+import math
+from bisect import bisect_left, insort
+
+import constants
+from abstract import SpatialIndex, Point2d
+
+
+# latitude_margin: Return the largest latitude (or central angle) delta in degrees that a threshold can span
+def latitude_margin(threshold: float) -> float:
+    """
+    Convert a distance threshold into a conservative search margin in degrees.
+
+    The margin bounds the latitude delta of any pair of points closer than `threshold`
+    under every metric used by `Geo2dDistanceCalculator` (flat Euclidean, great circle
+    and geodesic).
+
+    Parameters:
+        threshold (float): The distance threshold in meters.
+
+    Returns:
+        float: The search margin in degrees.
+    """
+    return threshold / constants.MIN_METERS_PER_DEGREE
+
+
+# longitude_margin: Return the largest longitude delta in degrees that a latitude margin can span
+def longitude_margin(lat_margin: float, max_abs_latitude: float) -> float:
+    """
+    Widen a latitude margin into a longitude margin for points at or below a given latitude.
+
+    Meridians converge towards the poles, so a fixed distance spans more degrees of longitude
+    the further a point is from the equator. From the haversine formula, two points within a
+    central angle `d` whose latitudes do not exceed `max_abs_latitude` satisfy
+    `sin(dlon / 2) <= sin(d / 2) / cos(max_abs_latitude)`.
+
+    Parameters:
+        lat_margin (float): The latitude margin in degrees, see `latitude_margin`.
+        max_abs_latitude (float): The largest absolute latitude of either point, in degrees.
+
+    Returns:
+        float: The longitude margin in degrees, or 180 when the whole parallel must be searched.
+    """
+    cos_lat = math.cos(math.radians(min(max_abs_latitude, 90.0)))
+    if cos_lat <= 0.0:
+        return 180.0
+    ratio = math.sin(math.radians(min(lat_margin, 180.0)) / 2) / cos_lat
+    if ratio >= 1.0:
+        return 180.0
+    return math.degrees(2 * math.asin(ratio))
+
+
+class GridIndex(SpatialIndex):
+    """
+    Uniform latitude/longitude grid index sized from a distance threshold.
+
+    Each cell is `latitude_margin(threshold)` degrees on a side, so a query at a point only has to
+    visit the cell it falls in and its direct neighbors in latitude. In longitude the number of
+    neighboring columns grows with latitude (see `longitude_margin`) and wraps at the antimeridian.
+    Cells are grouped by row, and a row is scanned directly whenever it holds fewer occupied cells
+    than the query would otherwise probe, which keeps polar queries cheap. Keys within a cell are kept
+    in ascending order.
+
+    Attributes:
+        rows (dict[int, dict[int, list[int]]]): Occupied cells, keyed by row then column, holding keys.
+        _lat_margin (float): The latitude search margin in degrees.
+        _cell_size (float): The side of a cell in degrees.
+        _columns (int): The number of columns around a parallel.
+
+    Methods:
+        __init__: Initializes an empty grid for the given threshold.
+        cell: Returns the (row, column) cell of a point.
+        insert: Adds a key to the cell of a point.
+        remove: Removes a key from the cell of a point.
+        query: Returns the keys of all cells that may hold a point within the threshold.
+        query_cells: Returns the sorted key lists of all cells that may hold a point within the threshold.
+    """
+    rows: dict[int, dict[int, list[int]]]
+    _lat_margin: float
+    _cell_size: float
+    _columns: int
+
+    def __init__(self, threshold: float):
+        self.rows = {}
+        self._lat_margin = latitude_margin(threshold)
+        self._cell_size = min(max(self._lat_margin, 1e-9), 360.0)
+        self._columns = max(1, math.ceil(360.0 / self._cell_size))
+
+    # cell: Return the (row, column) of the cell holding a point
+    def cell(self, point: Point2d) -> tuple[int, int]:
+        lat, lon = point
+        return math.floor(lat / self._cell_size), math.floor((lon + 180.0) / self._cell_size) % self._columns
+
+    def insert(self, key: int, point: Point2d):
+        row, column = self.cell(point)
+        insort(self.rows.setdefault(row, {}).setdefault(column, []), key)
+
+    def remove(self, key: int, point: Point2d):
+        row, column = self.cell(point)
+        columns = self.rows[row]
+        keys = columns[column]
+        del keys[bisect_left(keys, key)]
+        if not keys:
+            del columns[column]
+            if not columns:
+                del self.rows[row]
+
+    def query(self, point: Point2d, margin: float = 0.0) -> list[int]:
+        candidates: list[int] = []
+        for keys in self.query_cells(point, margin):
+            candidates.extend(keys)
+        return candidates
+
+    # query_cells: Return the live, sorted key lists of every occupied cell a query at a point has to visit
+    def query_cells(self, point: Point2d, margin: float = 0.0) -> list[list[int]]:
+        lat, _ = point
+        lat_margin = self._lat_margin + margin
+        center_row, center_column = self.cell(point)
+        row_span = math.ceil(lat_margin / self._cell_size)
+        max_abs_latitude = abs(lat) + lat_margin
+        column_span = math.ceil(longitude_margin(lat_margin, max_abs_latitude) / self._cell_size)
+
+        cells: list[list[int]] = []
+        for row in range(center_row - row_span, center_row + row_span + 1):
+            columns = self.rows.get(row)
+            if columns is None:
+                continue
+            if 2 * column_span + 1 >= self._columns:
+                cells.extend(columns.values())
+            elif 2 * column_span + 1 > len(columns):
+                for column, keys in columns.items():
+                    offset = (column - center_column) % self._columns
+                    if offset <= column_span or offset >= self._columns - column_span:
+                        cells.append(keys)
+            else:
+                for offset in range(-column_span, column_span + 1):
+                    cell = columns.get((center_column + offset) % self._columns)
+                    if cell is not None:
+                        cells.append(cell)
+        return cells
+
+
+GEO_HASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEO_HASH_MAX_PRECISION = 12
+# Above this many longitude cells per row a query scans the occupied cells of its rows instead
+GEO_HASH_MAX_COLUMN_SPAN = 16
+
+
+# _spread_bits: Spread the low 32 bits of an integer out to the even bit positions of a 64 bit integer
+def _spread_bits(x: int) -> int:
+    x = (x | (x << 16)) & 0x0000FFFF0000FFFF
+    x = (x | (x << 8)) & 0x00FF00FF00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F0F0F0F0F
+    x = (x | (x << 2)) & 0x3333333333333333
+    return (x | (x << 1)) & 0x5555555555555555
+
+
+# generate_geo_hash_precision: Get the finest geohash precision whose cells are at least a margin tall and wide
+def generate_geo_hash_precision(lat_margin: float) -> int:
+    for precision in range(GEO_HASH_MAX_PRECISION, 0, -1):
+        if 180.0 / 2 ** (5 * precision // 2) >= lat_margin:
+            return precision
+    return 1
+
+
+class GeoHashIndex(SpatialIndex):
+    """
+    Geohash bucketed spatial index that probes the neighboring cells of a query.
+
+    The precision is the finest one whose cells are at least `latitude_margin(threshold)` degrees tall
+    (geohash cells are never narrower than they are tall), so every point within the threshold of a query
+    lies in the query's own cell or one of its 8 neighbors. Towards the poles the ring is widened in
+    longitude as `longitude_margin` requires, and rows close enough to a pole that the ring would exceed
+    `GEO_HASH_MAX_COLUMN_SPAN` columns are additionally tracked per row and scanned directly.
+
+    Cells are addressed by (row, column) and converted to standard geohash strings by interleaving the
+    bits, so neighbor keys are computed without decoding or re-encoding floats and points lying exactly
+    on a cell edge are bucketed consistently. Keys within a cell are kept in ascending order.
+
+    Attributes:
+        cells (dict[str, list[int]]): Occupied geohash cells holding keys.
+        polar_rows (dict[int, set[str]]): Occupied cells of the rows that are scanned directly.
+        _precision (int): The geohash precision, in characters.
+        _lat_margin (float): The latitude search margin in degrees.
+        _lat_bits (int): The number of latitude bits in a geohash of this precision.
+        _lon_bits (int): The number of longitude bits in a geohash of this precision.
+        _cell_height (float): The height of a cell in degrees.
+        _cell_width (float): The width of a cell in degrees.
+        _polar_band (int): The number of rows next to each pole that are tracked for direct scanning.
+
+    Methods:
+        __init__: Initializes an empty index for the given threshold.
+        precision: Property that returns the geohash precision of the index.
+        cell: Returns the (row, column) cell of a point.
+        key: Returns the geohash of a point.
+        insert: Adds a key to the cell of a point.
+        remove: Removes a key from the cell of a point.
+        query: Returns the keys of all cells that may hold a point within the threshold.
+        query_cells: Returns the sorted key lists of all cells that may hold a point within the threshold.
+    """
+    cells: dict[str, list[int]]
+    polar_rows: dict[int, set[str]]
+    _precision: int
+    _lat_margin: float
+    _lat_bits: int
+    _lon_bits: int
+    _cell_height: float
+    _cell_width: float
+    _polar_band: int
+
+    def __init__(self, threshold: float):
+        self.cells = {}
+        self.polar_rows = {}
+        self._lat_margin = latitude_margin(threshold)
+        self._precision = generate_geo_hash_precision(self._lat_margin)
+        self._lat_bits = 5 * self._precision // 2
+        self._lon_bits = 5 * self._precision - self._lat_bits
+        self._cell_height = 180.0 / 2 ** self._lat_bits
+        self._cell_width = 360.0 / 2 ** self._lon_bits
+        # the column span only shrinks moving away from the pole, so binary search for the first narrow row
+        low, high = 0, 2 ** self._lat_bits // 2
+        while low < high:
+            middle = (low + high) // 2
+            if self._column_span(middle, self._lat_margin) > GEO_HASH_MAX_COLUMN_SPAN:
+                low = middle + 1
+            else:
+                high = middle
+        self._polar_band = low + math.ceil(self._lat_margin / self._cell_height)
+
+    # precision: Return the precision of the geohash
+    @property
+    def precision(self) -> int:
+        return self._precision
+
+    # cell: Return the (row, column) of the cell holding a point
+    def cell(self, point: Point2d) -> tuple[int, int]:
+        lat, lon = point
+        row = min(max(math.floor((lat + 90.0) / self._cell_height), 0), 2 ** self._lat_bits - 1)
+        column = math.floor((lon + 180.0) / self._cell_width) % 2 ** self._lon_bits
+        return row, column
+
+    # key: Return the geohash of the cell holding a point
+    def key(self, point: Point2d) -> str:
+        return self._cell_key(*self.cell(point))
+
+    def insert(self, key: int, point: Point2d):
+        row, column = self.cell(point)
+        geo_key = self._cell_key(row, column)
+        insort(self.cells.setdefault(geo_key, []), key)
+        if self._is_polar_row(row):
+            self.polar_rows.setdefault(row, set()).add(geo_key)
+
+    def remove(self, key: int, point: Point2d):
+        row, column = self.cell(point)
+        geo_key = self._cell_key(row, column)
+        keys = self.cells[geo_key]
+        del keys[bisect_left(keys, key)]
+        if not keys:
+            del self.cells[geo_key]
+            if self._is_polar_row(row):
+                polar_row = self.polar_rows[row]
+                polar_row.discard(geo_key)
+                if not polar_row:
+                    del self.polar_rows[row]
+
+    def query(self, point: Point2d, margin: float = 0.0) -> list[int]:
+        candidates: list[int] = []
+        for keys in self.query_cells(point, margin):
+            candidates.extend(keys)
+        return candidates
+
+    # query_cells: Return the live, sorted key lists of every occupied cell a query at a point has to visit
+    def query_cells(self, point: Point2d, margin: float = 0.0) -> list[list[int]]:
+        lat_margin = self._lat_margin + margin
+        center_row, center_column = self.cell(point)
+        row_span = math.ceil(lat_margin / self._cell_height)
+        rows = range(max(center_row - row_span, 0), min(center_row + row_span, 2 ** self._lat_bits - 1) + 1)
+        column_span = self._column_span(center_row, lat_margin)
+
+        cells: list[list[int]] = []
+        # the polar rows are only tracked as far as an unwidened query reaches, so a widened one probes columns
+        if column_span > GEO_HASH_MAX_COLUMN_SPAN and all(self._is_polar_row(row) for row in rows):
+            for row in rows:
+                for geo_key in self.polar_rows.get(row, ()):
+                    cells.append(self.cells[geo_key])
+            return cells
+        columns = 2 ** self._lon_bits
+        for row in rows:
+            for offset in range(-min(column_span, columns // 2), min(column_span, (columns - 1) // 2) + 1):
+                keys = self.cells.get(self._cell_key(row, (center_column + offset) % columns))
+                if keys is not None:
+                    cells.append(keys)
+        return cells
+
+    # _column_span: Return how many columns either side of a row a query with a latitude margin has to visit
+    def _column_span(self, row: int, lat_margin: float) -> int:
+        edge_latitude = max(abs(row * self._cell_height - 90.0), abs((row + 1) * self._cell_height - 90.0))
+        lon_margin = longitude_margin(lat_margin, edge_latitude + lat_margin)
+        return math.ceil(lon_margin / self._cell_width)
+
+    # _is_polar_row: Return whether the cells of a row have to be tracked for direct scanning
+    def _is_polar_row(self, row: int) -> bool:
+        return row < self._polar_band or row >= 2 ** self._lat_bits - self._polar_band
+
+    # _cell_key: Return the geohash of a (row, column) cell by interleaving their bits
+    def _cell_key(self, row: int, column: int) -> str:
+        if self._lon_bits == self._lat_bits:
+            code = (_spread_bits(column) << 1) | _spread_bits(row)
+        else:
+            code = _spread_bits(column) | (_spread_bits(row) << 1)
+        chars = []
+        for shift in range(5 * (self._precision - 1), -1, -5):
+            chars.append(GEO_HASH_BASE32[(code >> shift) & 31])
+        return "".join(chars)
+
+
+# The number of keys above which a quadtree leaf splits, and the depth below a base cell at which splitting stops
+QUAD_TREE_CAPACITY = 16
+QUAD_TREE_MAX_DEPTH = 8
+# Slack in degrees added to node bounds, so points on a node edge are never missed to rounding
+QUAD_TREE_EPSILON = 1e-9
+
+
+class _QuadNode:
+    """
+    Node of a QuadTreeIndex: a latitude/longitude box that is either a leaf holding keys and no children, or split
+    into 4 children and holding no keys itself.
+    """
+    __slots__ = ("lat", "lon", "height", "width", "depth", "count", "keys", "children")
+
+    lat: float
+    lon: float
+    height: float
+    width: float
+    depth: int
+    count: int
+    keys: dict[int, Point2d]
+    children: list['_QuadNode']
+
+    def __init__(self, lat: float, lon: float, height: float, width: float, depth: int):
+        self.lat = lat
+        self.lon = lon
+        self.height = height
+        self.width = width
+        self.depth = depth
+        self.count = 0
+        self.keys = {}
+        self.children = []
+
+    # child: Return the child holding a point, the children being ordered south-west, south-east, north-west, north-east
+    def child(self, lat: float, lon: float) -> '_QuadNode':
+        return self.children[2 * (lat >= self.lat + self.height / 2) + (lon >= self.lon + self.width / 2)]
+
+
+class QuadTreeIndex(SpatialIndex):
+    """
+    Adaptive spatial index: a grid of threshold sized base cells, each the root of a quadtree over its keys.
+
+    A uniform grid or a fixed geohash precision hands every query all the keys of the 3x3 block of cells around
+    it, so in dense traffic a lookup measures the distance to many tracks that cannot be within the threshold.
+    Here a cell that holds more than `capacity` keys splits into four quadrants, recursively up to `max_depth`
+    levels below the base cell, and a query only collects the leaves that overlap its search window of
+    `latitude_margin(threshold)` by `longitude_margin` degrees. When removals leave a split node with at most half
+    its capacity, its subtree merges back into a single leaf. Sparse regions therefore cost a hash lookup per
+    cell, as in GridIndex, and dense regions a bounded descent, so lookups and inserts stay close to constant
+    time whatever the traffic distribution.
+
+    Base cells are laid out and scanned like the cells of GridIndex, including the wrap at the antimeridian and the
+    direct scan of rows near the poles.
+
+    Attributes:
+        rows (dict[int, dict[int, _QuadNode]]): Occupied base cells, keyed by row then column.
+        _lat_margin (float): The latitude search margin in degrees.
+        _cell_size (float): The side of a base cell in degrees.
+        _columns (int): The number of base columns around a parallel.
+        _capacity (int): The number of keys above which a leaf splits.
+        _max_depth (int): The number of levels a base cell can split into.
+
+    Methods:
+        __init__: Initializes an empty index for the given threshold.
+        cell: Returns the (row, column) base cell of a point.
+        insert: Adds a key to the leaf of a point, splitting the leaf if it overflows.
+        remove: Removes a key from the leaf of a point, merging the subtree around it if it has become sparse.
+        move: Moves a key, in place when it stays in the same leaf.
+        query: Returns the keys of all leaves that may hold a point within the threshold.
+        depth: Returns the depth of the leaf holding a point.
+    """
+    rows: dict[int, dict[int, _QuadNode]]
+    _lat_margin: float
+    _cell_size: float
+    _columns: int
+    _capacity: int
+    _max_depth: int
+
+    def __init__(self, threshold: float, capacity: int = QUAD_TREE_CAPACITY, max_depth: int = QUAD_TREE_MAX_DEPTH):
+        """
+        Initializes a new QuadTreeIndex.
+
+        Parameters:
+            threshold (float): The distance threshold in meters.
+            capacity (int): The number of keys above which a leaf splits. Defaults to QUAD_TREE_CAPACITY.
+            max_depth (int): The number of levels a base cell can split into. Defaults to QUAD_TREE_MAX_DEPTH.
+
+        Raises:
+            ValueError: If capacity is not positive or max_depth is negative.
+        """
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        if max_depth < 0:
+            raise ValueError(f"max_depth must not be negative, got {max_depth}")
+        self.rows = {}
+        self._lat_margin = latitude_margin(threshold)
+        self._cell_size = min(max(self._lat_margin, 1e-9), 360.0)
+        self._columns = max(1, math.ceil(360.0 / self._cell_size))
+        self._capacity = capacity
+        self._max_depth = max_depth
+
+    # cell: Return the (row, column) of the base cell holding a point
+    def cell(self, point: Point2d) -> tuple[int, int]:
+        lat, lon = point
+        return math.floor(lat / self._cell_size), math.floor((lon + 180.0) / self._cell_size) % self._columns
+
+    def insert(self, key: int, point: Point2d):
+        row, column = self.cell(point)
+        lat, lon = point[0], _wrap_longitude(point[1])
+        columns = self.rows.setdefault(row, {})
+        node = columns.get(column)
+        if node is None:
+            node = _QuadNode(row * self._cell_size, column * self._cell_size - 180.0, self._cell_size,
+                             self._cell_size, 0)
+            columns[column] = node
+        while node.children:
+            node.count += 1
+            node = node.child(lat, lon)
+        node.count += 1
+        node.keys[key] = (lat, lon)
+        if node.count > self._capacity and node.depth < self._max_depth:
+            self._split(node)
+
+    def remove(self, key: int, point: Point2d):
+        row, column = self.cell(point)
+        lat, lon = point[0], _wrap_longitude(point[1])
+        columns = self.rows[row]
+        base = columns[column]
+        path: list[_QuadNode] = []
+        node = base
+        while node.children:
+            path.append(node)
+            node = node.child(lat, lon)
+        del node.keys[key]
+        node.count -= 1
+        for parent in path:
+            parent.count -= 1
+        # merge the largest subtree that has become sparse
+        for parent in path:
+            if parent.count <= self._capacity // 2:
+                self._merge(parent)
+                break
+        if base.count == 0:
+            del columns[column]
+            if not columns:
+                del self.rows[row]
+
+    def move(self, key: int, old_point: Point2d, new_point: Point2d):
+        row, column = self.cell(old_point)
+        if (row, column) == self.cell(new_point):
+            lat, lon = old_point[0], _wrap_longitude(old_point[1])
+            new_lat, new_lon = new_point[0], _wrap_longitude(new_point[1])
+            node = self.rows[row][column]
+            while node.children:
+                next_node = node.child(lat, lon)
+                if next_node is not node.child(new_lat, new_lon):
+                    break
+                node = next_node
+            else:
+                # the key stays in its leaf, so only its stored point changes
+                node.keys[key] = (new_lat, new_lon)
+                return
+        self.remove(key, old_point)
+        self.insert(key, new_point)
+
+    def query(self, point: Point2d, margin: float = 0.0) -> list[int]:
+        lat, lon = point[0], _wrap_longitude(point[1])
+        lat_margin = self._lat_margin + margin
+        center_row, center_column = self.cell(point)
+        row_span = math.ceil(lat_margin / self._cell_size)
+        lon_margin = longitude_margin(lat_margin, abs(lat) + lat_margin)
+        column_span = math.ceil(lon_margin / self._cell_size)
+
+        candidates: list[int] = []
+        for row in range(center_row - row_span, center_row + row_span + 1):
+            columns = self.rows.get(row)
+            if columns is None:
+                continue
+            if 2 * column_span + 1 >= self._columns or 2 * column_span + 1 > len(columns):
+                for column, node in columns.items():
+                    offset = (column - center_column) % self._columns
+                    if 2 * column_span + 1 >= self._columns or offset <= column_span or \
+                            offset >= self._columns - column_span:
+                        self._collect(node, lat, lon, lat_margin, lon_margin, candidates)
+            else:
+                for offset in range(-column_span, column_span + 1):
+                    cell = columns.get((center_column + offset) % self._columns)
+                    if cell is not None:
+                        self._collect(cell, lat, lon, lat_margin, lon_margin, candidates)
+        return candidates
+
+    # depth: Return the depth below its base cell of the leaf holding a point, or None if its base cell is empty
+    def depth(self, point: Point2d) -> int | None:
+        row, column = self.cell(point)
+        node = self.rows.get(row, {}).get(column)
+        if node is None:
+            return None
+        lat, lon = point[0], _wrap_longitude(point[1])
+        while node.children:
+            node = node.child(lat, lon)
+        return node.depth
+
+    # _collect: Add the keys of every leaf under a node that overlaps the search window around a point
+    def _collect(self, node: _QuadNode, lat: float, lon: float, lat_margin: float, lon_margin: float,
+                 candidates: list[int]):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.count == 0 or abs(node.lat + node.height / 2 - lat) > \
+                    node.height / 2 + lat_margin + QUAD_TREE_EPSILON:
+                continue
+            if lon_margin < 180.0 and abs((node.lon + node.width / 2 - lon + 180.0) % 360.0 - 180.0) > \
+                    node.width / 2 + lon_margin + QUAD_TREE_EPSILON:
+                continue
+            if not node.children:
+                candidates.extend(node.keys)
+            else:
+                stack.extend(node.children)
+
+    # _split: Turn an overflowing leaf into four children, splitting them further while they overflow
+    def _split(self, node: _QuadNode):
+        height, width = node.height / 2, node.width / 2
+        node.children = [_QuadNode(node.lat + (i >> 1) * height, node.lon + (i & 1) * width, height, width,
+                                   node.depth + 1) for i in range(4)]
+        for key, point in node.keys.items():
+            child = node.child(*point)
+            child.keys[key] = point
+            child.count += 1
+        node.keys = {}
+        for child in node.children:
+            if child.count > self._capacity and child.depth < self._max_depth:
+                self._split(child)
+
+    # _merge: Collapse the subtree under a node back into a single leaf
+    def _merge(self, node: _QuadNode):
+        keys: dict[int, Point2d] = {}
+        stack = list(node.children)
+        while stack:
+            child = stack.pop()
+            if not child.children:
+                keys.update(child.keys)
+            else:
+                stack.extend(child.children)
+        node.keys = keys
+        node.children = []
+
+
+# _wrap_longitude: Return a longitude in [-180, 180)
+def _wrap_longitude(lon: float) -> float:
+    return (lon + 180.0) % 360.0 - 180.0
@@ -0,0 +1,113 @@
+import itertools
+import math
+import random
+import time
+from unittest import TestCase
+
+from assignment import solve_sparse_assignment
+from fusible_geo_hash import PingNeighborGeoHash
+from fusible_grid import PingGrid
+from fusible_nearest_neighbor import PingList
+from ping import Ping
+from test_fusible_grid import generate_random_pings, summarize
+
+
+# brute_force: Find the least total cost of a dense assignment by trying every column permutation
+def brute_force(costs: list[list[float]]) -> float:
+    return min(sum(costs[row][column] for row, column in enumerate(columns))
+               for columns in itertools.permutations(range(len(costs[0])), len(costs)))
+
+
+# east_of: Build a ping a number of degrees of longitude east of a base point
+def east_of(track_id: str, degrees: float, time: int = 0) -> Ping:
+    return Ping(track_id, track_id.upper(), time, time, 45.0, 10.0 + degrees)
+
+
+# lattice: Build a square lattice of pings a number of meters apart, shifted by a fraction of the spacing
+def lattice(prefix: str, side: int, spacing: float, shift: float, time: int = 0) -> list[Ping]:
+    degrees = spacing / 111_320.0
+    return [Ping(f"{prefix}{row}_{column}", prefix.upper(), time, time, 45.0 + (row + shift) * degrees,
+                 10.0 + (column + shift) * degrees / math.cos(math.radians(45.0)))
+            for row in range(side) for column in range(side)]
+
+
+class Test(TestCase):
+    """
+    Unit tests for the assignment solvers and the optimal assignment mode of the collections.
+
+    The solvers must find the least total cost, and a collection in optimal assignment mode must fuse each stored
+    track with at most one ping of a batch, whichever spatial index it uses.
+    """
+    def test_solve_sparse_assignment(self):
+        # row 0 is the closest row to both columns, but giving it column 1 lets row 1 take column 0
+        edges = [(0, 0, 1.0), (0, 1, 2.0), (1, 0, 1.5), (2, 5, 4.0), (3, 6, 9.0)]
+        self.assertEqual({0: 1, 1: 0, 2: 5}, solve_sparse_assignment(edges, unassigned_cost=5.0))
+        # when leaving a row unassigned is cheap, only the single best pair is worth making
+        self.assertEqual({0: 0}, solve_sparse_assignment(edges[:3], unassigned_cost=1.2))
+        self.assertEqual({}, solve_sparse_assignment([], unassigned_cost=5.0))
+
+    def test_solve_sparse_assignment_against_brute_force(self):
+        generator = random.Random(11)
+        for _ in range(200):
+            rows, columns = generator.randint(1, 5), generator.randint(1, 5)
+            edges = [(row, column, generator.uniform(-2.0, 8.0)) for row in range(rows) for column in range(columns)
+                     if generator.random() < 0.6]
+            unassigned_cost = generator.uniform(0.0, 6.0)
+            costs = {(row, column): cost for row, column, cost in edges}
+            assignment = solve_sparse_assignment(edges, unassigned_cost)
+            self.assertEqual(len(assignment), len(set(assignment.values())))
+            # brute force over dense costs, where a missing pair costs the same as leaving the row unassigned
+            dense = [[min(costs.get((row, column), unassigned_cost), unassigned_cost)
+                      for column in range(columns + rows)] for row in range(rows)]
+            expected = brute_force(dense) - unassigned_cost * (rows - len({row for row, _, _ in edges}))
+            self.assertAlmostEqual(expected, sum(costs[row, column] for row, column in assignment.items()) +
+                                   unassigned_cost * (len({row for row, _, _ in edges}) - len(assignment)))
+
+    def test_dense_cluster(self):
+        # every ping of the shifted lattice lies within the threshold of 4 tracks, so the 900 pings compete in one
+        # connected cluster, which a dense solver needed seconds for
+        threshold = 50.0
+        for factory in (PingList, PingGrid):
+            collection = factory(threshold, optimal_assignment=True)
+            for track in lattice("t", 30, 52.0, 0.0):
+                collection.insert(track)
+            start = time.perf_counter()
+            matched, unmatched = collection.fuse(lattice("p", 30, 52.0, 0.5, 1))
+            self.assertLess(time.perf_counter() - start, 2.0)
+            self.assertEqual(900, len(matched))
+            self.assertEqual(900, len({track.track_id for track, _ in matched}))
+            self.assertEqual([], unmatched)
+
+    def test_optimal_assignment_beats_greedy(self):
+        threshold = 50.0
+        tracks = [east_of("a", 0.0), east_of("b", 0.001)]
+        # "first" lies a little closer to a than to b, while "second" can only be fused with a
+        batch = [east_of("first", 0.00048, 1), east_of("second", -0.0004, 1)]
+        for factory in (PingList, PingGrid, PingNeighborGeoHash):
+            greedy, optimal = factory(threshold), factory(threshold, optimal_assignment=True)
+            for collection in (greedy, optimal):
+                collection.fuse(list(tracks))
+            matched, unmatched = greedy.fuse(list(batch))
+            self.assertEqual([("a", "first")], [(track.track_id, ping.track_id) for track, ping in matched])
+            self.assertEqual(["second"], [ping.track_id for ping in unmatched])
+            matched, unmatched = optimal.fuse(list(batch))
+            self.assertEqual([("b", "first"), ("a", "second")],
+                             [(track.track_id, ping.track_id) for track, ping in matched])
+            self.assertEqual([], unmatched)
+            self.assertEqual(["a", "b"], sorted(track.track_id for track in optimal))
+
+    def test_optimal_assignment_matches_each_track_once(self):
+        threshold = 50.0
+        tracks = generate_random_pings(1, 400, 45.0, 10.0, 0.01)
+        track_ids = {track.track_id for track in tracks}
+        for seed in range(2, 5):
+            batch = generate_random_pings(seed, 400, 45.0, 10.0, 0.01)
+            summaries = []
+            for factory in (PingList, PingGrid):
+                collection = factory(threshold, optimal_assignment=True)
+                collection.fuse(list(tracks))
+                matched, unmatched = collection.fuse(list(batch))
+                fused = [track.track_id for track, _ in matched if track.track_id in track_ids]
+                self.assertEqual(len(fused), len(set(fused)))
+                summaries.append(summarize(matched, unmatched))
+            self.assertEqual(summaries[0], summaries[1])
@@ -0,0 +1,62 @@
+import io
+import json
+from contextlib import redirect_stdout
+from unittest import TestCase
+
+from benchmark import Traffic, run, compare, main, SCENARIOS, BACKENDS
+
+
+class Test(TestCase):
+    """
+    Smoke tests for the benchmark harness.
+
+    The traffic generators must be reproducible from their seed and every case must produce a complete result.
+    """
+    def test_traffic_is_reproducible(self):
+        for scenario in SCENARIOS.values():
+            first, second = scenario(50, 100.0, 7), scenario(50, 100.0, 7)
+            for _ in range(2):
+                self.assertEqual([str(ping) for ping in first.frame()], [str(ping) for ping in second.frame()])
+
+    def test_targets_stay_within_threshold(self):
+        traffic = Traffic.airports(20, 100.0, 1)
+        track_ids = [ping.track_id for ping in traffic.frame()]
+        self.assertEqual(len(track_ids), len(set(track_ids)))
+        self.assertEqual(20, len(traffic.frame()))
+
+    def test_motion_prediction_narrows_the_gate(self):
+        report = run(["convoy"], ["ping_grid", "ping_grid_predicted", "ping_grid_wide_gate"], ["great_circle"],
+                     [300], 6, 0, memory=False)
+        static, predicted, wide = report["results"]
+        self.assertGreater(predicted["match_rate"], static["match_rate"])
+        self.assertLess(predicted["candidates_per_search"], wide["candidates_per_search"])
+
+    def test_run(self):
+        report = run(list(SCENARIOS), list(BACKENDS), ["great_circle"], [30], 2, 0, memory=True,
+                     linear_scan_max_tracks=10)
+        results = report["results"]
+        self.assertEqual(len(SCENARIOS) * len(BACKENDS), len(results))
+        for result in results:
+            if result["backend"] == "ping_list":
+                self.assertIn("skipped", result)
+                continue
+            self.assertGreater(result["pings_per_second"], 0)
+            self.assertLessEqual(result["latency_ms"]["p50"], result["latency_ms"]["p99"])
+            self.assertGreater(result["peak_memory_bytes"], 0)
+            # convoy targets outrun the threshold whenever they miss a frame
+            self.assertGreater(result["match_rate"], 0.3 if result["scenario"] == "convoy" else 0.5)
+        self.assertEqual([], compare(report, report))
+
+        slower = json.loads(json.dumps(report))
+        slower["results"][1]["pings_per_second"] /= 2
+        self.assertEqual(1, len(compare(report, slower)))
+
+    def test_main_emits_json(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            status = main(["--scenarios", "swarm", "--backends", "ping_grid", "--regimes", "euclidean",
+                           "--sizes", "20", "--frames", "1", "--no-memory"])
+        self.assertEqual(0, status)
+        report = json.loads(output.getvalue())
+        self.assertEqual(1, len(report["results"]))
+        self.assertIsNone(report["results"][0]["peak_memory_bytes"])
@@ -0,0 +1,144 @@
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import uuid
+from unittest import TestCase
+
+import numpy as np
+
+from capture import PING_RECORD, INTEGER_PING_RECORD, load_frame, pack_records, iter_frames, record_layout
+from fusible_grid import PingGrid
+from ping import Ping
+from ping_batch import PingBatch
+from replay import replay, main
+from tracker_base import TrackerBase
+
+
+# generate_capture_pings: Generate pings with UUID track_ids, a frame of `count` pings per observation time
+def generate_capture_pings(seed: int, frames: int, count: int, spread: float) -> list[Ping]:
+    rng = random.Random(seed)
+    return [Ping(str(uuid.UUID(int=rng.getrandbits(128))), f"CS{i}", time, time, 45.0 + rng.uniform(-spread, spread),
+                 10.0 + rng.uniform(-spread, spread)) for time in range(frames) for i in range(count)]
+
+
+class Test(TestCase):
+    """
+    Unit tests for capture loading and replay.
+
+    A loaded frame must view the packed records without copying them, and must fuse exactly like the pings that
+    were packed.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "frames.cap")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        pings = generate_capture_pings(1, 2, 3, 1.0)
+        batch = load_frame(pack_records(pings))
+        self.assertEqual([ping.track_id for ping in pings], batch.get_track_ids())
+        self.assertEqual([str(ping).replace(ping.callsign, "") for ping in pings],
+                         [str(ping) for ping in batch.to_pings()])
+        layout = record_layout(8)
+        batch = load_frame(pack_records(pings, layout), layout)
+        self.assertEqual([str(ping) for ping in pings], [str(ping) for ping in batch.to_pings()])
+        self.assertEqual(str(pings[4]), str(batch.ping(4)))
+
+    def test_integer_track_ids(self):
+        pings = [Ping(i << 40, f"CS{i}", i, i, 1.0 * i, -1.0 * i) for i in range(4)]
+        layout = record_layout(4, integer_ids=True)
+        batch = load_frame(pack_records(pings, layout), layout)
+        self.assertEqual(np.int64, batch.track_ids.dtype)
+        self.assertEqual([str(ping) for ping in pings], [str(ping) for ping in batch.to_pings()])
+        # without a layout, the records of integer track_ids take the integer layout
+        built = [Ping.Builder().build("BUILT", 1.0, 2.0) for _ in range(3)]
+        self.assertEqual([ping.track_id for ping in built],
+                         load_frame(pack_records(built), INTEGER_PING_RECORD).get_track_ids())
+        with self.assertRaises(ValueError):
+            pack_records(built, PING_RECORD)
+        with self.assertRaises(ValueError):
+            pack_records(generate_capture_pings(5, 1, 1, 1.0), INTEGER_PING_RECORD)
+        with self.assertRaises(ValueError):
+            pack_records([Ping(1 << 100, "WIDE", 0, 0, 0.0, 0.0)])
+
+    def test_columns_view_the_records(self):
+        pings = generate_capture_pings(2, 1, 10, 1.0)
+        data = bytearray(pack_records(pings))
+        # an offset and a count select a run of records inside a larger buffer
+        batch = load_frame(memoryview(data), offset=2 * PING_RECORD.itemsize, count=5)
+        self.assertEqual([ping.track_id for ping in pings[2:7]], batch.get_track_ids())
+        records = np.frombuffer(data, dtype=PING_RECORD)
+        for column in (batch.track_ids, batch.start_times, batch.observation_times, batch.latitudes,
+                       batch.longitudes):
+            self.assertTrue(np.shares_memory(column, records))
+        records["latitude"][2] = -1.5
+        self.assertEqual(-1.5, batch.latitudes[0])
+
+    def test_fuses_like_the_pings(self):
+        threshold = 5_000.0
+        pings = generate_capture_pings(3, 4, 200, 0.3)
+        with open(self.path, "wb") as capture_file:
+            capture_file.write(pack_records(pings, record_layout(8)))
+        expected, actual = PingGrid(threshold), PingGrid(threshold)
+        tracker = TrackerBase(threshold, expected)
+        fusions = [tracker.update_batch(PingBatch.from_pings(pings[time * 200:(time + 1) * 200])) for time in range(4)]
+        report = replay(TrackerBase(threshold, actual), self.path, record_layout(8))
+        self.assertEqual(4, report["frames"])
+        self.assertEqual(800, report["records"])
+        self.assertEqual(sum(len(fusion.matched_rows) for fusion in fusions), report["matched"])
+        self.assertEqual(sum(len(fusion.unmatched_rows) for fusion in fusions), report["unmatched"])
+        self.assertEqual(sorted(str(ping) for ping in expected), sorted(str(ping) for ping in actual))
+
+    def test_iter_frames(self):
+        pings = generate_capture_pings(4, 6, 3, 1.0)
+        with open(self.path, "wb") as capture_file:
+            capture_file.write(pack_records(pings))
+        self.assertEqual([3] * 6, [len(frame) for frame in iter_frames(self.path)])
+        self.assertEqual([6, 6, 6], [len(frame) for frame in iter_frames(self.path, frame_interval=2)])
+        self.assertEqual([[0, 0, 0, 1, 1, 1, 2, 2, 2], [3, 3, 3, 4, 4, 4, 5, 5, 5]],
+                         [frame.observation_times.tolist() for frame in iter_frames(self.path, frame_interval=3)])
+        with open(self.path, "ab") as capture_file:
+            capture_file.write(b"\0")
+        with self.assertRaises(ValueError):
+            list(iter_frames(self.path))
+        with self.assertRaises(ValueError):
+            list(iter_frames(self.path, frame_interval=0))
+        open(self.path, "wb").close()
+        self.assertEqual([], list(iter_frames(self.path)))
+
+    def test_invalid_records(self):
+        with self.assertRaises(ValueError):
+            load_frame(b"", np.dtype([("track_id", "V16"), ("latitude", "<f8")]))
+        with self.assertRaises(ValueError):
+            load_frame(b"\0" * (PING_RECORD.itemsize + 1))
+        with self.assertRaises(ValueError):
+            pack_records([Ping("not-a-uuid", "", 0, 0, 0.0, 0.0)])
+        with self.assertRaises(ValueError):
+            pack_records(generate_capture_pings(5, 1, 1, 1.0), record_layout(2))
+        with self.assertRaises(ValueError):
+            record_layout(-1)
+
+    def test_main(self):
+        with open(self.path, "wb") as capture_file:
+            capture_file.write(pack_records(generate_capture_pings(6, 3, 50, 0.3)))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(0, main([self.path, self.path, "--threshold", "10", "--backend", "ping_list",
+                                      "--uuid-ids"]))
+        report = json.loads(output.getvalue())
+        self.assertEqual([150, 150], [capture["records"] for capture in report["captures"]])
+        # the pings lie kilometers apart, so the first replay starts a track for each and the second re-observes them
+        self.assertEqual(150, report["tracks"])
+        self.assertEqual([0, 150], [capture["matched"] for capture in report["captures"]])
+        # integer track_ids, as issued by Ping.Builder, are the default
+        with open(self.path, "wb") as capture_file:
+            capture_file.write(pack_records([Ping.Builder().build("BUILT", 10.0 * i, 20.0) for i in range(5)]))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(0, main([self.path]))
+        self.assertEqual(5, json.loads(output.getvalue())["tracks"])
@@ -0,0 +1,59 @@
+from unittest import TestCase
+
+from deduplicator import PingDeduplicator
+from ping import Ping
+from test_fusible_grid import generate_random_pings
+from tracker_base import Geo2dDistanceCalculator
+
+
+def recursive_remove_duplicates(inputs: list[Ping], threshold: float) -> list[Ping]:
+    # The original PingList.remove_duplicates, kept as a reference implementation
+    distancer = Geo2dDistanceCalculator(threshold)
+    for i in range(len(inputs)):
+        for j in range(i + 1, len(inputs)):
+            if distancer.calculate((inputs[i].latitude, inputs[i].longitude),
+                                   (inputs[j].latitude, inputs[j].longitude)) < threshold:
+                inputs[i] = inputs[i].merge(inputs[j])
+                inputs.pop(j)
+                return recursive_remove_duplicates(inputs, threshold)
+    return inputs
+
+
+class Test(TestCase):
+    """
+    Unit tests for the PingDeduplicator class.
+
+    These tests compare the deduplicator against the original recursive implementation and verify
+    that it scales to batches that used to exceed the recursion limit.
+    """
+    def setUp(self):
+        self.threshold = 5.0
+        self.deduplicator = PingDeduplicator(self.threshold)
+
+    def test_remove_duplicates_with_identical_pings(self):
+        identical_pings = [Ping.Builder().build("N12345", 37.7749, -122.4194) for _ in range(6)]
+        unique_pings = self.deduplicator.remove_duplicates(identical_pings)
+        self.assertEqual(1, len(unique_pings), "Expected duplicates to be removed, leaving one unique ping.")
+        self.assertEqual(6, len(identical_pings), "Expected the input batch to be left untouched.")
+
+    def test_matches_recursive_implementation(self):
+        for seed in range(10):
+            pings = generate_random_pings(seed, 40, 37.7749, -122.4194, 0.00005)
+            expected = recursive_remove_duplicates(list(pings), self.threshold)
+            actual = self.deduplicator.remove_duplicates(pings)
+            self.assertEqual([str(ping) for ping in expected], [str(ping) for ping in actual])
+
+    def test_no_duplicates_remain(self):
+        distancer = Geo2dDistanceCalculator(self.threshold)
+        pings = generate_random_pings(3, 2000, 37.7749, -122.4194, 0.0005)
+        unique_pings = self.deduplicator.remove_duplicates(pings)
+        for i, a in enumerate(unique_pings):
+            for b in unique_pings[i + 1:]:
+                self.assertGreaterEqual(distancer.calculate((a.latitude, a.longitude), (b.latitude, b.longitude)),
+                                        self.threshold)
+
+    def test_large_batch_of_near_duplicates(self):
+        pings = generate_random_pings(5, 5000, 37.7749, -122.4194, 0.00001)
+        unique_pings = self.deduplicator.remove_duplicates(pings)
+        self.assertEqual(1, len(unique_pings), "Expected every near-duplicate to merge into a single ping.")
+        self.assertEqual("5-0", unique_pings[0].track_id, "Expected the earliest ping to keep its track_id.")
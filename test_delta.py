@@ -0,0 +1,125 @@
+from unittest import TestCase
+
+from abstract import TrackId
+from delta import DeltaEncoder, decode_deltas, TRACK_NEW, TRACK_MOVED, TRACK_MERGED, TRACK_CALLSIGN, TRACK_EVICTED
+from fusible_geo_hash import PingGeoHash
+from fusible_grid import PingGrid
+from fusible_nearest_neighbor import PingList
+from ping import Ping
+from ping_batch import PingBatch
+from test_fusible_grid import generate_random_pings
+from tracker_base import TrackerBase
+
+
+# apply_deltas: Apply change records to a mirror of the tracks, keyed by track_id
+def apply_deltas(mirror: dict[str, list], deltas: list[tuple]):
+    for delta in deltas:
+        kind = delta[0]
+        if kind == TRACK_NEW:
+            mirror[delta[1]] = [delta[2], delta[3], delta[4], delta[5]]
+        elif kind == TRACK_MOVED:
+            mirror[delta[1]][1:] = delta[2:]
+        elif kind == TRACK_MERGED:
+            mirror[delta[2]] = mirror.pop(delta[1])
+        elif kind == TRACK_CALLSIGN:
+            mirror[delta[1]][0] = delta[2]
+        elif kind == TRACK_EVICTED:
+            del mirror[delta[1]]
+
+
+# state: Describe the tracks of a tracker in the layout of the mirror
+def state(tracker: TrackerBase) -> dict[TrackId, list]:
+    return {track.track_id: [track.callsign, track.observation_time, track.latitude, track.longitude]
+            for track in tracker._fusible_collection}
+
+
+class Test(TestCase):
+    """
+    Unit tests for delta mode and the delta encoding.
+
+    Applying the recorded deltas to a copy of the tracks must reproduce the tracker's state after every update, and
+    decoding an encoded message must give back the records.
+    """
+    def setUp(self):
+        self.frames = [generate_random_pings(seed, 200, 45.0, 10.0, 0.01) for seed in range(5)]
+
+    def test_deltas_mirror_updates(self):
+        for factory in (PingList, PingGrid, PingGeoHash):
+            tracker = TrackerBase(50.0, factory(50.0), ttl=150, deltas=True)
+            mirror: dict[str, list] = {}
+            for i, frame in enumerate(self.frames):
+                # shift every frame in time so that the oldest tracks expire
+                frame = [Ping(ping.track_id, ping.callsign, ping.start_time + 100 * i,
+                              ping.observation_time + 100 * i, ping.latitude, ping.longitude) for ping in frame]
+                if i % 2:
+                    tracker.update_batch(PingBatch.from_pings(frame))
+                else:
+                    tracker.update(frame)
+                tracker.set_callsigns({frame[0].track_id: f"RENAMED{i}", "unknown": "NONE"})
+                apply_deltas(mirror, tracker.pop_deltas())
+                self.assertEqual(state(tracker), mirror, f"{factory.__name__} diverged in frame {i}")
+            self.assertEqual([], tracker.pop_deltas())
+
+    def test_merge_renames_track(self):
+        tracker = TrackerBase(50.0, PingGrid(50.0), deltas=True)
+        tracker.update([Ping("later", "LATER", 10, 10, 45.0, 10.0)])
+        tracker.update([Ping("earlier", "EARLIER", 5, 20, 45.0, 10.0001)])
+        self.assertEqual([(TRACK_NEW, "later", "LATER", 10, 45.0, 10.0), (TRACK_MERGED, "later", "earlier"),
+                          (TRACK_CALLSIGN, "earlier", "EARLIER"), (TRACK_MOVED, "earlier", 20, 45.0, 10.0001)],
+                         tracker.pop_deltas())
+        # a track fused twice in one batch is only renamed by the second, earlier starting, ping
+        tracker.update_batch(PingBatch.from_pings([Ping("first", "FIRST", 8, 15, 45.0, 10.0005),
+                                                   Ping("second", "SECOND", 1, 40, 45.0, 9.9997)]))
+        mirror = {"earlier": ["EARLIER", 20, 45.0, 10.0001]}
+        apply_deltas(mirror, tracker.pop_deltas())
+        self.assertEqual(state(tracker), mirror)
+        with self.assertRaises(ValueError):
+            TrackerBase(50.0, PingGrid(50.0)).pop_deltas()
+
+    def test_displaced_tracks_are_evicted(self):
+        track = Ping("track", "TRACK", 0, 0, 45.0, 10.0)
+        stale = Ping("stale", "STALE", 20_000, 20_000, 45.0, 10.0)
+        for batched in (False, True):
+            tracker = TrackerBase(50.0, PingGeoHash(50.0, time_window=5_000), deltas=True)
+            mirror: dict[str, list] = {}
+            tracker.update([track])
+            # the stale track shares the only slot of its cell with the new ping, which replaces it
+            if batched:
+                tracker.update_batch(PingBatch.from_pings([stale]))
+            else:
+                tracker.update([stale])
+            self.assertEqual(["track"], [evicted.track_id for evicted in tracker.pop_evicted()])
+            apply_deltas(mirror, tracker.pop_deltas())
+            self.assertEqual(state(tracker), mirror)
+
+    def test_encode_round_trip(self):
+        deltas = [(TRACK_NEW, "a", "ÅLAND1", 1_700_000_000_000, 45.5, -120.25), (TRACK_MOVED, "a", 5, -1.5, 2.5),
+                  (TRACK_MERGED, "a", "b"), (TRACK_CALLSIGN, "b", ""), (TRACK_EVICTED, "b")]
+        encoder = DeltaEncoder(8)
+        first = encoder.encode(deltas)
+        self.assertEqual(deltas, decode_deltas(first))
+        # the buffer has grown to fit, and is reused from then on, even while an earlier view is alive
+        buffer = encoder.buffer
+        self.assertEqual(deltas[:2], decode_deltas(encoder.encode(deltas[:2])))
+        self.assertIs(buffer, encoder.buffer)
+        self.assertEqual(b"", bytes(encoder.encode([])))
+        self.assertEqual(deltas * 50, decode_deltas(encoder.encode(deltas * 50)))
+
+    def test_integer_track_ids(self):
+        deltas = [(TRACK_NEW, 7, "A", 1, 45.5, -120.25), (TRACK_MOVED, 1 << 100, 5, -1.5, 2.5),
+                  (TRACK_MERGED, 7, "b"), (TRACK_MERGED, "b", 1 << 100), (TRACK_CALLSIGN, 7, "C"), (TRACK_EVICTED, 0)]
+        self.assertEqual(deltas, decode_deltas(DeltaEncoder().encode(deltas)))
+
+    def test_invalid_records(self):
+        encoder = DeltaEncoder()
+        with self.assertRaises(ValueError):
+            encoder.encode([(99, "a")])
+        encoded = bytes(encoder.encode([(TRACK_MOVED, "track", 5, 1.0, 2.0)]))
+        with self.assertRaises(ValueError):
+            decode_deltas(encoded[:-1])
+        with self.assertRaises(ValueError):
+            decode_deltas(encoded[:5])
+        with self.assertRaises(ValueError):
+            decode_deltas(b"\x63")
+        with self.assertRaises(ValueError):
+            DeltaEncoder(0)
@@ -17,8 +17,11 @@ Usage:
 from unittest import TestCase
 
 from ping import Ping
+from ping_batch import PingBatch
 from test_tracker_base import generate_far_coordinate, generate_close_coordinate
-from fusible_geo_hash import PingGeoHash
+from test_fusible_grid import generate_random_pings, summarize
+from fusible_geo_hash import PingGeoHash, PingNeighborGeoHash
+from fusible_nearest_neighbor import PingList
 
 
 class Test(TestCase):
@@ -67,3 +70,64 @@ class Test(TestCase):
         identical_pings = [Ping.Builder().build("N12345", 37.7749, -122.4194) for _ in range(6)]
         unique_pings = self.geo_hash.remove_duplicates(identical_pings)
         self.assertEqual(1, len(unique_pings), "Expected duplicates to be removed, leaving one unique ping.")
+
+
+class TestPingNeighborGeoHash(TestCase):
+
+    def setUp(self):
+        self.threshold = 5.0
+        self.geo_hash = PingNeighborGeoHash(self.threshold)
+
+    def test_fuse_across_cell_boundary(self):
+        # 37.265625 is a cell edge at every precision from 1 to 12
+        below = Ping("below", "A", 1, 1, 37.265625 - 0.000005, -122.4194)
+        above = Ping("above", "B", 2, 2, 37.265625 + 0.000005, -122.4194)
+        self.assertNotEqual(self.geo_hash.index.key((below.latitude, below.longitude)),
+                            self.geo_hash.index.key((above.latitude, above.longitude)))
+        self.geo_hash.fuse([below])
+        matched, unmatched = self.geo_hash.fuse([above])
+        self.assertEqual(1, len(matched), "Expected pings a meter apart across a cell edge to fuse.")
+        self.assertEqual(0, len(unmatched))
+
+    def test_matches_ping_list(self):
+        for threshold, latitude, longitude, spread in [(5.0, 37.7749, -122.4194, 0.0005),
+                                                       (100.0, 89.99, 15.6267, 0.009),
+                                                       (100.0, 0.0, 179.9995, 0.001),
+                                                       (10_000.0, -33.8688, 151.2093, 0.5)]:
+            geo_hash = PingNeighborGeoHash(threshold)
+            ping_list = PingList(threshold)
+            for seed in range(3):
+                pings = generate_random_pings(seed, 60, latitude, longitude, spread)
+                self.assertEqual(summarize(*ping_list.fuse(list(pings))), summarize(*geo_hash.fuse(list(pings))),
+                                 f"Expected PingNeighborGeoHash to match PingList for threshold {threshold}.")
+
+    def test_no_copy_matches_copy(self):
+        copying = PingNeighborGeoHash(self.threshold)
+        no_copy = PingNeighborGeoHash(self.threshold, copy_results=False)
+        hashed, hashed_no_copy = PingGeoHash(self.threshold), PingGeoHash(self.threshold, copy_results=False)
+        for seed in [0, 1, 0]:
+            pings = generate_random_pings(seed, 200, 45.0, 10.0, 0.001)
+            self.assertEqual(summarize(*copying.fuse(list(pings))), summarize(*no_copy.fuse(list(pings))))
+            self.assertEqual(summarize(*hashed.fuse(list(pings))), summarize(*hashed_no_copy.fuse(list(pings))))
+
+    def test_time_window(self):
+        track = Ping("track", "TRACK", 0, 0, 45.0, 10.0)
+        recent = Ping("recent", "RECENT", 4_000, 4_000, 45.0, 10.0)
+        stale = Ping("stale", "STALE", 20_000, 20_000, 45.0, 10.0)
+        geo_hash = PingGeoHash(50.0, time_window=5_000)
+        geo_hash.put(track)
+        self.assertEqual(2, len(geo_hash.put(recent)))
+        # the track was last observed at 4000, too long before the stale ping to fuse, which takes its cell
+        self.assertEqual(1, len(geo_hash.put(stale)))
+        self.assertIsNone(geo_hash.get("track"))
+        self.assertEqual("stale", geo_hash.get("stale").track_id)
+        self.assertEqual(["track"], [track.track_id for track in geo_hash.pop_displaced()])
+        self.assertEqual([], geo_hash.pop_displaced())
+        batched = PingGeoHash(50.0, time_window=5_000)
+        batched.fuse_batch(PingBatch.from_pings([track]))
+        batched.fuse_batch(PingBatch.from_pings([stale]))
+        self.assertEqual(["track"], [track.track_id for track in batched.pop_displaced()])
+        timeless = PingGeoHash(50.0)
+        timeless.put(track)
+        self.assertEqual(2, len(timeless.put(stale)))
+
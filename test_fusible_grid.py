@@ -0,0 +1,161 @@
+import math
+import random
+from unittest import TestCase
+
+from ping import Ping
+from test_tracker_base import generate_far_coordinate, generate_close_coordinate
+from fusible_geo_hash import PingNeighborGeoHash
+from fusible_grid import PingGrid
+from fusible_nearest_neighbor import PingList
+from spatial_index import QuadTreeIndex
+
+
+def generate_random_pings(seed: int, count: int, latitude: float, longitude: float, spread: float) -> list[Ping]:
+    rng = random.Random(seed)
+    return [Ping(f"{seed}-{i}", f"CS{i}", i, i, latitude + rng.uniform(-spread, spread),
+                 longitude + rng.uniform(-spread, spread)) for i in range(count)]
+
+
+def summarize(matched: list[tuple[Ping, Ping]], unmatched: list[Ping]) -> tuple[list, list]:
+    return ([(a.track_id, b.track_id) for a, b in matched], [ping.track_id for ping in unmatched])
+
+
+class Test(TestCase):
+    """
+    Unit tests for the PingGrid class.
+
+    These tests mirror the PingList tests and additionally verify that PingGrid produces exactly the
+    same matched/unmatched results as PingList, including across grid cell boundaries, the antimeridian
+    and at high latitudes.
+    """
+    def setUp(self):
+        self.threshold = 5.0
+        self.base_ping = Ping.Builder().build("BasePing", 37.7749, -122.4194)
+        self.grid = PingGrid(self.threshold)
+
+    def test_fuse_with_identical_pings(self):
+        ping_list = [self.base_ping for _ in range(3)]
+        matched, unmatched = PingGrid(self.threshold).fuse(ping_list)
+        self.assertEqual(0, len(matched), "Expected no matched pings when all are identical.")
+        self.assertEqual(1, len(unmatched), "Expected a single unmatched ping when all are identical.")
+
+    def test_fuse_repeated_with_same_pings(self):
+        far_pings = [self.base_ping]
+        for _ in range(1, 10):
+            far_pings.append(generate_far_coordinate(far_pings[-1]))
+        self.grid.fuse(far_pings)
+        matched, unmatched = self.grid.fuse(far_pings)
+        self.assertEqual(10, len(matched), "Expected all pings to match when the same set is fused again.")
+        self.assertEqual(0, len(unmatched), "Expected no unmatched pings when the same set is fused again.")
+
+    def test_fuse_close_pings(self):
+        close_pings = [Ping.Builder().build("ClosePing", 37.2783, -122.5432)]
+        close_pings.append(generate_close_coordinate(close_pings[-1]))
+        matched, unmatched = self.grid.fuse(close_pings)
+        self.assertEqual(0, len(matched), "Expected close pings to converge.")
+        self.assertEqual(1, len(unmatched), "Expected 1 unmatched converged.")
+
+    def test_fuse_across_cell_boundary(self):
+        cell_size = self.grid.index._cell_size
+        self.grid.fuse([Ping("a", "A", 1, 1, 10 * cell_size - 1e-7, 0.0)])
+        matched, unmatched = self.grid.fuse([Ping("b", "B", 2, 2, 10 * cell_size + 1e-7, 0.0)])
+        self.assertEqual(1, len(matched), "Expected pings on either side of a cell boundary to fuse.")
+
+    def test_matches_ping_list(self):
+        for threshold, latitude, longitude, spread in [(5.0, 37.7749, -122.4194, 0.0005),
+                                                       (100.0, 78.2232, 15.6267, 0.01),
+                                                       (100.0, 0.0, 179.9995, 0.001),
+                                                       (10_000.0, -33.8688, 151.2093, 0.5)]:
+            grids = [PingGrid(threshold), PingGrid(threshold, QuadTreeIndex(threshold, capacity=4))]
+            ping_list = PingList(threshold)
+            for seed in range(3):
+                pings = generate_random_pings(seed, 60, latitude, longitude, spread)
+                expected = summarize(*ping_list.fuse(list(pings)))
+                for grid in grids:
+                    self.assertEqual(expected, summarize(*grid.fuse(list(pings))),
+                                     f"Expected {type(grid.index).__name__} to match PingList at {threshold} m.")
+            for grid in grids:
+                self.assertEqual([str(track) for track in ping_list._tracks], [str(track) for track in grid._tracks])
+
+    def test_remove_keeps_index_consistent(self):
+        rng = random.Random(4)
+        reference = PingList(50.0)
+        others = [PingGrid(50.0), PingList(50.0, vectorized=True), PingGrid(50.0, QuadTreeIndex(50.0, capacity=4))]
+        pings = generate_random_pings(4, 300, 45.0, 10.0, 0.01)
+        expected = summarize(*reference.fuse(list(pings)))
+        for other in others:
+            self.assertEqual(expected, summarize(*other.fuse(list(pings))))
+        for ping in rng.sample(pings, 100):
+            removed = str(reference.remove(ping.track_id))
+            for other in others:
+                self.assertEqual(removed, str(other.remove(ping.track_id)))
+                self.assertIsNone(other.get(ping.track_id))
+                self.assertEqual(len(reference), len(other))
+        self.assertIsNone(others[0].remove("unknown"))
+        pings = generate_random_pings(5, 300, 45.0, 10.0, 0.01)
+        expected = summarize(*reference.fuse(list(pings)))
+        for other in others:
+            self.assertEqual(expected, summarize(*other.fuse(list(pings))))
+        for grid in (others[0], others[2]):
+            for i, track in enumerate(grid._tracks):
+                self.assertIn(i, grid.index.query((track.latitude, track.longitude)))
+
+    def test_motion_prediction(self):
+        # targets a kilometer apart fly east at 35 m per frame and are all missed in the third frame
+        step = 35.0 / (111_319.49 * math.cos(math.radians(45.0)))
+        frames = [[Ping(f"{frame}-{target}", f"T{target}", 1000 * frame, 1000 * frame, 45.0 + 0.01 * target,
+                        10.0 + step * frame) for target in range(30)] for frame in (0, 1, 2, 4, 5)]
+        reference = PingList(50.0, motion_prediction=True)
+        others = [PingList(50.0, vectorized=True, motion_prediction=True),
+                  PingGrid(50.0, motion_prediction=True, time_window=2000),
+                  PingGrid(50.0, QuadTreeIndex(50.0, capacity=4), motion_prediction=True, time_window=2000),
+                  PingNeighborGeoHash(50.0, motion_prediction=True, time_window=2000)]
+        static = PingGrid(50.0)
+        for frame in frames:
+            expected = summarize(*reference.fuse(list(frame)))
+            for other in others:
+                self.assertEqual(expected, summarize(*other.fuse(list(frame))))
+            static_matched, _ = static.fuse(list(frame))
+        # after the missed frame only the predicted tracks are close enough to fuse with
+        self.assertEqual(30, len(reference))
+        self.assertEqual(60, len(static))
+        self.assertEqual(30, len(static_matched))
+        for other in others:
+            self.assertEqual([str(track) for track in reference._tracks], [str(track) for track in other._tracks])
+        for track in reference._tracks[:10]:
+            for other in [reference] + others:
+                other.remove(track.track_id)
+        for grid in others[1:]:
+            for i, track in enumerate(grid._tracks):
+                self.assertIn(i, grid.index.query((track.latitude, track.longitude)))
+        with self.assertRaises(ValueError):
+            PingGrid(50.0, motion_prediction=True)
+
+    def test_time_window(self):
+        pings = generate_random_pings(6, 300, 45.0, 10.0, 0.01)
+        later = [Ping(f"later-{i}", ping.callsign, ping.start_time + 10_000, ping.observation_time + 10_000,
+                      ping.latitude, ping.longitude)
+                 for i, ping in enumerate(generate_random_pings(7, 300, 45.0, 10.0, 0.01))]
+        reference = PingList(50.0, time_window=5_000)
+        others = [PingList(50.0, vectorized=True, time_window=5_000), PingGrid(50.0, time_window=5_000),
+                  PingGrid(50.0, QuadTreeIndex(50.0, capacity=4), time_window=5_000),
+                  PingNeighborGeoHash(50.0, time_window=5_000)]
+        for batch in (pings, later, pings):
+            expected = summarize(*reference.fuse(list(batch)))
+            for other in others:
+                self.assertEqual(expected, summarize(*other.fuse(list(batch))))
+        # the later pings are observed too long after the first batch to fuse with any of its tracks
+        timeless = PingList(50.0)
+        timeless.fuse(list(pings))
+        matched, _ = timeless.fuse(list(later))
+        self.assertGreater(len(matched), 0)
+        windowed = PingList(50.0, time_window=5_000)
+        windowed.fuse(list(pings))
+        matched, unmatched = windowed.fuse(list(later))
+        self.assertEqual(len(windowed.remove_duplicates(list(later))), len(unmatched) + len(matched))
+        self.assertTrue(all(track.track_id.startswith("later-") for track, _ in matched))
+        for track in list(reference)[:50]:
+            for other in [reference] + others:
+                other.remove(track.track_id)
+        for other in others:
+            self.assertEqual([str(track) for track in reference], [str(track) for track in other])
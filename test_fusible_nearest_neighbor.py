@@ -2,6 +2,7 @@ from unittest import TestCase
 
 from ping import Ping
 from test_tracker_base import generate_far_coordinate, generate_close_coordinate
+from test_fusible_grid import generate_random_pings, summarize
 from fusible_nearest_neighbor import PingList
 
 
@@ -88,3 +89,30 @@ class Test(TestCase):
         unique_pings = self.nearest_neighbor.remove_duplicates(identical_pings)
         self.assertEqual(1, len(unique_pings), "Expected duplicates to be removed, leaving one unique ping.")
 
+
+    def test_vectorized_matches_scalar(self):
+        """
+        Test that the vectorized batch path fuses exactly like the scalar path in every distance regime.
+        """
+        for threshold, spread in [(5.0, 0.0005), (100.0, 0.01), (10_000.0, 0.5)]:
+            scalar = PingList(threshold)
+            vectorized = PingList(threshold, vectorized=True)
+            for seed in range(3):
+                pings = generate_random_pings(seed, 60, 37.7749, -122.4194, spread)
+                self.assertEqual(summarize(*scalar.fuse(list(pings))), summarize(*vectorized.fuse(list(pings))))
+
+    def test_no_copy_matches_copy(self):
+        """
+        Test that the no-copy mode fuses like the default mode and that a matched pair keeps the track as it was
+        before the merge, even as the collection keeps fusing.
+        """
+        copying = PingList(100.0)
+        no_copy = PingList(100.0, copy_results=False)
+        for seed in [0, 1, 0]:
+            pings = generate_random_pings(seed, 60, 37.7749, -122.4194, 0.01)
+            matched, unmatched = no_copy.fuse(list(pings))
+            self.assertEqual(summarize(*copying.fuse(list(pings))), summarize(matched, unmatched))
+        before = [(old.track_id, old.observation_time, old.latitude) for old, _ in matched]
+        no_copy.fuse(generate_random_pings(1, 60, 37.7749, -122.4194, 0.01))
+        self.assertEqual(before, [(old.track_id, old.observation_time, old.latitude) for old, _ in matched])
+        self.assertTrue(all(unmatched_ping is no_copy.get(unmatched_ping.track_id) for unmatched_ping in unmatched))
@@ -1,7 +1,13 @@
 import timeit
 from unittest import TestCase
 
-from geo_calc import geodesic_distance, euclidean_distance, great_circle_distance
+import numpy as np
+from geopy.distance import geodesic, great_circle
+
+from geo_calc import geodesic_distance, euclidean_distance, great_circle_distance, geodesic_distances, \
+    euclidean_distances, great_circle_distances, geodesic_distance_matrix, euclidean_squared_degrees, \
+    local_tangent_plane_distance, local_tangent_plane_distances
+from constants import DEGREES_TO_METERS
 
 
 def find_distance_difference_threshold(lat1, lon1, distance_func1, distance_func2, start_lat, start_lon,
@@ -35,6 +41,50 @@ class Test(TestCase):
         dist = round(great_circle_distance(p1, p2), 2)
         self.assertEqual(dist, 14.17)
 
+    def test_local_tangent_plane_distance(self):
+        self.assertAlmostEqual(euclidean_distance((0.0, 10.0), (0.0, 10.001)),
+                               local_tangent_plane_distance((0.0, 10.0), (0.0, 10.001)))
+        self.assertAlmostEqual(0.5 * euclidean_distance((60.0, 10.0), (60.0, 10.001)),
+                               local_tangent_plane_distance((60.0, 10.0), (60.0, 10.001)), places=3)
+        self.assertAlmostEqual(geodesic_distance((60.0, 179.9999), (60.0, -179.9999)),
+                               local_tangent_plane_distance((60.0, 179.9999), (60.0, -179.9999)), delta=0.1)
+        self.assertAlmostEqual(euclidean_distance((1.0, 2.0), (1.00003, 2.00004)) ** 2,
+                               euclidean_squared_degrees((1.0, 2.0), (1.00003, 2.00004)) * DEGREES_TO_METERS ** 2)
+
+    def test_scalar_kernels_match_geopy(self):
+        rng = np.random.default_rng(7)
+        for _ in range(2000):
+            p1 = (rng.uniform(-90.0, 90.0), rng.uniform(-200.0, 200.0))
+            p2 = (min(90.0, max(-90.0, p1[0] + rng.uniform(-0.01, 0.01))), rng.uniform(-200.0, 200.0))
+            self.assertEqual(great_circle(p1, p2).meters, great_circle_distance(p1, p2))
+            self.assertEqual(geodesic(p1, p2).meters, geodesic_distance(p1, p2))
+        with self.assertRaises(ValueError):
+            great_circle_distance((90.5, 0.0), (0.0, 0.0))
+
+    def test_batch_distances_match_scalar(self):
+        rng = np.random.default_rng(42)
+        latitudes = rng.uniform(-89.0, 89.0, 500)
+        longitudes = rng.uniform(-180.0, 180.0, 500)
+        p1 = (37.7749, 122.4194)
+        for batch, scalar, tolerance in [(euclidean_distances, euclidean_distance, 1e-6),
+                                         (local_tangent_plane_distances, local_tangent_plane_distance, 1e-6),
+                                         (great_circle_distances, great_circle_distance, 1e-6),
+                                         (geodesic_distances, geodesic_distance, 1e-3)]:
+            distances = batch(p1, latitudes, longitudes)
+            for i in range(len(latitudes)):
+                self.assertAlmostEqual(scalar(p1, (latitudes[i], longitudes[i])), distances[i],
+                                       delta=tolerance)
+
+    def test_geodesic_distance_matrix(self):
+        latitudes = np.array([0.0, 37.7749, -33.8688])
+        longitudes = np.array([0.0, 122.4194, 151.2093])
+        matrix = geodesic_distance_matrix(latitudes, longitudes, latitudes[:2], longitudes[:2])
+        self.assertEqual((3, 2), matrix.shape)
+        self.assertEqual(0.0, matrix[1, 1])
+        # nearly antipodal points fall back to the scalar geodesic distance
+        antipodal = geodesic_distances((0.0, 0.0), np.array([0.5]), np.array([179.7]))
+        self.assertAlmostEqual(geodesic_distance((0.0, 0.0), (0.5, 179.7)), antipodal[0], delta=1e-3)
+
     def test_benchmarks(self):
         euclidean_bench = timeit.timeit("euclidean_distance((37.7749, 122.41945), (37.7749, 122.41945))",
                                         setup="from geo_calc import euclidean_distance", number=100000)
@@ -0,0 +1,61 @@
+import random
+import uuid
+from unittest import TestCase
+
+from ids import IntegerIdGenerator, IdTable, id_kind, ID_STRINGS, ID_INT64, ID_INT128, ID_MIXED
+from ping import Ping
+
+
+class Test(TestCase):
+    """
+    Unit tests for integer track ids.
+
+    Generated ids must fit their declared size, and an IdTable must map every external id to one integer id and back.
+    """
+    def test_integer_id_generator(self):
+        narrow, wide = IntegerIdGenerator(rng=random.Random(1)), IntegerIdGenerator(128, random.Random(1))
+        narrow_ids = [narrow.generate_id() for _ in range(1000)]
+        self.assertTrue(all(0 <= track_id < 1 << 63 for track_id in narrow_ids))
+        self.assertEqual(1000, len(set(narrow_ids)))
+        self.assertTrue(any(track_id >= 1 << 64 for track_id in (wide.generate_id() for _ in range(10))))
+        # a seeded generator issues the same ids again
+        again = IntegerIdGenerator(rng=random.Random(1))
+        self.assertEqual(narrow_ids[:5], [again.generate_id() for _ in range(5)])
+        self.assertIsInstance(Ping.Builder().build("N12345", 1.0, 2.0).track_id, int)
+        with self.assertRaises(ValueError):
+            IntegerIdGenerator(32)
+
+    def test_id_table(self):
+        table = IdTable()
+        external_id = str(uuid.uuid4())
+        track_id = table.intern(external_id)
+        self.assertIsInstance(track_id, int)
+        self.assertEqual(track_id, table.intern(external_id))
+        self.assertNotEqual(track_id, table.intern("other"))
+        self.assertEqual(external_id, table.external(track_id))
+        self.assertIn(track_id, table)
+        # an id issued inside the tracker gets an external id on first use, which interns back to it
+        self.assertEqual("00000000000000ff", table.external(255))
+        self.assertEqual(255, table.intern("00000000000000ff"))
+        self.assertEqual(str(uuid.UUID(int=1 << 100)), table.external(1 << 100))
+        self.assertEqual(4, len(table))
+        table.forget(track_id)
+        table.forget(track_id)
+        self.assertNotIn(track_id, table)
+        self.assertEqual(3, len(table))
+        # an added entry replaces the entries of its id and of its external id
+        table.add(external_id, 255)
+        table.add("other", 7)
+        self.assertEqual((255, 7), (table.find(external_id), table.find("other")))
+        self.assertIsNone(table.find("00000000000000ff"))
+        self.assertEqual(3, len(table))
+
+    def test_id_kind(self):
+        self.assertEqual(ID_STRINGS, id_kind([]))
+        self.assertEqual(ID_STRINGS, id_kind(["a", "b"]))
+        self.assertEqual(ID_INT64, id_kind([0, (1 << 63) - 1]))
+        self.assertEqual(ID_INT128, id_kind([1, 1 << 63]))
+        self.assertEqual(ID_MIXED, id_kind(["a", 1 << 100]))
+        for invalid in ([-1], ["a", 1 << 128]):
+            with self.assertRaises(ValueError):
+                id_kind(invalid)
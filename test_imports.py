@@ -0,0 +1,26 @@
+import sys
+from unittest import TestCase
+
+from benchmark import TRACKER_MODULES, import_in_fresh_interpreter
+
+# Modules that importing the tracker must not load: type checkers, and geo libraries only some paths need
+HEAVY_MODULES = ["mypy", "geopy", "geographiclib", "pygeohash"]
+
+
+class Test(TestCase):
+    """
+    Guards the import path of the tracker, which short-lived workers pay for on every start. The import time itself is
+    reported by the benchmark.
+    """
+    def test_no_heavy_imports(self):
+        result = import_in_fresh_interpreter(TRACKER_MODULES)
+        self.assertEqual([], [name for name in HEAVY_MODULES if name in result["modules"]])
+
+    def test_geo_libraries_load_on_first_use(self):
+        from fusible_geo_hash import PingGeoHash
+        from geo_calc import geodesic_distance
+        from ping import Ping
+        PingGeoHash(100.0).put(Ping("a", "A", 1, 1, 10.0, 20.0))
+        self.assertIn("pygeohash", sys.modules)
+        self.assertAlmostEqual(111_319.49, geodesic_distance((0.0, 0.0), (0.0, 1.0)), places=2)
+        self.assertIn("geographiclib", sys.modules)
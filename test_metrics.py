@@ -0,0 +1,100 @@
+from unittest import TestCase
+
+from fusible_geo_hash import PingGeoHash
+from fusible_grid import PingGrid
+from fusible_nearest_neighbor import PingList
+from metrics import CountingDistanceCalculator
+from ping import Ping
+from ping_batch import PingBatch
+from test_fusible_grid import generate_random_pings, summarize
+from tracker_base import TrackerBase
+
+
+class Test(TestCase):
+    """
+    Unit tests for the TrackerMetrics class.
+
+    Metrics must count what the tracker did without changing it, and must leave no trace once disabled.
+    """
+    def test_counts_update(self):
+        tracker = TrackerBase(50.0, PingGrid(50.0))
+        metrics = tracker.enable_metrics()
+        first = [Ping(f"a{i}", f"A{i}", i, i, 10.0 + i, 20.0) for i in range(3)]
+        second = [Ping(f"b{i}", f"B{i}", 10 + i, 10 + i, 10.0 + i, 20.0001) for i in range(2)]
+        tracker.update(first)
+        tracker.update(second)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(5, snapshot["pings"])
+        self.assertEqual(2, snapshot["matched"])
+        self.assertEqual(3, snapshot["unmatched"])
+        self.assertEqual(0.4, snapshot["match_rate"])
+        self.assertEqual(3, snapshot["collection_size"])
+        self.assertEqual(5, snapshot["searches"])
+        self.assertEqual(2, snapshot["candidates"])
+        self.assertGreaterEqual(snapshot["distance_calls"], snapshot["candidates"])
+        self.assertEqual(2, snapshot["stage_calls"]["update"])
+        self.assertEqual(5, snapshot["stage_calls"]["put"])
+        for stage in ("update", "fuse", "deduplicate", "put", "search", "store"):
+            self.assertGreater(snapshot["stage_seconds"][stage], 0.0)
+        self.assertGreaterEqual(snapshot["stage_seconds"]["update"], snapshot["stage_seconds"]["fuse"])
+
+    def test_results_unchanged(self):
+        pings = generate_random_pings(4, 300, 45.0, 10.0, 0.01)
+        for factory in (PingList, PingGrid, PingGeoHash):
+            reference = TrackerBase(50.0, factory(50.0))
+            tracker = TrackerBase(50.0, factory(50.0))
+            tracker.enable_metrics()
+            for _ in range(2):
+                self.assertEqual(summarize(*reference.update(list(pings))), summarize(*tracker.update(list(pings))))
+            self.assertEqual(len(tracker._fusible_collection), tracker.metrics.collection_size)
+
+    def test_counts_geo_hash_lookups(self):
+        tracker = TrackerBase(50.0, PingGeoHash(50.0))
+        metrics = tracker.enable_metrics()
+        tracker.update([Ping(f"a{i}", f"A{i}", i, i, 10.0 + i, 20.0) for i in range(3)])
+        tracker.update([Ping("b", "B", 10, 10, 10.0, 20.0)])
+        tracker.update_batch(PingBatch.from_pings([Ping("c", "C", 20, 20, 11.0, 20.0)]))
+        snapshot = metrics.snapshot()
+        # each cell lookup is a search of the single track the cell can hold
+        self.assertEqual(5, snapshot["searches"])
+        self.assertEqual(2, snapshot["candidates"])
+        self.assertEqual(0.4, snapshot["candidates_per_search"])
+        self.assertGreater(snapshot["stage_seconds"]["search"], 0.0)
+        tracker.disable_metrics()
+        self.assertNotIn("_cell_track", vars(tracker._fusible_collection))
+
+    def test_update_batch(self):
+        pings = generate_random_pings(5, 50, 45.0, 10.0, 0.01)
+        tracker = TrackerBase(50.0, PingGrid(50.0))
+        metrics = tracker.enable_metrics()
+        fusion = tracker.update_batch(PingBatch.from_pings(pings))
+        self.assertEqual(50, metrics.pings)
+        self.assertEqual(len(fusion.matched_rows) + len(fusion.unmatched_rows), metrics.matched + metrics.unmatched)
+        self.assertEqual(1, metrics.stage_calls["update"])
+
+    def test_disable_removes_instrumentation(self):
+        collection = PingGrid(50.0)
+        tracker = TrackerBase(50.0, collection)
+        distancer = collection.distancer
+        self.assertIs(tracker.enable_metrics(), tracker.enable_metrics())
+        self.assertIsInstance(collection.distancer, CountingDistanceCalculator)
+        self.assertIn("put", vars(collection))
+        tracker.disable_metrics()
+        self.assertIsNone(tracker.metrics)
+        self.assertIs(distancer, collection.distancer)
+        self.assertIs(distancer, collection.deduplicator.distancer)
+        self.assertNotIn("put", vars(collection))
+        self.assertNotIn("update", vars(tracker))
+
+    def test_prometheus(self):
+        tracker = TrackerBase(50.0, PingList(50.0))
+        metrics = tracker.enable_metrics()
+        tracker.update([Ping("a", "A", 1, 1, 10.0, 20.0)])
+        text = metrics.to_prometheus()
+        self.assertIn("# TYPE tracker_pings_total counter\ntracker_pings_total 1\n", text)
+        self.assertIn('tracker_stage_calls_total{stage="update"} 1\n', text)
+        self.assertIn("# TYPE tracker_collection_size gauge\ntracker_collection_size 1\n", text)
+        metrics.reset()
+        self.assertEqual(0, metrics.snapshot()["pings"])
+        self.assertIsNone(metrics.snapshot()["match_rate"])
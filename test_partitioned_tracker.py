@@ -0,0 +1,94 @@
+import random
+from unittest import TestCase
+
+from fusible_grid import PingGrid
+from partitioned_tracker import PartitionedTracker, GeoHashPartitioner
+from ping import Ping
+from test_fusible_grid import generate_random_pings, summarize
+from tracker_base import TrackerBase
+
+
+def sorted_summary(matched: list[tuple[Ping, Ping]], unmatched: list[Ping]) -> tuple[list, list]:
+    matched_ids, unmatched_ids = summarize(matched, unmatched)
+    return sorted(matched_ids), sorted(unmatched_ids)
+
+
+def find_shard_border(partitioner: GeoHashPartitioner, latitude: float) -> float:
+    """
+    Returns a longitude on the edge between two prefix cells owned by different shards at the given latitude.
+    """
+    width = 360.0 / 2 ** (5 * partitioner.precision - 5 * partitioner.precision // 2)
+    for column in range(1, round(360.0 / width)):
+        edge = -180.0 + column * width
+        if partitioner.shard_of((latitude, edge - width / 2)) != partitioner.shard_of((latitude, edge + width / 2)):
+            return edge
+    raise AssertionError("Expected neighboring cells owned by different shards.")
+
+
+class Test(TestCase):
+    """
+    Unit tests for the PartitionedTracker class.
+
+    Away from shard borders a partitioned tracker must fuse exactly like a single TrackerBase. Pings close to a
+    border must still find the tracks on the other side, and tracks that move across a border must follow.
+    """
+    def setUp(self):
+        self.threshold = 50.0
+
+    def test_partitioner(self):
+        partitioner = GeoHashPartitioner(self.threshold, 4)
+        self.assertEqual(3, partitioner.precision)
+        self.assertEqual({partitioner.shard_of((10.7, 20.7))}, partitioner.shards_near((10.7, 20.7)))
+        self.assertEqual(set(range(4)), partitioner.shards_near((90.0, 0.0)))
+        edge = find_shard_border(partitioner, 10.7)
+        self.assertEqual(2, len(partitioner.shards_near((10.7, edge + 1e-5))))
+
+    def test_matches_tracker_base_away_from_borders(self):
+        pings: list[Ping] = []
+        rng = random.Random(1)
+        # clusters around the centers of prefix cells, which are about 156 km wide
+        cell_size = 180.0 / 2 ** 7
+        for seed in range(5):
+            pings += generate_random_pings(seed, 300, (rng.randrange(40, 88) + 0.5) * cell_size - 90.0,
+                                           (rng.randrange(0, 256) + 0.5) * cell_size - 180.0, 0.01)
+        collection = PingGrid(self.threshold)
+        reference = TrackerBase(self.threshold, collection)
+        tracker = PartitionedTracker(self.threshold, shards=4, processes=False)
+        for _ in range(2):
+            self.assertEqual(sorted_summary(*reference.update(list(pings))),
+                             sorted_summary(*tracker.update(list(pings))))
+        self.assertEqual(len(collection), len(tracker))
+        self.assertEqual(str(reference.get(pings[7].track_id)), str(tracker.get(pings[7].track_id)))
+
+    def test_tracks_cross_shard_borders(self):
+        tracker = PartitionedTracker(self.threshold, shards=2, processes=False)
+        edge = find_shard_border(tracker.partitioner, 10.7)
+        west = [Ping(f"w{i}", f"W{i}", i, i, 10.7 + i * 0.01, edge - 1e-4) for i in range(10)]
+        east = [Ping(f"e{i}", f"E{i}", 100 + i, 100 + i, 10.7 + i * 0.01, edge + 1e-4) for i in range(10)]
+        self.assertEqual(10, len(tracker.update(west)[1]))
+        matched, unmatched = tracker.update(east)
+        self.assertEqual(sorted((f"w{i}", f"e{i}") for i in range(10)), sorted(summarize(matched, unmatched)[0]))
+        self.assertEqual(10, len(tracker))
+
+        # the tracks moved east, into the other shard, and must still be found and fused there
+        track = tracker.get("w3")
+        self.assertEqual(edge + 1e-4, track.longitude)
+        tracker.set_callsign("w3", "MOVED")
+        self.assertEqual("MOVED", tracker.get("w3").callsign)
+        further_east = [Ping(f"f{i}", f"F{i}", 200 + i, 200 + i, 10.7 + i * 0.01, edge + 4e-4) for i in range(10)]
+        matched, unmatched = tracker.update(further_east)
+        self.assertEqual(10, len(matched))
+        self.assertEqual(0, len(unmatched))
+
+    def test_worker_processes(self):
+        pings = generate_random_pings(3, 200, 45.0, 10.0, 2.0)
+        with PartitionedTracker(self.threshold, shards=2) as tracker:
+            expected = sorted_summary(*TrackerBase(self.threshold, PingGrid(self.threshold)).update(list(pings)))
+            self.assertEqual(expected, sorted_summary(*tracker.update(list(pings))))
+            tracker.set_callsign(pings[0].track_id, "WORKER")
+            self.assertEqual("WORKER", tracker.get(pings[0].track_id).callsign)
+            self.assertIsNone(tracker.get("unknown"))
+
+    def test_invalid_shards(self):
+        with self.assertRaises(ValueError):
+            PartitionedTracker(self.threshold, shards=0, processes=False)
@@ -1,6 +1,25 @@
+import gc
+import tracemalloc
+import uuid
 from unittest import TestCase
 
-from ping import Ping
+from ping import Ping, MovingPing
+
+
+def measure_bytes_per_ping(ping_type: type, count: int = 20_000) -> float:
+    """
+    Measures the memory allocated per Ping, including its uuid4 track_id string, timestamps and coordinates.
+    """
+    pings: list = [None] * count
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        pings[i] = ping_type(str(uuid.uuid4()), "N12345", 1_700_000_000_000 + i, 1_700_000_000_000 + i,
+                             37.7749 + i * 1e-6, -122.4194 - i * 1e-6)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / count
 
 
 class Test(TestCase):
@@ -43,3 +62,39 @@ class Test(TestCase):
         self.assertEqual(merged_ping.observation_time, 10, "observation_time has not but updated")
         self.assertEqual(merged_ping.latitude, 74.1200003, "latitude was changed")
         self.assertEqual(merged_ping.longitude, 33.4500006, "longitude was changed")
+
+    def test_merge_estimates_velocity(self):
+        """
+        Tests that a merge with `velocity` estimates the velocity from the positions and observation times of both
+        Pings, in either order, and that `predict` extrapolates the newest position with it.
+        """
+        track = Ping("1", "A", 1, 10, 10.0, 179.5)
+        ping = Ping("2", "B", 2, 20, 11.0, -179.5)
+        for merged in (track.merge(ping, velocity=True), ping.merge(track, velocity=True)):
+            self.assertIsInstance(merged, MovingPing)
+            self.assertAlmostEqual(0.1, merged.latitude_rate)
+            self.assertAlmostEqual(0.1, merged.longitude_rate)
+            predicted = merged.predict(30)
+            self.assertAlmostEqual(12.0, predicted[0])
+            self.assertAlmostEqual(-178.5, predicted[1])
+        simultaneous = merged.merge(Ping("3", "C", 3, 20, 11.0, -179.5), velocity=True)
+        self.assertEqual((0.0, 0.0), (simultaneous.latitude_rate, simultaneous.longitude_rate))
+        self.assertEqual((11.0, -179.5), Ping("4", "D", 1, 1, 11.0, -179.5).predict(100))
+        # without velocity a merge makes a plain Ping, which stores no rates
+        plain = track.merge(ping)
+        self.assertIs(Ping, type(plain))
+        self.assertEqual((0.0, 0.0), (plain.latitude_rate, plain.longitude_rate))
+        self.assertIs(Ping, type(Ping("5", "E", 1, 1, 1.0, 1.0).merge(Ping("6", "F", 2, 2, 1.0, 1.0), velocity=True)))
+
+    def test_memory_footprint(self):
+        """
+        Measures the bytes per Ping with slots against the same class with an instance __dict__.
+        """
+        class DictPing(Ping):
+            pass
+
+        slotted = measure_bytes_per_ping(Ping)
+        with_dict = measure_bytes_per_ping(DictPing)
+        print(f"Bytes per Ping: {slotted:.0f} with slots, {with_dict:.0f} with an instance __dict__")
+        self.assertFalse(hasattr(Ping("1", "A", 1, 1, 1, 1), "__dict__"), "Ping should not have an instance __dict__")
+        self.assertLess(slotted, with_dict)
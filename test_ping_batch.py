@@ -0,0 +1,79 @@
+from unittest import TestCase
+
+import numpy as np
+
+from fusible_geo_hash import PingGeoHash
+from fusible_grid import PingGrid
+from fusible_nearest_neighbor import PingList
+from ping import Ping
+from ping_batch import PingBatch
+from test_fusible_grid import generate_random_pings, summarize
+from tracker_base import TrackerBase
+
+
+def summarize_batch(batch: PingBatch, fusion) -> tuple[list, list]:
+    return ([(track_id, batch.track_ids[row]) for row, track_id in zip(fusion.matched_rows, fusion.matched_track_ids)],
+            [batch.track_ids[row] for row in fusion.unmatched_rows])
+
+
+class Test(TestCase):
+    """
+    Unit tests for the PingBatch class and the columnar fuse_batch path.
+
+    fuse_batch must leave a collection in exactly the state fuse would, and report the same matched and
+    unmatched pings, by row instead of by copy.
+    """
+    def test_round_trip(self):
+        pings = generate_random_pings(1, 20, 10.0, 20.0, 0.01)
+        batch = PingBatch.from_pings(pings)
+        self.assertEqual(20, len(batch))
+        self.assertEqual(np.int64, batch.start_times.dtype)
+        self.assertEqual([str(ping) for ping in pings], [str(ping) for ping in batch.to_pings()])
+        self.assertEqual(str(pings[3]), str(batch.ping(3)))
+        self.assertEqual(str, type(batch.ping(3).track_id))
+        self.assertEqual(float, type(batch.ping(3).latitude))
+
+    def test_ping_takes_position_from_newest_row(self):
+        batch = PingBatch.from_pings([Ping("a", "A", 1, 1, 1.0, 2.0), Ping("b", "B", 2, 5, 3.0, 4.0)])
+        merged = batch.ping(0, 1)
+        self.assertEqual(("a", "A", 1, 5, 3.0, 4.0), (merged.track_id, merged.callsign, merged.start_time,
+                                                      merged.observation_time, merged.latitude, merged.longitude))
+
+    def test_take(self):
+        batch = PingBatch.from_pings(generate_random_pings(2, 10, 0.0, 0.0, 1.0))
+        subset = batch.take(np.array([7, 2]))
+        self.assertEqual(["2-7", "2-2"], list(subset.track_ids))
+        self.assertEqual(batch.latitudes[7], subset.latitudes[0])
+
+    def test_mismatched_columns(self):
+        with self.assertRaises(ValueError):
+            PingBatch(["a", "b"], ["A", "B"], [1, 2], [1, 2], [0.0], [0.0, 1.0])
+
+    def test_fuse_batch_matches_fuse(self):
+        for factory in [lambda: PingList(50.0), lambda: PingList(50.0, vectorized=True), lambda: PingGrid(50.0),
+                        lambda: PingGeoHash(6), lambda: PingList(50.0, optimal_assignment=True),
+                        lambda: PingGrid(50.0, optimal_assignment=True)]:
+            reference, columnar = factory(), factory()
+            for seed in range(4):
+                pings = generate_random_pings(seed % 2, 300, 45.0, 10.0, 0.01)
+                batch = PingBatch.from_pings(pings)
+                expected = summarize(*reference.fuse(pings))
+                fusion = columnar.fuse_batch(batch)
+                self.assertEqual(expected, summarize_batch(batch, fusion))
+                self.assertEqual(len(batch), len(fusion.representatives))
+                reported = set(fusion.matched_rows) | set(fusion.unmatched_rows)
+                for representative in fusion.representatives:
+                    self.assertTrue(representative == -1 or representative in reported)
+            self.assertEqual(sorted(str(ping) for ping in _tracks(reference)),
+                             sorted(str(ping) for ping in _tracks(columnar)))
+
+    def test_tracker_update_batch(self):
+        tracker = TrackerBase(5.0, PingList(5.0))
+        pings = generate_random_pings(3, 50, 0.0, 0.0, 1.0)
+        fusion = tracker.update_batch(PingBatch.from_pings(pings))
+        self.assertEqual(50, len(fusion.unmatched_rows))
+        self.assertIsNotNone(tracker.get("3-10"))
+
+
+def _tracks(collection) -> list[Ping]:
+    return list(collection.geo_hash.values()) if isinstance(collection, PingGeoHash) else list(collection._tracks)
@@ -0,0 +1,155 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from fusible_geo_hash import PingGeoHash, PingNeighborGeoHash
+from fusible_grid import PingGrid
+from fusible_nearest_neighbor import PingList
+from ids import IdTable
+from ping import Ping, MovingPing
+from ping_batch import PingBatch
+from snapshot import write_snapshot, read_snapshot, read_external_ids, SNAPSHOT_ALIGNMENT
+from test_fusible_grid import generate_random_pings, summarize
+from tracker_base import TrackerBase
+
+
+class Test(TestCase):
+    """
+    Unit tests for tracker snapshots.
+
+    A restored tracker must hold the same tracks as the tracker that was saved and must keep fusing exactly like it.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "tracks.snap")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        pings = [Ping("a", "ÅLAND1", 1, 5, 10.5, -20.25), Ping("longer-track-id", "", 2, 3, -89.0, 179.5)]
+        write_snapshot(self.path, PingBatch.from_pings(pings), clock=42)
+        batch, clock = read_snapshot(self.path)
+        self.assertEqual(42, clock)
+        self.assertEqual([str(ping) for ping in pings], [str(ping) for ping in batch.to_pings()])
+        self.assertEqual(str(pings[1]), str(batch.ping(1)))
+        self.assertEqual(["a", "longer-track-id"], batch.get_track_ids())
+
+    def test_velocities(self):
+        pings = [MovingPing("a", "A", 1, 5, 10.5, -20.25, 1e-6, -2e-6), Ping("b", "B", 2, 3, -89.0, 179.5)]
+        write_snapshot(self.path, PingBatch.from_pings(pings))
+        batch, _ = read_snapshot(self.path)
+        restored = batch.to_pings()
+        self.assertIsInstance(restored[0], MovingPing)
+        self.assertEqual((1e-6, -2e-6), (restored[0].latitude_rate, restored[0].longitude_rate))
+        self.assertNotIsInstance(restored[1], MovingPing)
+        self.assertEqual(restored[0].predict(1005), batch.ping(0).predict(1005))
+        # batches without velocities do not store rate columns
+        write_snapshot(self.path, PingBatch.from_pings(pings[1:]))
+        self.assertIsNone(read_snapshot(self.path)[0].latitude_rates)
+
+    def test_columns_are_memory_mapped(self):
+        pings = generate_random_pings(1, 100, 45.0, 10.0, 1.0)
+        write_snapshot(self.path, PingBatch.from_pings(pings))
+        batch, clock = read_snapshot(self.path)
+        self.assertIsNone(clock)
+        for column in (batch.start_times, batch.observation_times, batch.latitudes, batch.longitudes,
+                       batch.track_ids, batch.callsigns):
+            self.assertFalse(column.flags.writeable)
+            self.assertFalse(column.flags.owndata)
+            self.assertEqual(0, column.__array_interface__["data"][0] % SNAPSHOT_ALIGNMENT)
+        np.testing.assert_array_equal([ping.latitude for ping in pings], batch.latitudes)
+
+    def test_integer_track_ids(self):
+        narrow = [Ping(7, "A", 1, 5, 10.5, -20.25), Ping((1 << 63) - 1, "B", 2, 3, -89.0, 179.5)]
+        write_snapshot(self.path, PingBatch.from_pings(narrow))
+        batch, _ = read_snapshot(self.path)
+        # 64 bit ids are a mapped int64 column, 128 bit ids are read back into Python ints
+        self.assertEqual(np.int64, batch.track_ids.dtype)
+        self.assertFalse(batch.track_ids.flags.owndata)
+        self.assertEqual([str(ping) for ping in narrow], [str(ping) for ping in batch.to_pings()])
+        wide = narrow + [Ping(1 << 127, "C", 3, 4, 0.0, 0.0)]
+        write_snapshot(self.path, PingBatch.from_pings(wide))
+        self.assertEqual([7, (1 << 63) - 1, 1 << 127], read_snapshot(self.path)[0].get_track_ids())
+        with self.assertRaises(ValueError):
+            write_snapshot(self.path, PingBatch.from_pings(narrow + [Ping(-1, "A", 0, 0, 0.0, 0.0)]))
+
+    def test_mixed_track_ids(self):
+        pings = [Ping(7, "A", 1, 5, 10.5, -20.25), Ping("7", "B", 2, 3, -89.0, 179.5),
+                 MovingPing(1 << 127, "C", 3, 4, 0.0, 0.0, 1e-6, 0.0)]
+        write_snapshot(self.path, PingBatch.from_pings(pings), clock=9)
+        batch, clock = read_snapshot(self.path)
+        self.assertEqual(9, clock)
+        self.assertEqual([7, "7", 1 << 127], batch.get_track_ids())
+        self.assertEqual([str(ping) for ping in pings], [str(ping) for ping in batch.to_pings()])
+        self.assertEqual(1e-6, batch.to_pings()[2].latitude_rate)
+        # a tracker fed both Ping.Builder pings and pings of a feed snapshots and restores them
+        saved = TrackerBase(5.0, PingGrid(5.0))
+        saved.update([Ping.Builder().build("BUILT", 10.0, 20.0), Ping("feed", "FEED", 0, 0, 11.0, 20.0)])
+        saved.snapshot(self.path)
+        restored = TrackerBase(5.0, PingGrid(5.0))
+        self.assertEqual(2, restored.restore(self.path))
+        self.assertEqual(sorted(str(track) for track in saved._fusible_collection),
+                         sorted(str(track) for track in restored._fusible_collection))
+        self.assertIsNotNone(restored.get("feed"))
+
+    def test_restore_continues_fusing(self):
+        pings = generate_random_pings(2, 500, 45.0, 10.0, 0.01)
+        later = generate_random_pings(3, 500, 45.0, 10.0, 0.01)
+        for factory in (PingList, PingGrid, PingGeoHash, PingNeighborGeoHash):
+            saved = TrackerBase(50.0, factory(50.0))
+            saved.update(list(pings))
+            saved.snapshot(self.path)
+
+            restored = TrackerBase(50.0, factory(50.0))
+            self.assertEqual(len(saved._fusible_collection), restored.restore(self.path))
+            self.assertEqual(sorted(str(track) for track in saved._fusible_collection),
+                             sorted(str(track) for track in restored._fusible_collection))
+            self.assertEqual(summarize(*saved.update(list(later))), summarize(*restored.update(list(later))))
+
+    def test_restore_schedules_expiry(self):
+        saved = TrackerBase(5.0, PingGrid(5.0))
+        saved.update([Ping("old", "OLD", 0, 0, 10.0, 20.0), Ping("new", "NEW", 0, 100, 11.0, 20.0)])
+        saved.snapshot(self.path)
+        restored = TrackerBase(5.0, PingGrid(5.0), ttl=50)
+        restored.restore(self.path)
+        self.assertEqual(["old"], [track.track_id for track in restored.pop_evicted()])
+        self.assertIsNotNone(restored.get("new"))
+
+    def test_external_ids(self):
+        pings = [Ping(7, "A", 1, 5, 10.5, -20.25), Ping(1 << 100, "B", 2, 3, -89.0, 179.5)]
+        write_snapshot(self.path, PingBatch.from_pings(pings), clock=3, external_ids=["ÅLAND-7", "b"])
+        batch, clock = read_snapshot(self.path)
+        self.assertEqual(3, clock)
+        self.assertEqual([str(ping) for ping in pings], [str(ping) for ping in batch.to_pings()])
+        self.assertEqual(["ÅLAND-7", "b"], read_external_ids(self.path))
+        write_snapshot(self.path, PingBatch.from_pings(pings))
+        self.assertIsNone(read_external_ids(self.path))
+        with self.assertRaises(ValueError):
+            write_snapshot(self.path, PingBatch.from_pings(pings), external_ids=["a"])
+        # a tracker with an id table restores the external ids of its tracks
+        saved = TrackerBase(5.0, PingGrid(5.0), id_table=IdTable())
+        saved.update([Ping("feed", "FEED", 0, 0, 11.0, 20.0), Ping.Builder().build("BUILT", 10.0, 20.0)])
+        saved.snapshot(self.path)
+        restored = TrackerBase(5.0, PingGrid(5.0), id_table=IdTable())
+        self.assertEqual(2, restored.restore(self.path))
+        self.assertEqual(saved.get("feed").track_id, restored.get("feed").track_id)
+        self.assertEqual(sorted(saved.external_id(track.track_id) for track in saved._fusible_collection),
+                         sorted(restored.external_id(track.track_id) for track in restored._fusible_collection))
+
+    def test_empty_snapshot(self):
+        TrackerBase(5.0, PingList(5.0)).snapshot(self.path)
+        self.assertEqual(0, TrackerBase(5.0, PingList(5.0)).restore(self.path))
+
+    def test_invalid_files(self):
+        with open(self.path, "wb") as snapshot_file:
+            snapshot_file.write(b"not a snapshot, just some bytes long enough for a header")
+        with self.assertRaises(ValueError):
+            read_snapshot(self.path)
+        write_snapshot(self.path, PingBatch.from_pings(generate_random_pings(1, 10, 45.0, 10.0, 1.0)))
+        with open(self.path, "r+b") as snapshot_file:
+            snapshot_file.truncate(os.path.getsize(self.path) - 1)
+        with self.assertRaises(ValueError):
+            read_snapshot(self.path)
@@ -0,0 +1,126 @@
+import random
+from unittest import TestCase
+
+import pygeohash as pgh
+
+import constants
+
+from geo_calc import geodesic_distance
+from spatial_index import GridIndex, GeoHashIndex, QuadTreeIndex, latitude_margin, longitude_margin
+
+
+class Test(TestCase):
+    """
+    Unit tests for the spatial index helpers and the GridIndex and GeoHashIndex classes.
+
+    The key property of a spatial index is that a query never misses a key within the threshold,
+    so these tests compare query results against a brute force scan.
+    """
+    def test_longitude_margin_widens_with_latitude(self):
+        margin = latitude_margin(100.0)
+        self.assertAlmostEqual(margin, longitude_margin(margin, 0.0))
+        self.assertGreater(longitude_margin(margin, 60.0), 1.9 * margin)
+        self.assertEqual(180.0, longitude_margin(margin, 90.0))
+
+    def test_insert_remove(self):
+        index = GridIndex(5.0)
+        index.insert(1, (10.0, 20.0))
+        index.insert(2, (10.0, 20.0))
+        self.assertEqual([1, 2], index.query((10.0, 20.0)))
+        index.move(1, (10.0, 20.0), (11.0, 20.0))
+        self.assertEqual([2], index.query((10.0, 20.0)))
+        index.remove(2, (10.0, 20.0))
+        self.assertEqual([], index.query((10.0, 20.0)))
+        self.assertEqual([1], index.query((11.0, 20.0)))
+
+    def test_geo_hash_keys(self):
+        rng = random.Random(11)
+        for threshold in [5.0, 100.0, 5000.0, 2_000_000.0]:
+            index = GeoHashIndex(threshold)
+            for _ in range(100):
+                point = (rng.uniform(-90.0, 90.0), rng.uniform(-180.0, 180.0))
+                key = index.key(point)
+                self.assertEqual(index.precision, len(key))
+                self.assertEqual(pgh.encode(*point, precision=index.precision), key)
+
+    def test_query_never_misses(self):
+        rng = random.Random(7)
+        for index_type, threshold, latitude, longitude, spread in [
+                (GridIndex, 50.0, 45.0, 10.0, 0.002),
+                (GridIndex, 50.0, 89.9995, 0.0, 0.001),
+                (GridIndex, 50.0, -10.0, -179.9998, 0.001),
+                (GeoHashIndex, 50.0, 45.0, 10.0, 0.002),
+                (GeoHashIndex, 50.0, 89.9995, 0.0, 0.001),
+                (GeoHashIndex, 50.0, 88.0, 0.0, 0.002),
+                (GeoHashIndex, 50.0, -10.0, -179.9998, 0.001)]:
+            index = index_type(threshold)
+            points = [(max(-90.0, min(90.0, latitude + rng.uniform(-spread, spread))),
+                       (longitude + rng.uniform(-spread, spread) + 180.0) % 360.0 - 180.0) for _ in range(200)]
+            for key, point in enumerate(points):
+                index.insert(key, point)
+            for query_point in points[:50]:
+                candidates = set(index.query(query_point))
+                for key, point in enumerate(points):
+                    if geodesic_distance(query_point, point) < threshold:
+                        self.assertIn(key, candidates, f"Query at {query_point} missed {point}.")
+
+    def test_quad_tree_never_misses(self):
+        rng = random.Random(8)
+        for threshold, latitude, longitude, spread in [(50.0, 45.0, 10.0, 0.002), (50.0, 89.9995, 0.0, 0.001),
+                                                       (50.0, -10.0, -179.9998, 0.001), (5.0, 0.0, 0.0, 0.0001)]:
+            index = QuadTreeIndex(threshold, capacity=4)
+            points = [(max(-90.0, min(90.0, latitude + rng.uniform(-spread, spread))),
+                       (longitude + rng.uniform(-spread, spread) + 180.0) % 360.0 - 180.0) for _ in range(200)]
+            for key, point in enumerate(points):
+                index.insert(key, point)
+            for key in range(0, 200, 3):
+                moved = (max(-90.0, min(90.0, points[key][0] + rng.uniform(-spread, spread) / 10)), points[key][1])
+                index.move(key, points[key], moved)
+                points[key] = moved
+            for query_point in points[:50]:
+                candidates = index.query(query_point)
+                self.assertEqual(len(candidates), len(set(candidates)))
+                for key, point in enumerate(points):
+                    if geodesic_distance(query_point, point) < threshold:
+                        self.assertIn(key, candidates, f"Query at {query_point} missed {point}.")
+
+    def test_widened_query_never_misses(self):
+        rng = random.Random(9)
+        threshold, margin = 50.0, 0.003
+        reach = threshold + margin * constants.MIN_METERS_PER_DEGREE
+        for latitude, longitude in [(45.0, 10.0), (89.99, 0.0), (87.0, 0.0), (-10.0, -179.999)]:
+            for index in (GridIndex(threshold), GeoHashIndex(threshold), QuadTreeIndex(threshold, capacity=4)):
+                points = [(max(-90.0, min(90.0, latitude + rng.uniform(-0.01, 0.01))),
+                           (longitude + rng.uniform(-0.05, 0.05) + 180.0) % 360.0 - 180.0) for _ in range(150)]
+                for key, point in enumerate(points):
+                    index.insert(key, point)
+                for query_point in points[:20]:
+                    candidates = set(index.query(query_point, margin))
+                    self.assertLessEqual(set(index.query(query_point)), candidates)
+                    for key, point in enumerate(points):
+                        if geodesic_distance(query_point, point) < reach:
+                            self.assertIn(key, candidates, f"Query at {query_point} missed {point}.")
+
+    def test_quad_tree_splits_and_merges(self):
+        index = QuadTreeIndex(50.0, capacity=4)
+        # a line of points across three base cells
+        points = [(1e-5, 10.0 + i * 3 * latitude_margin(50.0) / 40) for i in range(40)]
+        for key, point in enumerate(points):
+            index.insert(key, point)
+        self.assertGreater(index.depth(points[0]), 0)
+        # a dense cell only returns the keys of the leaves around the query, not the whole cell
+        self.assertLess(len(index.query(points[0])), 40)
+        self.assertIn(0, index.query(points[0]))
+        for key in range(38):
+            index.remove(key, points[key])
+        self.assertEqual(0, index.depth(points[39]))
+        self.assertEqual([38, 39], sorted(index.query(points[39])))
+        index.remove(38, points[38])
+        index.remove(39, points[39])
+        self.assertEqual({}, index.rows)
+
+    def test_quad_tree_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            QuadTreeIndex(50.0, capacity=0)
+        with self.assertRaises(ValueError):
+            QuadTreeIndex(50.0, max_depth=-1)
@@ -0,0 +1,42 @@
+import random
+from unittest import TestCase
+
+from time_index import TimeBucketIndex
+
+
+class Test(TestCase):
+    """
+    Unit tests for the TimeBucketIndex class.
+
+    A query must never miss a key observed within the window, so these tests compare query results against a brute
+    force scan.
+    """
+    def test_insert_move_remove(self):
+        index = TimeBucketIndex(100)
+        index.insert(1, 1_000)
+        index.insert(2, 1_050)
+        self.assertEqual([1, 2], sorted(index.query(1_100)))
+        self.assertEqual([], index.query(1_500))
+        index.move(1, 1_000, 1_490)
+        self.assertEqual([1], index.query(1_500))
+        index.remove(1, 1_490)
+        index.remove(2, 1_050)
+        self.assertEqual({}, index.buckets)
+
+    def test_query_covers_window(self):
+        rng = random.Random(3)
+        index = TimeBucketIndex(250)
+        times = {key: rng.randrange(-5_000, 5_000) for key in range(500)}
+        for key, observation_time in times.items():
+            index.insert(key, observation_time)
+        for _ in range(100):
+            now = rng.randrange(-6_000, 6_000)
+            candidates = index.query(now)
+            self.assertEqual(len(candidates), len(set(candidates)))
+            expected = {key for key, observation_time in times.items() if abs(observation_time - now) <= 250}
+            self.assertLessEqual(expected, set(candidates))
+            self.assertTrue(all(abs(times[key] - now) <= 500 for key in candidates))
+
+    def test_invalid_window(self):
+        with self.assertRaises(ValueError):
+            TimeBucketIndex(0)
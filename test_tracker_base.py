@@ -1,17 +1,31 @@
+import random
+import uuid
 from unittest import TestCase
 
+from abstract import TimeGenerator
+from ids import IdTable
 from ping import Ping
-from fusible_geo_hash import PingGeoHash
+from fusible_geo_hash import PingGeoHash, PingNeighborGeoHash
+from fusible_grid import PingGrid
 from fusible_nearest_neighbor import PingList
-from tracker_base import TrackerBase
+from ping_batch import PingBatch
+from tracker_base import TrackerBase, Geo2dDistanceCalculator, EXPIRY_QUEUE_SLACK, EXPIRY_QUEUE_MINIMUM
+
+
+class FixedTime(TimeGenerator):
+    def __init__(self, time: int):
+        self.time = time
+
+    def generate_time(self) -> int:
+        return self.time
 
 
 def generate_close_coordinate(ping: Ping):
-    return Ping.Builder().build(ping.track_id, ping.latitude + 0.00001, ping.longitude + 0.00001)
+    return Ping.Builder().build(str(ping.track_id), ping.latitude + 0.00001, ping.longitude + 0.00001)
 
 
 def generate_far_coordinate(ping: Ping):
-    return Ping.Builder().build(ping.track_id, ping.latitude + 0.1, ping.longitude + 0.1)
+    return Ping.Builder().build(str(ping.track_id), ping.latitude + 0.1, ping.longitude + 0.1)
 
 
 def print_matches(matches: list[tuple[Ping, Ping]]):
@@ -86,3 +100,169 @@ class TestTrackerBase(TestCase):
 
         self.assertIsNotNone(updated_ping, "Expected to retrieve a ping by track_id.")
         self.assertEqual(expected_callsign, updated_ping.callsign, "Expected the callsign to be updated.")
+
+    def test_set_callsigns(self):
+        """
+        Tests assigning callsigns in bulk, including to track_ids that are not tracked.
+        """
+        tracker = TrackerBase(5.0, PingList(5.0))
+        far_pings = [self.base_ping]
+        for _ in range(1, 5):
+            far_pings.append(generate_far_coordinate(far_pings[-1]))
+        tracker.update(far_pings)
+
+        callsigns = {ping.track_id: f"ATC{i}" for i, ping in enumerate(far_pings)}
+        missing = tracker.set_callsigns({**callsigns, "unknown": "ATC9"})
+
+        self.assertEqual(["unknown"], missing, "Expected only the unknown track_id to be reported.")
+        for uid, callsign in callsigns.items():
+            self.assertEqual(callsign, tracker.get(uid).callsign, "Expected every callsign to be updated.")
+
+    def test_get_after_merge_changes_track_id(self):
+        """
+        Tests that a track is found under its new track_id when a merge keeps the incoming ping's identity.
+        """
+        for collection in [PingList(5.0), PingGeoHash(5.0), PingGrid(5.0), PingNeighborGeoHash(5.0)]:
+            tracker = TrackerBase(5.0, collection)
+            tracker.update([Ping("later", "LATER", 20, 20, 37.7749, 122.419451)])
+            tracker.update([Ping("earlier", "EARLIER", 10, 30, 37.7749, 122.419451)])
+            self.assertIsNone(tracker.get("later"), "Expected the replaced track_id to be dropped.")
+            self.assertEqual("EARLIER", tracker.get("earlier").callsign, "Expected the merged track to be indexed.")
+
+    def test_ttl_evicts_stale_tracks(self):
+        """
+        Tests that tracks not observed within the time to live are evicted and reported, on every backend.
+        """
+        for collection in [PingList(5.0), PingGeoHash(5.0), PingGrid(5.0), PingNeighborGeoHash(5.0)]:
+            tracker = TrackerBase(5.0, collection, ttl=100)
+            tracker.update([Ping(f"t{i}", f"T{i}", i, i, 10.0 + i, 20.0) for i in range(5)])
+            # refresh t0 so that only t1 to t4 are stale when time jumps ahead
+            tracker.update([Ping("r0", "R0", 150, 150, 10.0, 20.0)])
+            tracker.update([Ping("new", "NEW", 200, 200, 50.0, 50.0)])
+            self.assertEqual(["t1", "t2", "t3", "t4"], [ping.track_id for ping in tracker.pop_evicted()])
+            self.assertEqual([], tracker.pop_evicted(), "Expected evicted tracks to be handed out once.")
+            self.assertIsNone(tracker.get("t1"))
+            self.assertIsNotNone(tracker.get("t0"), "Expected the refreshed track to survive.")
+            self.assertEqual(2, len(collection))
+            self.assertEqual(["t0"], [ping.track_id for ping in tracker.expire(now=260)])
+            self.assertEqual(["new"], [ping.track_id for ping in tracker.expire(now=301)])
+
+    def test_max_tracks_evicts_oldest(self):
+        """
+        Tests that the least recently observed tracks are evicted beyond the track cap.
+        """
+        for collection in [PingList(5.0), PingGeoHash(5.0), PingGrid(5.0), PingNeighborGeoHash(5.0)]:
+            tracker = TrackerBase(5.0, collection, max_tracks=3)
+            tracker.update([Ping(f"t{i}", f"T{i}", i, i, 10.0 + i, 20.0) for i in range(3)])
+            tracker.update([Ping("r0", "R0", 10, 10, 10.0, 20.0)])
+            tracker.update([Ping("t3", "T3", 11, 11, 40.0, 20.0), Ping("t4", "T4", 12, 12, 41.0, 20.0)])
+            self.assertEqual(["t1", "t2"], [ping.track_id for ping in tracker.pop_evicted()])
+            self.assertEqual(3, len(collection))
+            self.assertEqual(["t0", "t3", "t4"], sorted(uid for uid in ["t0", "t1", "t2", "t3", "t4"]
+                                                          if tracker.get(uid) is not None))
+
+    def test_expiry_queue_stays_bounded(self):
+        """
+        Tests that long-lived tracks fused on every update do not grow the expiry queue without bound.
+        """
+        for settings in ({"max_tracks": 1000}, {"ttl": 1_000_000}):
+            collection = PingGrid(5.0)
+            tracker = TrackerBase(5.0, collection, **settings)
+            for time in range(200):
+                tracker.update([Ping(f"t{i}", f"T{i}", time, time, 10.0 + i * 0.01, 20.0) for i in range(101)])
+                tracker.update_batch(PingBatch.from_pings([Ping(f"b{time}", "B", time, time, 11.5, 20.0)]))
+            self.assertEqual(102, len(collection))
+            self.assertLessEqual(len(tracker._expiry_queue),
+                                 EXPIRY_QUEUE_SLACK * len(collection) + EXPIRY_QUEUE_MINIMUM + 102)
+
+    def test_expiry_queue_orders_ties_by_push(self):
+        """
+        Tests that tracks observed at the same time expire in the order they were pushed, whatever their id types.
+        """
+        builder = Ping.Builder().with_time_generator(FixedTime(5))
+        for collection in [PingList(5.0), PingGrid(5.0)]:
+            tracker = TrackerBase(5.0, collection, ttl=10, max_tracks=3)
+            generated = [builder.build(f"G{i}", 10.0 + i, 20.0) for i in range(2)]
+            tracker.update([generated[0], Ping("s0", "S0", 5, 5, 30.0, 20.0), generated[1]])
+            tracker.update([Ping("s1", "S1", 5, 5, 40.0, 20.0)])
+            self.assertEqual([generated[0].track_id], [ping.track_id for ping in tracker.pop_evicted()])
+            self.assertEqual(["s0", generated[1].track_id, "s1"],
+                             [ping.track_id for ping in tracker.expire(now=20)])
+
+    def test_id_table_interns_external_ids(self):
+        """
+        Tests that external track_ids are interned on ingestion, given back at the edge and dropped once unused.
+        """
+        feed = [str(uuid.UUID(int=random.Random(i).getrandbits(128))) for i in range(6)]
+        for collection in [PingList(5.0), PingGeoHash(5.0), PingGrid(5.0)]:
+            table = IdTable()
+            tracker = TrackerBase(5.0, collection, ttl=100, deltas=True, id_table=table)
+            _, unmatched = tracker.update([Ping(feed[i], f"T{i}", i, i, 10.0 + i, 20.0) for i in range(3)])
+            self.assertTrue(all(isinstance(track.track_id, int) for track in collection))
+            self.assertEqual(feed[:3], [tracker.external_id(ping.track_id) for ping in unmatched])
+            # a later ping fuses into the first track, whose id survives, so the ping's id is dropped
+            tracker.update([Ping(feed[3], "LATE", 50, 50, 10.0, 20.0)])
+            tracker.update_batch(PingBatch.from_pings([Ping(feed[4], "LATE", 60, 60, 11.0, 20.0)]))
+            self.assertEqual(3, len(table))
+            tracker.set_callsign(feed[0], "RENAMED")
+            self.assertEqual("RENAMED", tracker.get(feed[0]).callsign)
+            self.assertEqual([feed[5]], tracker.set_callsigns({feed[5]: "NONE"}))
+            tracker.update([Ping(feed[5], "NEW", 140, 140, 50.0, 50.0)])
+            self.assertEqual([feed[2]], [ping.track_id for ping in tracker.pop_evicted()])
+            self.assertEqual(set(feed) - {feed[3], feed[4]}, {record[1] for record in tracker.pop_deltas()})
+            self.assertEqual(3, len(table))
+            self.assertIsNone(tracker.get(feed[2]))
+
+    def test_invalid_expiry_settings(self):
+        with self.assertRaises(ValueError):
+            TrackerBase(5.0, PingList(5.0), ttl=-1)
+        with self.assertRaises(ValueError):
+            TrackerBase(5.0, PingList(5.0), max_tracks=-1)
+
+
+class TestGeo2dDistanceCalculator(TestCase):
+    """
+    Tests for the Geo2dDistanceCalculator bounding-box prefilter.
+    """
+    def test_prefilter_preserves_threshold_comparisons(self):
+        rng = random.Random(3)
+        for threshold in [5.0, 100.0, 10_000.0]:
+            exact = Geo2dDistanceCalculator(threshold)
+            prefiltered = Geo2dDistanceCalculator(threshold, prefilter=True)
+            spread = 3 * threshold / 100_000
+            for latitude in [0.0, 60.0, 89.9, -45.0]:
+                for _ in range(300):
+                    p1 = (latitude, rng.uniform(-180.0, 180.0))
+                    p2 = (max(-90.0, min(90.0, latitude + rng.uniform(-spread, spread))),
+                          (p1[1] + rng.uniform(-8 * spread, 8 * spread) + 180.0) % 360.0 - 180.0)
+                    dist = exact.calculate(p1, p2)
+                    if dist < threshold:
+                        self.assertEqual(dist, prefiltered.calculate(p1, p2), "Expected close pairs to be exact.")
+                    else:
+                        self.assertGreaterEqual(prefiltered.calculate(p1, p2), threshold)
+
+    def test_prefilter_rejects_far_pairs(self):
+        calculator = Geo2dDistanceCalculator(5.0, prefilter=True)
+        self.assertEqual(float("inf"), calculator.calculate((10.0, 10.0), (10.1, 10.0)))
+        self.assertEqual(float("inf"), calculator.calculate((10.0, 10.0), (10.0, 10.1)))
+        self.assertLess(calculator.calculate((10.0, 10.0), (10.00001, 10.0)), 5.0)
+
+    def test_compare_orders_like_calculate(self):
+        rng = random.Random(5)
+        for threshold in [5.0, 100.0]:
+            for local_tangent_plane in [False, True]:
+                calculator = Geo2dDistanceCalculator(threshold, local_tangent_plane=local_tangent_plane)
+                origin = (70.0, 20.0)
+                points = [(70.0 + rng.uniform(-1e-4, 1e-4), 20.0 + rng.uniform(-3e-4, 3e-4)) for _ in range(200)]
+                by_distance = sorted(points, key=lambda point: calculator.calculate(origin, point))
+                self.assertEqual(by_distance, sorted(points, key=lambda point: calculator.compare(origin, point)))
+                for point in points:
+                    self.assertEqual(calculator.calculate(origin, point) < threshold,
+                                     calculator.within_threshold(origin, point, threshold))
+
+    def test_local_tangent_plane_shortens_east_west_distances(self):
+        flat = Geo2dDistanceCalculator(5.0)
+        tangent = Geo2dDistanceCalculator(5.0, local_tangent_plane=True)
+        p1, p2 = (60.0, 10.0), (60.0, 10.00006)
+        self.assertFalse(flat.within_threshold(p1, p2, 5.0))
+        self.assertTrue(tangent.within_threshold(p1, p2, 5.0))
@@ -0,0 +1,100 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from fusible_grid import PingGrid
+from ping import Ping
+from test_fusible_grid import generate_random_pings, summarize
+from tracker_base import TrackerBase
+from tracker_stream import TrackerStream
+
+
+async def from_frames(frames: list, delay: float = 0.0, produced: list | None = None):
+    for frame in frames:
+        if produced is not None:
+            produced.append(frame)
+        yield frame
+        await asyncio.sleep(delay)
+
+
+async def collect(stream: TrackerStream, source) -> list:
+    return [result async for result in stream.stream(source)]
+
+
+class Test(TestCase):
+    """
+    Unit tests for the TrackerStream class.
+
+    A stream must fuse exactly the pings it reads, batch them by size and by delay, and hold back or thin
+    out its source according to the backpressure policy.
+    """
+    def test_batches_by_size(self):
+        pings = generate_random_pings(1, 30, 45.0, 10.0, 0.01)
+        frames = [pings[i:i + 3] for i in range(0, 30, 3)]
+        stream = TrackerStream(TrackerBase(50.0, PingGrid(50.0)), max_batch_size=6, max_delay=10.0)
+        results = asyncio.run(collect(stream, from_frames(frames)))
+
+        reference = TrackerBase(50.0, PingGrid(50.0))
+        expected = [summarize(*reference.update(pings[i:i + 6])) for i in range(0, 30, 6)]
+        self.assertEqual(expected, [summarize(*result) for result in results])
+
+    def test_batches_by_delay(self):
+        pings = [Ping(f"p{i}", f"P{i}", i, i, 10.0 + i, 20.0) for i in range(4)]
+        stream = TrackerStream(TrackerBase(5.0, PingGrid(5.0)), max_batch_size=100, max_delay=0.01)
+        results = asyncio.run(collect(stream, from_frames(pings, delay=0.05)))
+        self.assertEqual([[ping.track_id] for ping in pings],
+                         [[ping.track_id for ping in unmatched] for _, unmatched in results])
+
+    def test_backpressure_holds_source_back(self):
+        produced: list = []
+        frames = [[Ping(f"p{i}", f"P{i}", i, i, 10.0 + i, 20.0)] for i in range(50)]
+        stream = TrackerStream(TrackerBase(5.0, PingGrid(5.0)), max_batch_size=1, max_pending=2)
+
+        async def consume_slowly():
+            seen = []
+            async for _ in stream.stream(from_frames(frames, produced=produced)):
+                seen.append(len(produced))
+                await asyncio.sleep(0.001)
+            return seen
+
+        seen = asyncio.run(consume_slowly())
+        self.assertEqual(50, len(seen))
+        self.assertLessEqual(max(produced_count - consumed for consumed, produced_count in enumerate(seen, 1)), 4)
+
+    def test_drop_oldest(self):
+        frames = [[Ping(f"p{i}", f"P{i}", i, i, 10.0 + i, 20.0)] for i in range(50)]
+        stream = TrackerStream(TrackerBase(5.0, PingGrid(5.0)), max_batch_size=1, max_pending=2, drop_oldest=True)
+
+        async def consume_slowly():
+            count = 0
+            async for _ in stream.stream(from_frames(frames)):
+                count += 1
+                await asyncio.sleep(0.001)
+            return count
+
+        fused = asyncio.run(consume_slowly())
+        self.assertGreater(stream.dropped, 0)
+        self.assertEqual(50, fused + stream.dropped)
+
+    def test_source_error_after_fusing_earlier_pings(self):
+        async def failing_source():
+            yield Ping("a", "A", 1, 1, 10.0, 20.0)
+            raise RuntimeError("radar feed lost")
+
+        tracker = TrackerBase(5.0, PingGrid(5.0))
+        with self.assertRaises(RuntimeError):
+            asyncio.run(collect(TrackerStream(tracker, max_delay=10.0), failing_source()))
+        self.assertIsNotNone(tracker.get("a"))
+
+    def test_executor(self):
+        pings = generate_random_pings(2, 20, 45.0, 10.0, 0.01)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            stream = TrackerStream(TrackerBase(50.0, PingGrid(50.0)), max_batch_size=20, executor=executor)
+            results = asyncio.run(collect(stream, from_frames([pings])))
+        self.assertEqual(summarize(*TrackerBase(50.0, PingGrid(50.0)).update(pings)), summarize(*results[0]))
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            TrackerStream(TrackerBase(5.0, PingGrid(5.0)), max_batch_size=0)
+        with self.assertRaises(ValueError):
+            TrackerStream(TrackerBase(5.0, PingGrid(5.0)), max_pending=0)
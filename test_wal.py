@@ -0,0 +1,192 @@
+import math
+import os
+import tempfile
+from unittest import TestCase
+
+from fusible_grid import PingGrid
+from ids import IdTable
+from ping import Ping
+from ping_batch import PingBatch
+from test_fusible_grid import generate_random_pings
+from tracker_base import TrackerBase
+from wal import WriteAheadLog, SEGMENT_PREFIX, CHECKPOINT_PREFIX
+
+
+def tracks(tracker: TrackerBase) -> list[str]:
+    return sorted(str(track) for track in tracker._fusible_collection)
+
+
+class Test(TestCase):
+    """
+    Unit tests for the WriteAheadLog class.
+
+    A tracker recovered from a log must hold exactly the tracks of the tracker that wrote it, from any combination
+    of checkpoint and log tail, and a torn record must end recovery without losing the records before it.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+        self.frames = [generate_random_pings(seed, 200, 45.0, 10.0, 0.01) for seed in range(6)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def new_tracker(self, log: WriteAheadLog, threshold: float = 50.0) -> TrackerBase:
+        return TrackerBase(threshold, PingGrid(threshold), ttl=10_000, log=log)
+
+    def test_recover_from_log(self):
+        with WriteAheadLog(self.path) as log:
+            tracker = self.new_tracker(log)
+            for frame in self.frames[:3]:
+                tracker.update(list(frame))
+            tracker.update_batch(PingBatch.from_pings(self.frames[3]))
+            tracker.set_callsign(self.frames[0][0].track_id, "RENAMED")
+            tracker.set_callsigns({self.frames[0][1].track_id: "ALSO", "unknown": "NONE"})
+            before = len(tracks(tracker))
+            tracker.expire(10_150)
+            expected = tracks(tracker)
+            self.assertTrue(0 < len(expected) < before)
+            self.assertEqual(7, log.sequence)
+
+        with WriteAheadLog(self.path) as log:
+            recovered = self.new_tracker(log)
+            self.assertEqual(7, recovered.recover())
+            self.assertEqual(expected, tracks(recovered))
+            # the recovered tracker keeps logging after the recovered records
+            recovered.update([Ping("late", "LATE", 1, 1, 10.0, 20.0)])
+            self.assertEqual(8, log.sequence)
+
+    def test_integer_track_ids(self):
+        frames = [[Ping(i + 1_000 * seed + (1 << 100) * (seed % 2), ping.callsign, ping.start_time,
+                        ping.observation_time, ping.latitude, ping.longitude) for i, ping in enumerate(frame)]
+                  for seed, frame in enumerate(self.frames)]
+        with WriteAheadLog(self.path) as log:
+            tracker = self.new_tracker(log)
+            tracker.update(list(frames[0]))
+            tracker.update_batch(PingBatch.from_pings(frames[1]))
+            tracker.set_callsign(frames[0][0].track_id, "RENAMED")
+            expected = tracks(tracker)
+
+        with WriteAheadLog(self.path) as log:
+            recovered = self.new_tracker(log)
+            self.assertEqual(3, recovered.recover())
+            self.assertEqual(expected, tracks(recovered))
+            self.assertEqual("RENAMED", recovered.get(frames[0][0].track_id).callsign)
+
+    def test_mixed_track_ids(self):
+        # integer ids as issued by Ping.Builder next to the string ids of a feed, in the same update
+        frames = [[Ping(i + 1_000 * seed if i % 2 else ping.track_id, ping.callsign, ping.start_time,
+                        ping.observation_time, ping.latitude, ping.longitude) for i, ping in enumerate(frame)]
+                  for seed, frame in enumerate(self.frames)]
+        with WriteAheadLog(self.path) as log:
+            tracker = self.new_tracker(log)
+            tracker.update(list(frames[0]))
+            tracker.update_batch(PingBatch.from_pings(frames[1]))
+            tracker.set_callsign(frames[0][1].track_id, "RENAMED")
+            expected = tracks(tracker)
+
+        with WriteAheadLog(self.path) as log:
+            recovered = self.new_tracker(log)
+            self.assertEqual(3, recovered.recover())
+            self.assertEqual(expected, tracks(recovered))
+            self.assertEqual("RENAMED", recovered.get(frames[0][1].track_id).callsign)
+            self.assertIsNone(recovered.get(str(frames[0][1].track_id)))
+
+    def test_checkpoints_shorten_recovery(self):
+        with WriteAheadLog(self.path, checkpoint_interval=2) as log:
+            tracker = self.new_tracker(log)
+            for frame in self.frames[:5]:
+                tracker.update(list(frame))
+            tracker.set_callsign(self.frames[4][0].track_id, "TAIL")
+            expected = tracks(tracker)
+            self.assertEqual(4, log.checkpoint_sequence)
+
+        names = os.listdir(self.path)
+        self.assertEqual(1, len([name for name in names if name.startswith(CHECKPOINT_PREFIX)]))
+        self.assertEqual(1, len([name for name in names if name.startswith(SEGMENT_PREFIX)]))
+        with WriteAheadLog(self.path) as log:
+            recovered = self.new_tracker(log)
+            self.assertEqual(2, recovered.recover())
+            self.assertEqual(expected, tracks(recovered))
+
+    def test_id_table(self):
+        def new_tracker(log: WriteAheadLog) -> TrackerBase:
+            return TrackerBase(50.0, PingGrid(50.0), ttl=10_000, log=log, id_table=IdTable())
+
+        with WriteAheadLog(self.path, checkpoint_interval=3) as log:
+            tracker = new_tracker(log)
+            tracker.update(list(self.frames[0]))
+            tracker.update(list(self.frames[1]))
+            tracker.update_batch(PingBatch.from_pings(self.frames[2]))
+            tracker.set_callsign(self.frames[2][0].track_id, "RENAMED")
+            self.assertTrue(0 < log.checkpoint_sequence < log.sequence)
+            expected = tracks(tracker)
+            external_ids = sorted(tracker.external_id(track.track_id) for track in tracker._fusible_collection)
+
+        with WriteAheadLog(self.path) as log:
+            recovered = new_tracker(log)
+            recovered.recover()
+            # the interned ids are restored from the checkpoint and the log, so the external ids still name the tracks
+            self.assertEqual(expected, tracks(recovered))
+            self.assertEqual(external_ids,
+                             sorted(recovered.external_id(track.track_id) for track in recovered._fusible_collection))
+            self.assertEqual("RENAMED", recovered.get(self.frames[2][0].track_id).callsign)
+            recovered.set_callsign(self.frames[0][0].track_id, "AGAIN")
+            self.assertEqual("AGAIN", recovered.get(self.frames[0][0].track_id).callsign)
+
+    def test_checkpoints_keep_velocities(self):
+        # targets a kilometer apart fly east at 35 m per frame and all miss the frames checkpointed before
+        step = 35.0 / (111_319.49 * math.cos(math.radians(45.0)))
+        frames = [[Ping(f"{frame}-{target}", f"T{target}", 1000 * frame, 1000 * frame, 45.0 + 0.01 * target,
+                        10.0 + step * frame) for target in range(30)] for frame in (0, 1, 2, 4, 5)]
+
+        def new_tracker(log: WriteAheadLog) -> TrackerBase:
+            return TrackerBase(50.0, PingGrid(50.0, motion_prediction=True, time_window=2000), log=log)
+
+        with WriteAheadLog(self.path, checkpoint_interval=3) as log:
+            tracker = new_tracker(log)
+            for frame in frames:
+                tracker.update(list(frame))
+            expected = tracks(tracker)
+            self.assertEqual(30, len(expected))
+            self.assertEqual(3, log.checkpoint_sequence)
+
+        with WriteAheadLog(self.path) as log:
+            recovered = new_tracker(log)
+            self.assertEqual(2, recovered.recover())
+            self.assertEqual(expected, tracks(recovered))
+            self.assertEqual([(track.latitude_rate, track.longitude_rate) for track in tracker._fusible_collection],
+                             [(track.latitude_rate, track.longitude_rate) for track in recovered._fusible_collection])
+
+    def test_torn_record(self):
+        with WriteAheadLog(self.path) as log:
+            tracker = self.new_tracker(log)
+            tracker.update(list(self.frames[0]))
+            expected = tracks(tracker)
+            tracker.update(list(self.frames[1]))
+        segment = os.path.join(self.path, sorted(os.listdir(self.path))[0])
+        with open(segment, "r+b") as segment_file:
+            segment_file.truncate(os.path.getsize(segment) - 3)
+
+        with WriteAheadLog(self.path) as log:
+            self.assertEqual(1, log.sequence)
+            recovered = self.new_tracker(log)
+            self.assertEqual(1, recovered.recover())
+            self.assertEqual(expected, tracks(recovered))
+
+    def test_divergence(self):
+        with WriteAheadLog(self.path) as log:
+            tracker = self.new_tracker(log)
+            for frame in self.frames[:2]:
+                tracker.update(list(frame))
+        with WriteAheadLog(self.path) as log:
+            with self.assertRaises(ValueError):
+                self.new_tracker(log, threshold=5.0).recover()
+        with self.assertRaises(ValueError):
+            TrackerBase(5.0, PingGrid(5.0)).recover()
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            WriteAheadLog(self.path, sync_interval=-1.0)
+        with self.assertRaises(ValueError):
+            WriteAheadLog(self.path, checkpoint_interval=0)
@@ -0,0 +1,70 @@
+# time_index: Index of keys by observation time, used to skip tracks observed outside a time window
+
+
+class TimeBucketIndex:
+    """
+    Buckets keys by observation time, each bucket spanning one time window.
+
+    A query only visits the buckets that overlap the window around the queried time, which is at most three, so
+    the tracks a query returns are those observed recently enough to matter rather than every track ever stored.
+    Like a SpatialIndex, a query may return false positives from the edges of the outer buckets, which callers
+    drop by comparing the observation times themselves.
+
+    Attributes:
+        buckets (dict[int, set[int]]): Keys by bucket, the bucket of a time being `time // window`.
+        window (int): The largest time difference a query has to return keys for.
+
+    Methods:
+        __init__: Initializes an empty index for the given window.
+        bucket: Returns the bucket of a time.
+        insert: Adds a key observed at a time.
+        remove: Removes a key observed at a time.
+        move: Moves a key to a new observation time.
+        query: Returns the keys that may have been observed within the window of a time.
+    """
+    buckets: dict[int, set[int]]
+    window: int
+
+    def __init__(self, window: int):
+        """
+        Initializes a new TimeBucketIndex.
+
+        Parameters:
+            window (int): The largest time difference a query has to return keys for, in observation time units.
+
+        Raises:
+            ValueError: If the window is not positive.
+        """
+        if window <= 0:
+            raise ValueError(f"Expected a positive time window, got {window}")
+        self.buckets = {}
+        self.window = window
+
+    # bucket: Return the bucket of a time
+    def bucket(self, observation_time: int) -> int:
+        return observation_time // self.window
+
+    def insert(self, key: int, observation_time: int):
+        self.buckets.setdefault(self.bucket(observation_time), set()).add(key)
+
+    def remove(self, key: int, observation_time: int):
+        bucket = self.bucket(observation_time)
+        keys = self.buckets[bucket]
+        keys.remove(key)
+        if not keys:
+            del self.buckets[bucket]
+
+    def move(self, key: int, old_time: int, new_time: int):
+        if self.bucket(old_time) != self.bucket(new_time):
+            self.remove(key, old_time)
+            self.insert(key, new_time)
+
+    # query: Return every key whose bucket overlaps the window around a time
+    def query(self, observation_time: int) -> list[int]:
+        candidates: list[int] = []
+        first, last = self.bucket(observation_time - self.window), self.bucket(observation_time + self.window)
+        for bucket in range(first, last + 1):
+            keys = self.buckets.get(bucket)
+            if keys:
+                candidates.extend(keys)
+        return candidates
@@ -1,8 +1,29 @@
+import heapq
+import math
+from collections.abc import Callable, Iterable
+from copy import copy
+
 import constants
+import numpy as np
 
-from abstract import Tracker, Point2d, DistanceCalculator2d, FusibleCollection
-from geo_calc import euclidean_distance, great_circle_distance, geodesic_distance
+from abstract import Tracker, Point2d, DistanceCalculator2d, FusibleCollection, TrackId
+from delta import TRACK_NEW, TRACK_MOVED, TRACK_MERGED, TRACK_CALLSIGN, TRACK_EVICTED
+from ids import IdTable
+from geo_calc import euclidean_distance, great_circle_distance, geodesic_distance, euclidean_distances, \
+    great_circle_distances, geodesic_distances, local_tangent_plane_distance, local_tangent_plane_squared_degrees, \
+    local_tangent_plane_distances
+from metrics import TrackerMetrics
 from ping import Ping
+from ping_batch import PingBatch, BatchFusion
+from snapshot import write_snapshot, read_snapshot, read_external_ids
+from wal import WriteAheadLog
+from spatial_index import latitude_margin, longitude_margin
+
+
+# Stale expiry queue entries are dropped once the queue holds this many entries per track, plus the minimum below,
+# which keeps the cost of compaction at O(1) per pushed entry
+EXPIRY_QUEUE_SLACK = 2
+EXPIRY_QUEUE_MINIMUM = 1024
 
 
 class TrackerBase(Tracker[Ping]):
@@ -13,42 +34,490 @@ class TrackerBase(Tracker[Ping]):
     with new data, setting callsigns for identified pings, and retrieving pings by their unique identifiers.
     The actual storage and fusion logic is delegated to the `FusibleCollection` instance provided during initialization.
 
+    Tracks can optionally be aged out. With a time to live, a track that has not been observed for longer than
+    `ttl` (measured against the newest observation_time the tracker has seen) is evicted, and with a track cap the
+    least recently observed tracks are evicted while the collection holds more than `max_tracks`. Tracks are kept in
+    a heap ordered by observation_time, whose entries are invalidated lazily when a track is fused again, so
+    expiry costs O(log n) per track update instead of a sweep of the collection. The invalidated entries are dropped
+    in one pass once they outnumber the tracks, so the heap stays proportional to the collection. A track the
+    collection drops while fusing to make room for another, see `FusibleCollection.pop_displaced`, is evicted as
+    well. Evicted tracks are collected after every update and handed out by `pop_evicted`.
+
+    Metrics are off by default. `enable_metrics` instruments the tracker and its collection with per-stage timings,
+    distance call counts, search candidates, match rate and collection size, see `TrackerMetrics`. Disabled metrics
+    cost nothing, as the instrumentation is removed from the instances rather than switched off by a flag.
+
+    The tracks and clock can be saved with `snapshot` to a memory-mappable columnar file, see `write_snapshot`, and
+    loaded back with `restore`, which stores them in the collection without any fusion or distance calculation.
+    With a WriteAheadLog, every update, callsign assignment and explicit expiry is appended to the log, checkpoints
+    are taken as the log asks for them, and `recover` rebuilds the state from the newest checkpoint and the log tail.
+
+    In delta mode, every change of the tracked state is also recorded as a compact tuple: a new track, a track
+    moved by a fusion, a track_id replaced by a merge, a callsign assignment or an eviction, see `delta` for their
+    layout. A downstream feed collects them with `pop_deltas` and can encode them with a DeltaEncoder instead of
+    diffing the full results of every update, and pairs well with a collection that does not copy its results.
+
+    With an IdTable, string track_ids received from outside, such as the UUIDs of a sensor feed, are interned as
+    integers as pings enter `update` or `update_batch`, so the collection only keys on integers. The external ids are
+    given back at the edge: `get` and the callsign methods accept them, delta records and evicted tracks carry them,
+    and `external_id` maps the track_ids of update results. Ids that stop naming a track, because their ping fused
+    into a track named otherwise or their track was evicted, are dropped from the table. `snapshot` saves the external
+    ids of the tracks along with them, and the log records the ids every update interns, so a tracker restored or
+    recovered with an IdTable accepts and gives back the same external ids.
+
     Attributes:
         _threshold (float): The distance threshold used for determining whether pings can be considered identical
                             and therefore fused together.
         _fusible_collection (FusibleCollection[Ping]): The collection that manages the storage, fusion,
                                                        and retrieval of Ping objects.
+        _ttl (int | None): How long a track survives without being observed, in observation_time units.
+        _max_tracks (int | None): The largest number of tracks to keep.
+        _expiry_queue (list[tuple[int, int, TrackId]]): Heap of (observation_time, sequence, track_id), possibly
+                                                        holding stale entries, compacted once it holds
+                                                        EXPIRY_QUEUE_SLACK entries per track. The sequence breaks
+                                                        ties in push order, so track ids are never compared.
+        _expiry_sequence (int): The sequence number of the next entry pushed onto the expiry queue.
+        _clock (int | None): The newest observation_time seen by the tracker.
+        _evicted (list[Ping]): Tracks evicted by updates since the last call to `pop_evicted`.
+        metrics (TrackerMetrics | None): The metrics being recorded, or None while metrics are disabled.
+        _uninstrument (Callable[[], None] | None): Removes the metrics instrumentation, while metrics are enabled.
+        _log (WriteAheadLog | None): The log the changes of the tracker are appended to, if any.
+        _deltas (list[tuple] | None): Changes recorded since the last call to `pop_deltas`, None unless in delta mode.
+        _id_table (IdTable | None): The interned external track_ids, or None if track_ids are used as they come.
 
     Args:
         threshold (float): The distance threshold for fusing pings.
         fusible_collection (FusibleCollection[Ping]): An instance of a class that implements the
                                                       `FusibleCollection` interface for Ping objects.
+        ttl (int | None): The time to live of a track, or None to keep tracks regardless of age.
+        max_tracks (int | None): The track cap, or None for no cap.
+        log (WriteAheadLog | None): The write-ahead log to append changes to, or None for no log.
+        deltas (bool): Whether to record the changes of the tracked state for `pop_deltas`.
+        id_table (IdTable | None): The table external track_ids are interned in, or None to use them as they come.
     """
     _threshold: float
     _fusible_collection: FusibleCollection[Ping]
+    _ttl: int | None
+    _max_tracks: int | None
+    _expiry_queue: list[tuple[int, int, TrackId]]
+    _expiry_sequence: int
+    _clock: int | None
+    _evicted: list[Ping]
+    metrics: TrackerMetrics | None
+    _uninstrument: Callable[[], None] | None
+    _log: WriteAheadLog | None
+    _deltas: list[tuple] | None
+    _id_table: IdTable | None
 
-    def __init__(self, threshold: float, fusible_collection: FusibleCollection[Ping]):
+    def __init__(self, threshold: float, fusible_collection: FusibleCollection[Ping], ttl: int | None = None,
+                 max_tracks: int | None = None, log: WriteAheadLog | None = None, deltas: bool = False,
+                 id_table: IdTable | None = None):
         """
          Initializes a new instance of TrackerBase with a specified threshold and fusible collection.
 
          Parameters:
              threshold (float): The threshold distance for fusing Ping objects.
              fusible_collection (FusibleCollection[Ping]): The collection that will manage the Pings.
+             ttl (int | None): The time to live of a track in observation_time units. Defaults to None.
+             max_tracks (int | None): The largest number of tracks to keep. Defaults to None.
+             log (WriteAheadLog | None): The write-ahead log to append changes to. Defaults to None.
+             deltas (bool): Whether to record the changes of the tracked state. Defaults to False.
+             id_table (IdTable | None): The table to intern string track_ids in. Defaults to None.
+
+         Raises:
+             ValueError: If ttl or max_tracks is negative.
          """
+        if ttl is not None and ttl < 0:
+            raise ValueError(f"ttl must not be negative, got {ttl}")
+        if max_tracks is not None and max_tracks < 0:
+            raise ValueError(f"max_tracks must not be negative, got {max_tracks}")
         self._threshold = threshold
         self._fusible_collection = fusible_collection
+        self._ttl = ttl
+        self._max_tracks = max_tracks
+        self._expiry_queue = []
+        self._expiry_sequence = 0
+        self._clock = None
+        self._evicted = []
+        self.metrics = None
+        self._uninstrument = None
+        self._log = log
+        self._deltas = [] if deltas else None
+        self._id_table = id_table
 
     def update(self, inputs: list[Ping]) -> tuple[list[tuple[Ping, Ping]], list[Ping]]:
-        return self._fusible_collection.fuse(inputs)
+        external_ids: list[str] = []
+        interned: list[TrackId] = []
+        if self._id_table is not None:
+            external_ids = self._uninterned(self._id_table, [ping.track_id for ping in inputs])
+            inputs = self._intern(self._id_table, inputs)
+            interned = [self._id_table.intern(external_id) for external_id in external_ids]
+        matched, unmatched = self._fusible_collection.fuse(inputs)
+        self._evict_displaced()
+        if self._deltas is not None:
+            self._record_update(self._deltas, matched, unmatched)
+        if self._ttl is not None or self._max_tracks is not None:
+            # a fused track keeps the track_id of the earlier of the two, see Ping.merge
+            self._schedule([track.get_earliest(ping).track_id for track, ping in matched] +
+                           [ping.track_id for ping in unmatched])
+            self._evicted.extend(self.expire())
+        if self._log is not None:
+            if external_ids:
+                self._log.append_external_ids(interned, external_ids)
+            self._log.append_update(inputs, matched, unmatched)
+            self._checkpoint_if_due()
+        if self._id_table is not None:
+            self._forget_untracked(self._id_table, [ping.track_id for ping in inputs] +
+                                   [track.track_id for track, _ in matched])
+        return matched, unmatched
+
+    def update_batch(self, batch: PingBatch) -> BatchFusion:
+        """
+        Update the tracker with a columnar batch of pings.
+
+        Parameters:
+            batch (PingBatch): The pings to fuse, as contiguous columns.
+
+        Returns:
+            BatchFusion: The matched and unmatched rows of the batch, see `FusibleCollection.fuse_batch`.
+        """
+        external_ids: list[str] = []
+        interned: list[TrackId] = []
+        if self._id_table is not None:
+            external_ids = self._uninterned(self._id_table, batch.get_track_ids())
+            batch = batch.intern_track_ids(self._id_table)
+            interned = [self._id_table.intern(external_id) for external_id in external_ids]
+        fusion = self._fusible_collection.fuse_batch(batch)
+        self._evict_displaced()
+        if self._deltas is not None:
+            self._record_batch_update(self._deltas, batch, fusion)
+        if self._ttl is not None or self._max_tracks is not None:
+            # a fused track either kept its track_id or took the track_id of the row, see Ping.merge
+            fused = [previous_track_id if self.get(previous_track_id) is not None else ping_id
+                     for previous_track_id, ping_id in zip(fusion.matched_track_ids.tolist(),
+                                                           batch.get_track_ids(fusion.matched_rows))]
+            self._schedule(fused + batch.get_track_ids(fusion.unmatched_rows))
+            self._evicted.extend(self.expire())
+        if self._log is not None:
+            if external_ids:
+                self._log.append_external_ids(interned, external_ids)
+            self._log.append_update_batch(batch, fusion)
+            self._checkpoint_if_due()
+        if self._id_table is not None:
+            self._forget_untracked(self._id_table, batch.get_track_ids() + fusion.matched_track_ids.tolist())
+        return fusion
+
+    def expire(self, now: int | None = None) -> list[Ping]:
+        """
+        Evict the tracks that have outlived the time to live, then the oldest tracks beyond the track cap.
+
+        Updates call this automatically. Call it directly to age tracks out while no pings arrive.
+
+        Parameters:
+            now (int | None): The current time in observation_time units. Defaults to the newest observation_time
+                              seen, and never moves the tracker's clock backwards.
+
+        Returns:
+            list[Ping]: The evicted tracks, oldest first.
+        """
+        if now is not None and (self._clock is None or now > self._clock):
+            self._clock = now
+        if now is not None and self._log is not None:
+            self._log.append_expire(now)
+        evicted: list[Ping] = []
+        while self._expiry_queue:
+            observation_time, _, uid = self._expiry_queue[0]
+            track = self.get(uid)
+            if track is None or track.observation_time != observation_time:
+                # the track has been fused again or removed since this entry was pushed
+                heapq.heappop(self._expiry_queue)
+                continue
+            expired = self._ttl is not None and self._clock is not None and \
+                observation_time < self._clock - self._ttl
+            over_capacity = self._max_tracks is not None and len(self._fusible_collection) > self._max_tracks
+            if not (expired or over_capacity):
+                break
+            heapq.heappop(self._expiry_queue)
+            removed = self._fusible_collection.remove(uid)
+            if self._deltas is not None:
+                self._deltas.append((TRACK_EVICTED, self.external_id(uid)))
+            if removed is not None:
+                evicted.append(self._release(removed))
+        return evicted
+
+    # _evict_displaced: Evict the tracks the collection dropped while fusing to make room for others
+    def _evict_displaced(self):
+        for track in self._fusible_collection.pop_displaced():
+            if self._deltas is not None:
+                self._deltas.append((TRACK_EVICTED, self.external_id(track.track_id)))
+            self._evicted.append(self._release(track))
+
+    def pop_evicted(self) -> list[Ping]:
+        """
+        Return the tracks evicted by updates since the last call, and forget them.
+
+        Returns:
+            list[Ping]: The evicted tracks in eviction order.
+        """
+        evicted, self._evicted = self._evicted, []
+        return evicted
+
+    def pop_deltas(self) -> list[tuple]:
+        """
+        Return the changes recorded since the last call, and forget them.
+
+        Returns:
+            list[tuple]: The change records in the order they happened, see `delta` for their layout.
+
+        Raises:
+            ValueError: If the tracker is not in delta mode.
+        """
+        if self._deltas is None:
+            raise ValueError("The tracker does not record deltas, create it with deltas=True")
+        deltas, self._deltas = self._deltas, []
+        return deltas
+
+    # _record_update: Record the new tracks of an update, then the tracks its matches moved or renamed
+    def _record_update(self, deltas: list[tuple], matched: list[tuple[Ping, Ping]], unmatched: list[Ping]):
+        external = self.external_id
+        for ping in unmatched:
+            deltas.append((TRACK_NEW, external(ping.track_id), ping.callsign, ping.observation_time, ping.latitude,
+                           ping.longitude))
+        for track, ping in matched:
+            # the merged track is named after the earlier of the two and placed at the newer, see Ping.merge
+            earliest = track.get_earliest(ping)
+            track_id = external(earliest.track_id)
+            if earliest.track_id != track.track_id:
+                deltas.append((TRACK_MERGED, external(track.track_id), track_id))
+                if earliest.callsign != track.callsign:
+                    deltas.append((TRACK_CALLSIGN, track_id, earliest.callsign))
+            newest = track.get_newest(ping)
+            deltas.append((TRACK_MOVED, track_id, newest.observation_time, newest.latitude, newest.longitude))
+
+    # _record_batch_update: Record the new tracks of a batch update, then the tracks its matches moved or renamed
+    def _record_batch_update(self, deltas: list[tuple], batch: PingBatch, fusion: BatchFusion):
+        external = self.external_id
+        for row, track_id in zip(fusion.unmatched_rows.tolist(), batch.get_track_ids(fusion.unmatched_rows)):
+            # the stored track may merge several rows, so it is read back rather than rebuilt from the row
+            new_track = self.get(track_id) or batch.ping(row)
+            deltas.append((TRACK_NEW, external(track_id), new_track.callsign, new_track.observation_time,
+                           new_track.latitude, new_track.longitude))
+        previous_track_ids = fusion.matched_track_ids.tolist()
+        # a track can be fused more than once in a batch, and only its last fusion in the batch can have renamed it
+        last_fusions = {track_id: i for i, track_id in enumerate(previous_track_ids)}
+        ping_ids = batch.get_track_ids(fusion.matched_rows)
+        for i, (previous_track_id, ping_id) in enumerate(zip(previous_track_ids, ping_ids)):
+            track = self.get(previous_track_id)
+            if track is None and last_fusions[previous_track_id] == i:
+                # the track took the track_id and callsign of the ping, see Ping.merge
+                deltas.append((TRACK_MERGED, external(previous_track_id), external(ping_id)))
+                track = self.get(ping_id)
+                if track is not None:
+                    deltas.append((TRACK_CALLSIGN, external(ping_id), track.callsign))
+            if track is not None:
+                deltas.append((TRACK_MOVED, external(track.track_id), track.observation_time, track.latitude,
+                               track.longitude))
+
+    # _intern: Return the pings with their string track_ids interned in the id table
+    def _intern(self, id_table: IdTable, pings: list[Ping]) -> list[Ping]:
+        interned: list[Ping] = []
+        for ping in pings:
+            track_id = ping.track_id
+            if isinstance(track_id, str):
+                ping = copy(ping)
+                ping._track_id = id_table.intern(track_id)
+            interned.append(ping)
+        return interned
+
+    # _uninterned: Return the string track_ids not interned in the id table yet, which a logging tracker has to log
+    def _uninterned(self, id_table: IdTable, track_ids: list[TrackId]) -> list[str]:
+        if self._log is None:
+            return []
+        return [track_id for track_id in dict.fromkeys(track_ids)
+                if isinstance(track_id, str) and id_table.find(track_id) is None]
+
+    # _forget_untracked: Drop the ids that no longer name a track from the id table
+    def _forget_untracked(self, id_table: IdTable, track_ids: Iterable[TrackId]):
+        for track_id in track_ids:
+            if isinstance(track_id, int) and self._fusible_collection.get(track_id) is None:
+                id_table.forget(track_id)
+
+    # _release: Return an evicted track under its external track_id, dropping its id from the id table
+    def _release(self, track: Ping) -> Ping:
+        if self._id_table is None or not isinstance(track.track_id, int):
+            return track
+        released = copy(track)
+        released._track_id = self._id_table.external(track.track_id)
+        self._id_table.forget(track.track_id)
+        return released
+
+    # _schedule: Push the current observation time of the tracks with the given uids onto the expiry queue
+    def _schedule(self, uids: list[TrackId]):
+        # a track fused with several pings of an update is pushed once
+        for uid in dict.fromkeys(uids):
+            track = self.get(uid)
+            if track is not None:
+                heapq.heappush(self._expiry_queue, (track.observation_time, self._expiry_sequence, uid))
+                self._expiry_sequence += 1
+                if self._clock is None or track.observation_time > self._clock:
+                    self._clock = track.observation_time
+        if len(self._expiry_queue) > EXPIRY_QUEUE_SLACK * len(self._fusible_collection) + EXPIRY_QUEUE_MINIMUM:
+            self._compact_expiry_queue()
+
+    # _compact_expiry_queue: Drop the entries of tracks that have been fused again or removed, and restore the heap
+    def _compact_expiry_queue(self):
+        # a track pushed several times at the same observation_time keeps its earliest entry
+        current: dict[TrackId, tuple[int, int, TrackId]] = {}
+        for entry in self._expiry_queue:
+            observation_time, _, uid = entry
+            track = self.get(uid)
+            if track is not None and track.observation_time == observation_time:
+                current[uid] = min(entry, current.get(uid, entry))
+        self._expiry_queue = list(current.values())
+        heapq.heapify(self._expiry_queue)
 
-    def set_callsign(self, uid: str, callsign: str):
+    def set_callsign(self, uid: TrackId, callsign: str):
         ping = self.get(uid)
         if ping is not None:
             ping.callsign = callsign
+            if self._log is not None:
+                self._log.append_callsign(ping.track_id, callsign)
+            if self._deltas is not None:
+                self._deltas.append((TRACK_CALLSIGN, self.external_id(ping.track_id), callsign))
 
-    def get(self, uid: str) -> Ping | None:
+    def set_callsigns(self, callsigns: dict[TrackId, str]) -> list[TrackId]:
+        """
+        Assign callsigns to many tracked Pings at once.
+
+        Parameters:
+            callsigns (dict[TrackId, str]): A mapping from track_id to the callsign to assign to it.
+
+        Returns:
+            list[TrackId]: The track_ids that are not tracked and were therefore skipped.
+        """
+        missing: list[TrackId] = []
+        for uid, callsign in callsigns.items():
+            ping = self.get(uid)
+            if ping is not None:
+                ping.callsign = callsign
+                if self._log is not None:
+                    self._log.append_callsign(ping.track_id, callsign)
+                if self._deltas is not None:
+                    self._deltas.append((TRACK_CALLSIGN, self.external_id(ping.track_id), callsign))
+            else:
+                missing.append(uid)
+        return missing
+
+    def get(self, uid: TrackId) -> Ping | None:
+        if self._id_table is not None and isinstance(uid, str):
+            track_id = self._id_table.find(uid)
+            return self._fusible_collection.get(track_id) if track_id is not None else None
         return self._fusible_collection.get(uid)
 
+    # external_id: Return the external track_id of a track_id, as interned in the id table, if any
+    def external_id(self, track_id: TrackId) -> TrackId:
+        if self._id_table is None or not isinstance(track_id, int):
+            return track_id
+        return self._id_table.external(track_id)
+
+    # add_external_ids: Record the external track_ids of track_ids in the id table, if any, such as ones read from a log
+    def add_external_ids(self, track_ids: list[TrackId], external_ids: list[str]):
+        if self._id_table is None:
+            return
+        for track_id, external_id in zip(track_ids, external_ids):
+            if isinstance(track_id, int):
+                self._id_table.add(external_id, track_id)
+
+    def snapshot(self, path: str):
+        """
+        Save every track and the clock of the tracker to a snapshot file, with the external track_ids of the tracks
+        if the tracker has an id table.
+
+        Parameters:
+            path (str): The file to write, replaced atomically if it exists.
+        """
+        tracks = list(self._fusible_collection)
+        external_ids = [str(self.external_id(track.track_id)) for track in tracks] if self._id_table is not None \
+            else None
+        write_snapshot(path, PingBatch.from_pings(tracks), self._clock, external_ids)
+
+    def restore(self, path: str) -> int:
+        """
+        Load the tracks and clock saved by `snapshot` into the tracker, normally right after it was created.
+
+        The snapshot is memory-mapped, but restoring it is not free: every row is materialized as a Ping and
+        inserted into the collection as it is, which rebuilds the collection's uid and spatial indexes in a single
+        pass without any fusion or distance calculation, at a cost linear in the number of tracks. Tracks saved
+        with a velocity are restored with it, so motion prediction carries on where it stopped. Use
+        `read_snapshot` directly to read the stored columns without copying them. With an id table, the external
+        track_ids saved with the tracks are added to it. With a time to live or track cap, the restored tracks are
+        scheduled for expiry, and those already due are evicted.
+
+        Parameters:
+            path (str): The file written by `snapshot`.
+
+        Returns:
+            int: The number of tracks read from the snapshot.
+
+        Raises:
+            ValueError: If the file is not a valid snapshot.
+        """
+        batch, clock = read_snapshot(path)
+        tracks = batch.to_pings()
+        for track in tracks:
+            self._fusible_collection.insert(track)
+        if self._id_table is not None:
+            external_ids = read_external_ids(path)
+            if external_ids is not None:
+                self.add_external_ids([track.track_id for track in tracks], external_ids)
+        if clock is not None and (self._clock is None or clock > self._clock):
+            self._clock = clock
+        if self._ttl is not None or self._max_tracks is not None:
+            self._schedule([track.track_id for track in tracks])
+            self._evicted.extend(self.expire())
+        return len(tracks)
+
+    def recover(self, verify: bool = True) -> int:
+        """
+        Rebuild the state of a newly created tracker from its write-ahead log, see `WriteAheadLog.recover`.
+
+        Parameters:
+            verify (bool): Whether to check that replayed updates make the logged fusion decisions. Defaults to True.
+
+        Returns:
+            int: The number of log records replayed after the newest checkpoint.
+
+        Raises:
+            ValueError: If the tracker has no log, or a replayed update diverges from the log.
+        """
+        if self._log is None:
+            raise ValueError("The tracker has no write-ahead log to recover from")
+        # replayed changes are already in the log
+        log, self._log = self._log, None
+        try:
+            return log.recover(self, verify)
+        finally:
+            self._log = log
+
+    # _checkpoint_if_due: Checkpoint the tracker when its log has grown by a checkpoint interval
+    def _checkpoint_if_due(self):
+        if self._log.checkpoint_due:
+            self._log.checkpoint(self)
+
+    # enable_metrics: Start recording metrics, or return the metrics already being recorded
+    def enable_metrics(self) -> TrackerMetrics:
+        if self.metrics is None:
+            self.metrics = TrackerMetrics()
+            self._uninstrument = self.metrics.instrument(self, self._fusible_collection)
+        return self.metrics
+
+    # disable_metrics: Stop recording metrics and remove the instrumentation
+    def disable_metrics(self):
+        if self._uninstrument is not None:
+            self._uninstrument()
+        self.metrics = None
+        self._uninstrument = None
+
 
 class Geo2dDistanceCalculator(DistanceCalculator2d):
     """
@@ -59,21 +528,82 @@ class Geo2dDistanceCalculator(DistanceCalculator2d):
     distance calculations. The choice of method is determined by comparing the provided threshold
     against predefined constants that represent the applicability ranges of each method.
 
+    With the bounding-box prefilter enabled, `calculate` returns infinity for pairs whose latitude or longitude
+    delta alone proves they are at least the threshold apart, without computing the exact distance. Distances
+    under the threshold are always exact, so comparisons against the threshold are unaffected.
+
     Attributes:
         _threshold (float): The threshold value used to determine the distance calculation method.
+        _prefilter (bool): Whether pairs clearly beyond the threshold are rejected before measuring them.
+        _lat_margin (float): The largest latitude delta in degrees of a pair within the threshold.
+        _local_tangent_plane (bool): Whether the Euclidean regime corrects longitude deltas for converging meridians.
+        _squared_degrees (bool): Whether `compare` works in squared degrees, that is in the flat Euclidean regime.
 
     Args:
         threshold (float): The threshold to use for selecting the distance calculation method.
+        prefilter (bool): Whether to enable the bounding-box prefilter. Defaults to False.
+        local_tangent_plane (bool): Whether to use the local tangent plane variant of the Euclidean regime.
+                                    Defaults to False.
     """
     _threshold: float
+    _prefilter: bool
+    _lat_margin: float
+    _local_tangent_plane: bool
+    _squared_degrees: bool
 
-    def __init__(self, threshold: float):
+    def __init__(self, threshold: float, prefilter: bool = False, local_tangent_plane: bool = False):
         self._threshold = threshold
+        self._prefilter = prefilter
+        self._lat_margin = latitude_margin(threshold)
+        self._local_tangent_plane = local_tangent_plane
+        self._squared_degrees = threshold < constants.EUCLIDEAN_THRESHOLD and not local_tangent_plane
 
     def calculate(self, p1: Point2d, p2: Point2d) -> float:
+        if self._prefilter and self.is_clearly_beyond(p1, p2):
+            return math.inf
         if self._threshold < constants.EUCLIDEAN_THRESHOLD:
+            if self._local_tangent_plane:
+                return local_tangent_plane_distance(p1, p2)
             return euclidean_distance(p1, p2)
         elif self._threshold < constants.GREAT_CIRCLE_THRESHOLD:
             return great_circle_distance(p1, p2)
         else:
             return geodesic_distance(p1, p2)
+
+    # is_clearly_beyond: Check from the coordinate deltas alone whether two points are at least the threshold apart
+    def is_clearly_beyond(self, p1: Point2d, p2: Point2d) -> bool:
+        if abs(p1[0] - p2[0]) > self._lat_margin:
+            return True
+        lon_delta = abs(p1[1] - p2[1]) % 360.0
+        lon_delta = min(lon_delta, 360.0 - lon_delta)
+        # the longitude margin is never narrower than the latitude margin, so only widen it when it matters
+        if lon_delta <= self._lat_margin:
+            return False
+        return lon_delta > longitude_margin(self._lat_margin, max(abs(p1[0]), abs(p2[0])))
+
+    # compare: Return the squared distance in degrees in the Euclidean regime and the distance otherwise
+    def compare(self, p1: Point2d, p2: Point2d) -> float:
+        if self._squared_degrees:
+            # euclidean_squared_degrees inlined, as this runs once per stored track in the nearest neighbor scan
+            lat_delta = p1[0] - p2[0]
+            lon_delta = p1[1] - p2[1]
+            return lat_delta * lat_delta + lon_delta * lon_delta
+        if self._threshold < constants.EUCLIDEAN_THRESHOLD:
+            return local_tangent_plane_squared_degrees(p1, p2)
+        return self.calculate(p1, p2)
+
+    # compare_threshold: Convert a threshold in meters to the scale of compare
+    def compare_threshold(self, threshold: float) -> float:
+        if self._threshold < constants.EUCLIDEAN_THRESHOLD:
+            return (threshold / constants.DEGREES_TO_METERS) ** 2
+        return threshold
+
+    def calculate_many(self, p1: Point2d, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        if self._threshold < constants.EUCLIDEAN_THRESHOLD:
+            if self._local_tangent_plane:
+                return local_tangent_plane_distances(p1, latitudes, longitudes)
+            return euclidean_distances(p1, latitudes, longitudes)
+        elif self._threshold < constants.GREAT_CIRCLE_THRESHOLD:
+            return great_circle_distances(p1, latitudes, longitudes)
+        else:
+            return geodesic_distances(p1, latitudes, longitudes)
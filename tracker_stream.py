@@ -0,0 +1,152 @@
+# tracker_stream: Asyncio front end that micro-batches a stream of pings into TrackerBase updates
+import asyncio
+from collections.abc import AsyncIterable, AsyncIterator
+from concurrent.futures import Executor
+
+from ping import Ping
+from tracker_base import TrackerBase
+
+
+class _EndOfStream:
+    """
+    Queue marker for the end of the source, carrying the exception the source raised, if any.
+    """
+    error: BaseException | None
+
+    def __init__(self, error: BaseException | None = None):
+        self.error = error
+
+
+class TrackerStream:
+    """
+    Streaming front end for a TrackerBase.
+
+    A TrackerStream reads pings, or whole frames of pings, from an async iterator and groups them into micro-batches.
+    A batch is closed as soon as it holds `max_batch_size` pings or `max_delay` seconds after its first ping
+    arrived, whichever comes first, and is then fused through `TrackerBase.update`. The (matched, unmatched) result
+    of every batch is yielded as an async stream. Frames are never split across batches.
+
+    The source is read by a separate task into a queue of at most `max_pending` frames. When the queue is full the
+    reader either waits, which holds the source back, or discards the oldest queued frame to bound latency, counting
+    the discarded pings in `dropped`.
+
+    Attributes:
+        tracker (TrackerBase): The tracker fed by the stream.
+        dropped (int): The number of pings discarded because the queue was full.
+        _max_batch_size (int): The number of pings that closes a batch.
+        _max_delay (float): The number of seconds after its first ping that closes a batch.
+        _max_pending (int): The number of frames the queue holds.
+        _drop_oldest (bool): Whether a full queue discards its oldest frame instead of holding the source back.
+        _executor (Executor | None): The executor updates run in, or None to run them on the event loop.
+
+    Methods:
+        __init__: Initializes a new TrackerStream around a tracker.
+        stream: Fuses the pings of an async source and yields the result of every batch.
+    """
+    tracker: TrackerBase
+    dropped: int
+    _max_batch_size: int
+    _max_delay: float
+    _max_pending: int
+    _drop_oldest: bool
+    _executor: Executor | None
+
+    def __init__(self, tracker: TrackerBase, max_batch_size: int = 1000, max_delay: float = 0.05,
+                 max_pending: int = 16, drop_oldest: bool = False, executor: Executor | None = None):
+        """
+        Initializes a new TrackerStream.
+
+        Parameters:
+            tracker (TrackerBase): The tracker to feed.
+            max_batch_size (int): The number of pings that closes a batch. Defaults to 1000.
+            max_delay (float): The number of seconds after its first ping that closes a batch. Defaults to 0.05.
+            max_pending (int): The number of frames queued ahead of the tracker. Defaults to 16.
+            drop_oldest (bool): Whether a full queue discards its oldest frame instead of holding the source back.
+                                Defaults to False.
+            executor (Executor | None): An executor to run updates in, so the event loop keeps reading the source
+                                        during a long update. Only one update runs at a time. Defaults to None.
+
+        Raises:
+            ValueError: If max_batch_size or max_pending is not positive, or max_delay is negative.
+        """
+        if max_batch_size <= 0:
+            raise ValueError(f"max_batch_size must be positive, got {max_batch_size}")
+        if max_pending <= 0:
+            raise ValueError(f"max_pending must be positive, got {max_pending}")
+        if max_delay < 0:
+            raise ValueError(f"max_delay must not be negative, got {max_delay}")
+        self.tracker = tracker
+        self.dropped = 0
+        self._max_batch_size = max_batch_size
+        self._max_delay = max_delay
+        self._max_pending = max_pending
+        self._drop_oldest = drop_oldest
+        self._executor = executor
+
+    async def stream(self, source: AsyncIterable[Ping | list[Ping]]) \
+            -> AsyncIterator[tuple[list[tuple[Ping, Ping]], list[Ping]]]:
+        """
+        Fuse the pings of an async source in micro-batches.
+
+        Parameters:
+            source (AsyncIterable[Ping | list[Ping]]): The pings to fuse, one at a time or a frame at a time.
+
+        Returns:
+            AsyncIterator: The (matched, unmatched) result of `TrackerBase.update` for every batch, in order.
+
+        Raises:
+            Exception: Any exception raised by the source, once the pings read before it have been fused.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._max_pending)
+        reader = asyncio.create_task(self._read(source, queue))
+        try:
+            finished = False
+            while not finished:
+                batch, finished = await self._collect(queue)
+                if batch:
+                    yield await self._update(batch)
+        finally:
+            reader.cancel()
+
+    # _read: Move the frames of the source into the queue, applying the backpressure policy
+    async def _read(self, source: AsyncIterable[Ping | list[Ping]], queue: asyncio.Queue):
+        try:
+            async for item in source:
+                frame = [item] if isinstance(item, Ping) else list(item)
+                if self._drop_oldest and queue.full():
+                    self.dropped += len(queue.get_nowait())
+                await queue.put(frame)
+        except Exception as error:
+            await queue.put(_EndOfStream(error))
+        else:
+            await queue.put(_EndOfStream())
+
+    # _collect: Gather frames from the queue until the batch is full, its delay has passed or the source has ended
+    async def _collect(self, queue: asyncio.Queue) -> tuple[list[Ping], bool]:
+        batch: list[Ping] = []
+        loop = asyncio.get_running_loop()
+        item = await queue.get()
+        deadline = loop.time() + self._max_delay
+        while True:
+            if isinstance(item, _EndOfStream):
+                if item.error is not None:
+                    if batch:
+                        # fuse what arrived before the failure, the error is raised on the next call
+                        queue.put_nowait(item)
+                        return batch, False
+                    raise item.error
+                return batch, True
+            batch.extend(item)
+            remaining = deadline - loop.time()
+            if len(batch) >= self._max_batch_size or remaining <= 0:
+                return batch, False
+            try:
+                item = await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return batch, False
+
+    # _update: Fuse a batch, in the executor if there is one
+    async def _update(self, batch: list[Ping]) -> tuple[list[tuple[Ping, Ping]], list[Ping]]:
+        if self._executor is None:
+            return self.tracker.update(batch)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.tracker.update, batch)
@@ -0,0 +1,388 @@
+# wal: Write-ahead log of tracker updates with batched fsync and snapshot checkpoints
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from abstract import TrackId
+from ids import id_kind, ID_STRINGS, ID_INT64, ID_MIXED
+from ping import Ping
+from ping_batch import PingBatch, BatchFusion
+
+# Record kinds
+UPDATE = 1
+UPDATE_BATCH = 2
+CALLSIGN = 3
+EXPIRE = 4
+EXTERNAL_IDS = 5
+# payload length, crc32 of the sequence number, kind and payload, sequence number, kind
+_RECORD = struct.Struct("<IIQB")
+_SEQUENCE_AND_KIND = struct.Struct("<QB")
+_COUNTS = struct.Struct("<III")
+_TIME = struct.Struct("<q")
+_LENGTH = struct.Struct("<I")
+_ID_KIND = struct.Struct("<B")
+SEGMENT_PREFIX = "log-"
+SEGMENT_SUFFIX = ".wal"
+CHECKPOINT_PREFIX = "checkpoint-"
+CHECKPOINT_SUFFIX = ".snap"
+
+
+class WriteAheadLog:
+    """
+    Append-only log of the updates of a tracker, kept in a directory of log segments and checkpoints.
+
+    Every update is appended as one record holding its input pings and its fusion decisions (which stored track
+    each ping was fused with, and which pings became new tracks), together with callsign assignments and explicit
+    expiry calls, which also change tracker state. The pings are logged under the track_ids the tracker keys on, so
+    the external track_ids an IdTable interns for an update are appended in a record of their own before it. Records carry a sequence number and a CRC, so recovery stops
+    cleanly at a record torn by a crash.
+
+    Records are handed to the operating system as they are appended, which survives a crash of the process, and
+    are synced to disk at most every `sync_interval` seconds, which bounds what a power loss can take while
+    spreading the cost of fsync over many updates.
+
+    A checkpoint is a snapshot of the tracker (see `TrackerBase.snapshot`) named after the sequence number of the
+    last record it contains. Taking one starts a new log segment and deletes the older segments and checkpoints, so
+    recovery restores the newest checkpoint and replays only the log written since. Replaying an update runs it
+    through the tracker again, which reproduces the same state because fusion is deterministic, and the logged
+    decisions are compared against the replayed ones to detect a log that does not belong to the tracker.
+
+    Attributes:
+        directory (str): The directory holding the segments and checkpoints.
+        sequence (int): The sequence number of the last record, 0 for an empty log.
+        checkpoint_sequence (int): The sequence number covered by the newest checkpoint, 0 if there is none.
+        _sync_interval (float): The longest time in seconds appended records may stay unsynced.
+        _checkpoint_interval (int | None): The number of records after which a checkpoint is due.
+        _segment: The file object of the segment being appended to.
+        _last_sync (float): The monotonic time of the last fsync.
+        _unsynced (bool): Whether records have been appended since the last fsync.
+
+    Methods:
+        __init__: Opens the log in a directory, starting a new segment after the existing records.
+        checkpoint_due: Property telling whether a checkpoint interval has passed since the last checkpoint.
+        append_update: Appends the inputs and results of TrackerBase.update.
+        append_update_batch: Appends the inputs and results of TrackerBase.update_batch.
+        append_callsign: Appends a callsign assignment.
+        append_external_ids: Appends the external track_ids interned for an update.
+        append_expire: Appends an explicit expiry call.
+        sync: Syncs appended records to disk.
+        checkpoint: Snapshots a tracker and drops the log it makes redundant.
+        recover: Restores the newest checkpoint into a tracker and replays the log written after it.
+        close: Syncs and closes the log.
+    """
+    directory: str
+    sequence: int
+    checkpoint_sequence: int
+    _sync_interval: float
+    _checkpoint_interval: int | None
+    _last_sync: float
+    _unsynced: bool
+
+    def __init__(self, directory: str, sync_interval: float = 0.1, checkpoint_interval: int | None = None):
+        """
+        Opens a write-ahead log.
+
+        Parameters:
+            directory (str): The directory of the log, created if it does not exist.
+            sync_interval (float): The longest time in seconds appended records may stay unsynced, 0 to sync every
+                                   record. Defaults to 0.1.
+            checkpoint_interval (int | None): The number of records after which `checkpoint_due` turns True, or None
+                                              to only checkpoint on request. Defaults to None.
+
+        Raises:
+            ValueError: If sync_interval is negative or checkpoint_interval is not positive.
+        """
+        if sync_interval < 0:
+            raise ValueError(f"sync_interval must not be negative, got {sync_interval}")
+        if checkpoint_interval is not None and checkpoint_interval <= 0:
+            raise ValueError(f"checkpoint_interval must be positive, got {checkpoint_interval}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._sync_interval = sync_interval
+        self._checkpoint_interval = checkpoint_interval
+        checkpoints = _numbered_files(directory, CHECKPOINT_PREFIX, CHECKPOINT_SUFFIX)
+        self.checkpoint_sequence = checkpoints[-1][0] if checkpoints else 0
+        self.sequence = self.checkpoint_sequence
+        for _, path in _numbered_files(directory, SEGMENT_PREFIX, SEGMENT_SUFFIX):
+            for sequence, _, _ in _read_records(path):
+                self.sequence = max(self.sequence, sequence)
+        # appending never resumes an old segment, whose tail may be torn
+        self._segment = open(self._segment_path(self.sequence + 1), "ab")
+        self._last_sync = time.monotonic()
+        self._unsynced = False
+
+    # checkpoint_due: Whether checkpoint_interval records have been appended since the last checkpoint
+    @property
+    def checkpoint_due(self) -> bool:
+        return self._checkpoint_interval is not None and \
+            self.sequence - self.checkpoint_sequence >= self._checkpoint_interval
+
+    # append_update: Append the input pings of an update and the stored track each one was fused with
+    def append_update(self, inputs: list[Ping], matched: list[tuple[Ping, Ping]], unmatched: list[Ping]) -> int:
+        payload = _encode_update([ping.start_time for ping in inputs], [ping.observation_time for ping in inputs],
+                                 [ping.latitude for ping in inputs], [ping.longitude for ping in inputs],
+                                 [ping.track_id for ping in inputs], [ping.callsign for ping in inputs],
+                                 [track.track_id for track, _ in matched], [ping.track_id for _, ping in matched],
+                                 [ping.track_id for ping in unmatched])
+        return self._append(UPDATE, payload)
+
+    # append_update_batch: Append the rows of a batch update and the stored track each row was fused with
+    def append_update_batch(self, batch: PingBatch, fusion: BatchFusion) -> int:
+        payload = _encode_update(batch.start_times, batch.observation_times, batch.latitudes, batch.longitudes,
+                                 batch.get_track_ids(), batch.get_callsigns(), fusion.matched_track_ids.tolist(),
+                                 batch.get_track_ids(fusion.matched_rows), batch.get_track_ids(fusion.unmatched_rows))
+        return self._append(UPDATE_BATCH, payload)
+
+    # append_callsign: Append the assignment of a callsign to a track
+    def append_callsign(self, uid: TrackId, callsign: str) -> int:
+        return self._append(CALLSIGN, _encode_ids([uid]) + _encode_strings([callsign]))
+
+    # append_external_ids: Append the external track_ids an IdTable interned for the track_ids of the next update
+    def append_external_ids(self, track_ids: list[TrackId], external_ids: list[str]) -> int:
+        return self._append(EXTERNAL_IDS, _LENGTH.pack(len(track_ids)) + _encode_ids(track_ids) +
+                            _encode_strings(external_ids))
+
+    # append_expire: Append an explicit expiry call and the time it was given
+    def append_expire(self, now: int) -> int:
+        return self._append(EXPIRE, _TIME.pack(now))
+
+    # sync: Force the appended records to disk
+    def sync(self):
+        if not self._unsynced:
+            return
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+        self._last_sync = time.monotonic()
+        self._unsynced = False
+
+    def checkpoint(self, tracker) -> str:
+        """
+        Snapshot a tracker and delete the log segments and checkpoints the snapshot makes redundant.
+
+        Parameters:
+            tracker (TrackerBase): The tracker whose updates are logged here.
+
+        Returns:
+            str: The path of the new checkpoint.
+        """
+        self.sync()
+        path = self._checkpoint_path(self.sequence)
+        tracker.snapshot(path)
+        self._segment.close()
+        self._segment = open(self._segment_path(self.sequence + 1), "ab")
+        for sequence, old_path in _numbered_files(self.directory, CHECKPOINT_PREFIX, CHECKPOINT_SUFFIX):
+            if sequence < self.sequence:
+                os.remove(old_path)
+        for sequence, old_path in _numbered_files(self.directory, SEGMENT_PREFIX, SEGMENT_SUFFIX):
+            if sequence <= self.sequence:
+                os.remove(old_path)
+        self.checkpoint_sequence = self.sequence
+        return path
+
+    def recover(self, tracker, verify: bool = True) -> int:
+        """
+        Rebuild the state of a tracker from the newest checkpoint and the log written after it.
+
+        The tracker should be newly created with the settings of the tracker that wrote the log, and must not log
+        to this log while it recovers.
+
+        Parameters:
+            tracker (TrackerBase): The tracker to rebuild.
+            verify (bool): Whether to check that replayed updates make the logged fusion decisions. Defaults to True.
+
+        Returns:
+            int: The number of records replayed.
+
+        Raises:
+            ValueError: If verify is set and a replayed update makes different fusion decisions than were logged.
+        """
+        if self.checkpoint_sequence:
+            tracker.restore(self._checkpoint_path(self.checkpoint_sequence))
+        replayed = 0
+        for _, path in _numbered_files(self.directory, SEGMENT_PREFIX, SEGMENT_SUFFIX):
+            for sequence, kind, payload in _read_records(path):
+                if sequence <= self.checkpoint_sequence:
+                    continue
+                _replay(tracker, sequence, kind, payload, verify)
+                replayed += 1
+        return replayed
+
+    def close(self):
+        if not self._segment.closed:
+            self.sync()
+            self._segment.close()
+
+    def __enter__(self) -> 'WriteAheadLog':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # _append: Append a record, handing it to the operating system and syncing it once the sync interval has passed
+    def _append(self, kind: int, payload: bytes) -> int:
+        self.sequence += 1
+        header = _SEQUENCE_AND_KIND.pack(self.sequence, kind)
+        crc = zlib.crc32(payload, zlib.crc32(header))
+        self._segment.write(_RECORD.pack(len(payload), crc, self.sequence, kind))
+        self._segment.write(payload)
+        self._unsynced = True
+        if time.monotonic() - self._last_sync >= self._sync_interval:
+            self.sync()
+        else:
+            self._segment.flush()
+        return self.sequence
+
+    def _segment_path(self, first_sequence: int) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{first_sequence:020d}{SEGMENT_SUFFIX}")
+
+    def _checkpoint_path(self, sequence: int) -> str:
+        return os.path.join(self.directory, f"{CHECKPOINT_PREFIX}{sequence:020d}{CHECKPOINT_SUFFIX}")
+
+
+# _numbered_files: List the files of a directory named prefix, number, suffix, as (number, path) sorted by number
+def _numbered_files(directory: str, prefix: str, suffix: str) -> list[tuple[int, str]]:
+    files: list[tuple[int, str]] = []
+    for name in os.listdir(directory):
+        number = name[len(prefix):-len(suffix)]
+        if name.startswith(prefix) and name.endswith(suffix) and number.isdigit():
+            files.append((int(number), os.path.join(directory, name)))
+    return sorted(files)
+
+
+# _read_records: Read the (sequence, kind, payload) records of a segment, stopping at the first torn or corrupt one
+def _read_records(path: str) -> list[tuple[int, int, bytes]]:
+    with open(path, "rb") as segment:
+        data = segment.read()
+    records: list[tuple[int, int, bytes]] = []
+    position = 0
+    while position + _RECORD.size <= len(data):
+        length, crc, sequence, kind = _RECORD.unpack_from(data, position)
+        start = position + _RECORD.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload, zlib.crc32(_SEQUENCE_AND_KIND.pack(sequence, kind))) != crc:
+            break
+        records.append((sequence, kind, payload))
+        position = start + length
+    return records
+
+
+# _replay: Apply a logged record to a tracker
+def _replay(tracker, sequence: int, kind: int, payload: bytes, verify: bool):
+    if kind == CALLSIGN:
+        (uid,), position = _decode_ids(payload, 0, 1)
+        (callsign,), _ = _decode_strings(payload, position, 1)
+        tracker.set_callsign(uid, callsign)
+        return
+    if kind == EXPIRE:
+        tracker.expire(_TIME.unpack(payload)[0])
+        return
+    if kind == EXTERNAL_IDS:
+        (count,) = _LENGTH.unpack_from(payload)
+        track_ids, position = _decode_ids(payload, _LENGTH.size, count)
+        external_ids, _ = _decode_strings(payload, position, count)
+        tracker.add_external_ids(track_ids, external_ids)
+        return
+    batch, decisions = _decode_update(payload)
+    if kind == UPDATE:
+        matched, unmatched = tracker.update(batch.to_pings())
+        replayed = ([track.track_id for track, _ in matched], [ping.track_id for _, ping in matched],
+                    [ping.track_id for ping in unmatched])
+    else:
+        fusion = tracker.update_batch(batch)
+        replayed = (fusion.matched_track_ids.tolist(), batch.get_track_ids(fusion.matched_rows),
+                    batch.get_track_ids(fusion.unmatched_rows))
+    if verify and replayed != decisions:
+        raise ValueError(f"Replaying log record {sequence} made different fusion decisions than were logged")
+
+
+# _encode_update: Encode the columns of the input pings followed by the fusion decisions
+def _encode_update(start_times, observation_times, latitudes, longitudes, track_ids: list[TrackId],
+                   callsigns: list[str], matched_track_ids: list[TrackId], matched_ping_ids: list[TrackId],
+                   unmatched_ids: list[TrackId]) -> bytes:
+    return b"".join((_COUNTS.pack(len(track_ids), len(matched_ping_ids), len(unmatched_ids)),
+                     np.asarray(start_times, dtype="<i8").tobytes(),
+                     np.asarray(observation_times, dtype="<i8").tobytes(),
+                     np.asarray(latitudes, dtype="<f8").tobytes(), np.asarray(longitudes, dtype="<f8").tobytes(),
+                     _encode_ids(track_ids), _encode_strings(callsigns), _encode_ids(matched_track_ids),
+                     _encode_ids(matched_ping_ids), _encode_ids(unmatched_ids)))
+
+
+# _decode_update: Decode the input pings and the fusion decisions of an update record
+def _decode_update(payload: bytes) -> tuple[PingBatch, tuple[list[TrackId], list[TrackId], list[TrackId]]]:
+    count, matched_count, unmatched_count = _COUNTS.unpack_from(payload)
+    position = _COUNTS.size
+    columns: list[np.ndarray] = []
+    for dtype in ("<i8", "<i8", "<f8", "<f8"):
+        columns.append(np.frombuffer(payload, dtype=dtype, count=count, offset=position))
+        position += 8 * count
+    track_ids, position = _decode_ids(payload, position, count)
+    callsigns, position = _decode_strings(payload, position, count)
+    matched_track_ids, position = _decode_ids(payload, position, matched_count)
+    matched_ping_ids, position = _decode_ids(payload, position, matched_count)
+    unmatched_ids, position = _decode_ids(payload, position, unmatched_count)
+    batch = PingBatch(np.array(track_ids, dtype=object), np.array(callsigns, dtype=object), *columns)
+    return batch, (matched_track_ids, matched_ping_ids, unmatched_ids)
+
+
+# _encode_strings: Encode strings as the byte length of their concatenation, their lengths in characters and their
+# concatenation in UTF-8, which encodes the whole list in a single call
+def _encode_strings(values: list[str]) -> bytes:
+    text = "".join(values).encode()
+    lengths: np.ndarray = np.fromiter(map(len, values), dtype="<u4", count=len(values))
+    return _LENGTH.pack(len(text)) + lengths.tobytes() + text
+
+
+# _decode_strings: Decode `count` strings encoded by _encode_strings at a position, returning them and the end position
+def _decode_strings(payload: bytes, position: int, count: int) -> tuple[list[str], int]:
+    (size,) = _LENGTH.unpack_from(payload, position)
+    position += _LENGTH.size
+    column: np.ndarray = np.frombuffer(payload, dtype="<u4", count=count, offset=position)
+    lengths = column.tolist()
+    position += 4 * count
+    text = payload[position:position + size].decode()
+    values: list[str] = []
+    start = 0
+    for length in lengths:
+        values.append(text[start:start + length])
+        start += length
+    return values, position + size
+
+
+# _encode_ids: Encode track_ids as a kind byte followed by strings encoded by _encode_strings, int64 values, 16 byte
+# little-endian integers, or for a mix of strings and integers a byte per id flagging the integers followed by the
+# strings and decimal integers encoded by _encode_strings
+def _encode_ids(track_ids: list[TrackId]) -> bytes:
+    kind = id_kind(track_ids)
+    if kind == ID_STRINGS:
+        encoded = _encode_strings([str(track_id) for track_id in track_ids])
+    elif kind == ID_MIXED:
+        integers: np.ndarray = np.fromiter((isinstance(track_id, int) for track_id in track_ids), dtype="u1",
+                                           count=len(track_ids))
+        encoded = integers.tobytes() + _encode_strings([str(track_id) for track_id in track_ids])
+    elif kind == ID_INT64:
+        column: np.ndarray = np.array(track_ids, dtype="<i8")
+        encoded = column.tobytes()
+    else:
+        encoded = b"".join(int(track_id).to_bytes(16, "little") for track_id in track_ids)
+    return _ID_KIND.pack(kind) + encoded
+
+
+# _decode_ids: Decode `count` track_ids encoded by _encode_ids at a position, returning them and the end position
+def _decode_ids(payload: bytes, position: int, count: int) -> tuple[list[TrackId], int]:
+    (kind,) = _ID_KIND.unpack_from(payload, position)
+    position += _ID_KIND.size
+    if kind == ID_STRINGS:
+        strings, end = _decode_strings(payload, position, count)
+        return list(strings), end
+    if kind == ID_MIXED:
+        integers = payload[position:position + count]
+        strings, end = _decode_strings(payload, position + count, count)
+        return [int(value) if integer else value for integer, value in zip(integers, strings)], end
+    if kind == ID_INT64:
+        column: np.ndarray = np.frombuffer(payload, dtype="<i8", count=count, offset=position)
+        return column.tolist(), position + 8 * count
+    end = position + 16 * count
+    return [int.from_bytes(payload[start:start + 16], "little") for start in range(position, end, 16)], end